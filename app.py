@@ -1,20 +1,41 @@
 import os
 from flask import Flask, jsonify, send_from_directory, render_template, redirect, url_for, request, session, flash
 from flask_jwt_extended import JWTManager
-from models import db, User, Plugin
+from markupsafe import Markup
+from sqlalchemy.orm import defer, load_only
+from models import db, User, Plugin, PluginVersion
+from utils.package_index import package_index
+from utils.cache import response_cache, has_flashed_messages
+from utils.installed_store import installed_plugins
+from utils.counters import download_counter
+from utils.metrics import request_metrics
+from utils.auth import user_cache, verify_password, hash_password
+from utils.ratelimit import rate_limiter
+from utils.package_delivery import is_initial_request, send_plugin_package
+from utils.uploads import UploadError, UploadRequest, save_package_upload
+from utils.schema import upgrade_schema
+from utils.blob_store import blob_lock, release_package
+from utils.search import init_search_index
+from utils.icons import store_icon, release_icon, rendition_path, DEFAULT_ICON_SIZE
+from utils.jobs import job_queue, jobs_cli
+from utils.package_scan import enqueue_scan
+from utils.versions import release_versions
+from utils.facets import rebuild_category_facets
+from utils.changes import reconcile_change_log
+from utils.catalog_io import catalog_cli
 from routes.auth import auth_bp
 from routes.plugins import plugins_bp, review_plugin
 from routes.server import server_bp
+from routes.admin import admin_bp
 from dotenv import load_dotenv
 from flask_cors import CORS
-from werkzeug.security import check_password_hash
-from werkzeug.utils import secure_filename
-import uuid
 
 # 加载环境变量
 load_dotenv()
 
 app = Flask(__name__, static_folder='static')
+# 上传文件边接收边计算校验和，直接写入 uploads/temp
+app.request_class = UploadRequest
 CORS(app)
 
 # 配置应用
@@ -22,6 +43,39 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///edg
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev_key')
 app.config['DATA_DIR'] = os.getenv('DATA_DIR', 'data')
+app.config['PLUGINS_PAGE_SIZE'] = int(os.getenv('PLUGINS_PAGE_SIZE', 100))
+app.config['PLUGINS_MAX_PAGE_SIZE'] = int(os.getenv('PLUGINS_MAX_PAGE_SIZE', 500))
+app.config['DOWNLOAD_FLUSH_INTERVAL'] = float(os.getenv('DOWNLOAD_FLUSH_INTERVAL', 5))
+# 首页、插件详情页、插件列表和分类统计缓存的最长秒数，插件变更时立即失效，下载量最多延迟这么久显示
+app.config['PAGE_CACHE_SECONDS'] = float(os.getenv('PAGE_CACHE_SECONDS', 30))
+app.config['MAX_PACKAGE_SIZE'] = int(os.getenv('MAX_PACKAGE_SIZE', 200 * 1024 * 1024))
+# PBKDF2 迭代次数，修改后用户下次登录时自动按新的工作量重新计算密码哈希
+app.config['PASSWORD_HASH_ITERATIONS'] = int(os.getenv('PASSWORD_HASH_ITERATIONS', 260000))
+app.config['USER_CACHE_TTL'] = float(os.getenv('USER_CACHE_TTL', 60))
+# 限速规则格式为 次数/时间单位(second、minute、hour、day)，留空表示不限速
+app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+app.config['RATELIMIT_BACKEND'] = os.getenv('RATELIMIT_BACKEND', 'memory')  # memory 或 sqlite
+app.config['RATELIMIT_STORAGE_PATH'] = os.getenv('RATELIMIT_STORAGE_PATH')
+app.config['RATELIMIT_DOWNLOAD'] = os.getenv('RATELIMIT_DOWNLOAD', '60/minute')
+app.config['RATELIMIT_LOGIN'] = os.getenv('RATELIMIT_LOGIN', '10/minute')
+app.config['DOWNLOAD_MAX_CONCURRENCY'] = int(os.getenv('DOWNLOAD_MAX_CONCURRENCY', 32))
+app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# 处理时间超过该秒数的请求记录采样调用栈，0 表示不启用采样分析
+app.config['PROFILE_SLOW_REQUEST_SECONDS'] = float(os.getenv('PROFILE_SLOW_REQUEST_SECONDS', 0))
+app.config['PROFILE_SAMPLE_INTERVAL'] = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))
+app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR')
+# 后台任务(插件包检查、图标变体生成)的工作线程数，0 表示由单独的进程执行 flask jobs run
+app.config['JOBS_WORKERS'] = int(os.getenv('JOBS_WORKERS', 2))
+# 为true时在请求中同步执行后台任务(用于测试)
+app.config['JOBS_EAGER'] = os.getenv('JOBS_EAGER', 'false').lower() in ('1', 'true', 'yes')
+app.config['JOBS_POLL_INTERVAL'] = float(os.getenv('JOBS_POLL_INTERVAL', 5))
+app.config['JOBS_MAX_ATTEMPTS'] = int(os.getenv('JOBS_MAX_ATTEMPTS', 3))
+app.config['JOBS_RETRY_DELAY'] = float(os.getenv('JOBS_RETRY_DELAY', 30))
+# 插件包检查: 解压后总大小和压缩比超过限制时判定为不通过，不再校验内容
+app.config['SCAN_MAX_UNCOMPRESSED_SIZE'] = int(os.getenv('SCAN_MAX_UNCOMPRESSED_SIZE', 2 * 1024 * 1024 * 1024))
+app.config['SCAN_MAX_COMPRESSION_RATIO'] = float(os.getenv('SCAN_MAX_COMPRESSION_RATIO', 100))
+# 每个插件保留的旧版本数，边缘设备可以从这些版本通过差异包升级到当前版本
+app.config['PLUGIN_VERSION_HISTORY'] = int(os.getenv('PLUGIN_VERSION_HISTORY', 5))
 
 # 确保uploads目录是绝对路径，避免创建空的uploads目录
 web_dir = os.path.dirname(os.path.abspath(__file__))
@@ -57,14 +111,36 @@ def internal_server_error(e):
         "status": 500
     }), 500
 
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    return jsonify({
+        "error": "上传文件过大",
+        "message": str(e),
+        "status": 413
+    }), 413
+
 # 初始化扩展
 db.init_app(app)
 jwt = JWTManager(app)
+user_cache.init_app(app)
+package_index.init_app(app)
+response_cache.init_app(app)
+installed_plugins.init_app(app)
+download_counter.init_app(app)
+request_metrics.init_app(app)
+rate_limiter.init_app(app)
+job_queue.init_app(app)
 
 # 注册蓝图
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(plugins_bp, url_prefix='/api/plugins')
 app.register_blueprint(server_bp, url_prefix='/api/server')
+app.register_blueprint(admin_bp, url_prefix='/api/admin')
+
+# 命令行: flask catalog export / flask catalog import
+app.cli.add_command(catalog_cli)
+# 命令行: flask jobs run / scan / retry / status
+app.cli.add_command(jobs_cli)
 
 # 静态文件服务
 @app.route('/static/<path:filename>')
@@ -77,9 +153,18 @@ def serve_upload(filename):
 
 # 首页
 @app.route('/')
+@response_cache.cached(ttl_key='PAGE_CACHE_SECONDS', bypass=has_flashed_messages)
 def home():
-    plugins = Plugin.query.filter_by(status='approved').all()
-    return render_template('client/index.html', plugins=plugins)
+    # 有提示消息时整页不缓存，插件列表片段仍然从缓存读取
+    plugins_grid = response_cache.fragment('home_plugins_grid', render_plugins_grid, ttl_key='PAGE_CACHE_SECONDS')
+    return render_template('client/index.html', plugins_grid=Markup(plugins_grid))
+
+def render_plugins_grid():
+    # 列表页只加载模板用到的列，不加载完整描述
+    plugins = Plugin.query.filter_by(status='approved').options(
+        load_only(Plugin.id, Plugin.name, Plugin.short_description, Plugin.category,
+                  Plugin.downloads, Plugin.icon_path, Plugin.icon_hash)).all()
+    return render_template('client/_plugins_grid.html', plugins=plugins)
 
 # 旧的API首页路由
 @app.route('/api')
@@ -96,6 +181,7 @@ def admin_redirect():
     return redirect(url_for('admin_login'))
 
 @app.route('/admin/login', methods=['GET', 'POST'])
+@rate_limiter.limit('RATELIMIT_LOGIN', key='ip', methods=('POST',))
 def admin_login():
     error = None
     if request.method == 'POST':
@@ -104,7 +190,7 @@ def admin_login():
         
         user = User.query.filter_by(username=username).first()
         
-        if user and check_password_hash(user.password_hash, password) and user.is_admin:
+        if user and user.is_admin and verify_password(user, password):
             session['admin_id'] = user.id
             session['admin_username'] = user.username
             return redirect(url_for('admin_dashboard'))
@@ -131,7 +217,7 @@ def admin_required(f):
 @app.route('/admin/dashboard')
 @admin_required
 def admin_dashboard():
-    plugins = Plugin.query.all()
+    plugins = Plugin.query.options(defer(Plugin.description), defer(Plugin.scan_result)).all()
     return render_template('admin/dashboard.html', 
                           plugins=plugins, 
                           admin_username=session.get('admin_username'))
@@ -139,7 +225,7 @@ def admin_dashboard():
 @app.route('/admin/plugins')
 @admin_required
 def admin_plugins():
-    plugins = Plugin.query.all()
+    plugins = Plugin.query.options(defer(Plugin.description), defer(Plugin.scan_result)).all()
     return render_template('admin/plugins.html', 
                           plugins=plugins, 
                           admin_username=session.get('admin_username'))
@@ -160,51 +246,60 @@ def admin_upload_plugin():
             flash('请填写所有必填字段', 'error')
             return redirect(url_for('admin_upload_plugin'))
         
-        # 处理图标上传
-        icon_path = None
-        if 'icon' in request.files:
-            icon = request.files['icon']
-            if icon.filename:
-                filename = secure_filename(icon.filename)
-                icon_uuid = str(uuid.uuid4())
-                icon_filename = f"{icon_uuid}_{filename}"
-                icon_path = os.path.join('icons', icon_filename)
-                
-                # 确保目录存在
-                os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'icons'), exist_ok=True)
-                icon.save(os.path.join(app.config['UPLOAD_FOLDER'], icon_path))
-        
         # 处理插件包上传
         if 'package' not in request.files or not request.files['package'].filename:
             flash('请上传插件包文件', 'error')
             return redirect(url_for('admin_upload_plugin'))
         
         package = request.files['package']
-        filename = secure_filename(package.filename)
-        package_uuid = str(uuid.uuid4())
-        package_filename = f"{package_uuid}_{filename}"
-        package_path = os.path.join('packages', package_filename)
         
         # 确保目录存在
         os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'packages'), exist_ok=True)
-        package.save(os.path.join(app.config['UPLOAD_FOLDER'], package_path))
-        
-        # 创建插件记录
-        admin_id = session.get('admin_id')
-        plugin = Plugin(
-            name=name,
-            short_description=short_description,
-            description=description,
-            version=version,
-            author_id=admin_id,
-            icon_path=icon_path,
-            package_path=package_path,
-            category=category,
-            status='approved'  # 管理员上传的插件直接批准
-        )
+        # 插件包和图标按内容寻址保存，相同的文件只保存一份；提交插件记录前不允许删除这些文件
+        with blob_lock():
+            # 处理图标上传，各尺寸的图标变体在后台生成
+            icon_path, icon_hash = None, None
+            icon = request.files.get('icon')
+            if icon and icon.filename:
+                try:
+                    icon_hash = store_icon(icon)
+                except UploadError as e:
+                    flash(f'图标无效: {str(e)}', 'error')
+                    return redirect(url_for('admin_upload_plugin'))
+                icon_path = rendition_path(icon_hash, DEFAULT_ICON_SIZE, 'png')
+            
+            try:
+                package_path, package_sha256, package_size = save_package_upload(package)
+            except UploadError as e:
+                flash(f'插件包无效: {str(e)}', 'error')
+                return redirect(url_for('admin_upload_plugin'))
+            
+            # 创建插件记录
+            admin_id = session.get('admin_id')
+            plugin = Plugin(
+                name=name,
+                short_description=short_description,
+                description=description,
+                version=version,
+                author_id=admin_id,
+                icon_path=icon_path,
+                icon_hash=icon_hash,
+                package_path=package_path,
+                package_sha256=package_sha256,
+                package_size=package_size,
+                category=category,
+                status='approved'  # 管理员上传的插件直接批准
+            )
+            
+            db.session.add(plugin)
+            db.session.commit()
+        package_index.register(plugin.id, plugin.name, plugin.package_path)
+        response_cache.invalidate()
         
-        db.session.add(plugin)
-        db.session.commit()
+        # 插件包检查和图标变体生成在后台执行
+        if icon_hash:
+            job_queue.enqueue('render_icon', icon_hash=icon_hash)
+        enqueue_scan(plugin.id)
         
         flash('插件上传成功', 'success')
         return redirect(url_for('admin_plugins'))
@@ -228,6 +323,8 @@ def admin_edit_plugin(plugin_id):
         
         # 保存更改
         db.session.commit()
+        package_index.register(plugin.id, plugin.name, plugin.package_path)
+        response_cache.invalidate()
         
         flash('插件信息更新成功', 'success')
         return redirect(url_for('admin_plugins'))
@@ -236,25 +333,37 @@ def admin_edit_plugin(plugin_id):
                           plugin=plugin, 
                           admin_username=session.get('admin_username'))
 
+@app.route('/admin/plugins/<plugin_id>/scan', methods=['POST'])
+@admin_required
+def admin_scan_plugin(plugin_id):
+    plugin = Plugin.query.get_or_404(plugin_id)
+    enqueue_scan(plugin.id)
+    flash('已添加插件包检查任务', 'success')
+    return redirect(url_for('admin_edit_plugin', plugin_id=plugin_id))
+
 @app.route('/admin/plugins/<plugin_id>/delete', methods=['POST'])
 @admin_required
 def admin_delete_plugin(plugin_id):
     plugin = Plugin.query.get_or_404(plugin_id)
     
-    # 删除关联的文件
-    if plugin.icon_path:
+    # 删除关联的文件(图标变体可能被多个插件共享，删除记录后再按引用释放)
+    icon_hash = plugin.icon_hash
+    if plugin.icon_path and not icon_hash:
         icon_path = os.path.join(app.config['UPLOAD_FOLDER'], plugin.icon_path)
         if os.path.exists(icon_path):
             os.remove(icon_path)
     
-    if plugin.package_path:
-        package_path = os.path.join(app.config['UPLOAD_FOLDER'], plugin.package_path)
-        if os.path.exists(package_path):
-            os.remove(package_path)
-    
-    # 删除数据库记录
+    # 删除数据库记录(版本历史随插件一起删除)
+    history = [row.package_path for row in PluginVersion.query.filter_by(plugin_id=plugin.id)]
     db.session.delete(plugin)
     db.session.commit()
+    release_icon(icon_hash)
+    
+    # 插件包可能被多个插件共享，只有最后一个引用删除后才删除文件
+    removed_package = release_package(plugin.package_path)
+    package_index.discard(plugin_id, removed_package)
+    release_versions(history)
+    response_cache.invalidate()
     
     flash('插件已删除', 'success')
     return redirect(url_for('admin_plugins'))
@@ -263,15 +372,20 @@ def admin_delete_plugin(plugin_id):
 def create_initial_data():
     with app.app_context():
         db.create_all()
+        upgrade_schema()
+        init_search_index()
+        rebuild_category_facets()
+        reconcile_change_log()
+        # 继续执行上次退出时未完成的后台任务
+        job_queue.recover()
         
         # 检查是否已有管理员用户
         admin = User.query.filter_by(is_admin=True).first()
         if not admin:
-            from werkzeug.security import generate_password_hash
             admin = User(
                 username='admin',
                 email='admin@example.com',
-                password_hash=generate_password_hash('admin123'),
+                password_hash=hash_password('admin123'),
                 is_admin=True
             )
             db.session.add(admin)
@@ -312,6 +426,9 @@ def create_initial_data():
             db.session.add(skin_analyzer)
             db.session.commit()
             print("Initial plugins created")
+        
+        # 构建插件包位置索引
+        package_index.build(db.session.query(Plugin.id, Plugin.name, Plugin.package_path).all())
 
 # 确保目录存在
 os.makedirs(app.static_folder, exist_ok=True)
@@ -325,6 +442,7 @@ def client_page():
     return redirect(url_for('home'))
 
 @app.route('/plugin/<plugin_id>')
+@response_cache.cached(ttl_key='PAGE_CACHE_SECONDS')
 def plugin_detail(plugin_id):
     plugin = Plugin.query.get_or_404(plugin_id)
     if plugin.status != 'approved':
@@ -339,6 +457,8 @@ def client_plugin_detail(plugin_id):
 
 # 添加下载插件的路由
 @app.route('/download/<plugin_id>')
+@rate_limiter.limit('RATELIMIT_DOWNLOAD', key='ip')
+@rate_limiter.concurrency('DOWNLOAD_MAX_CONCURRENCY')
 def download_plugin(plugin_id):
     plugin = Plugin.query.get_or_404(plugin_id)
     
@@ -346,16 +466,17 @@ def download_plugin(plugin_id):
         flash('该插件不可用', 'error')
         return redirect(url_for('home'))
     
-    # 增加下载计数
-    plugin.downloads += 1
-    db.session.commit()
+    full_path = package_index.resolve(plugin)
+    if not full_path:
+        flash('插件文件未找到', 'error')
+        return redirect(url_for('plugin_detail', plugin_id=plugin_id))
     
-    # 返回文件
-    directory = os.path.join(app.config['UPLOAD_FOLDER'], os.path.dirname(plugin.package_path))
-    filename = os.path.basename(plugin.package_path)
+    # 增加下载计数(批量写入数据库)，断点续传的后续请求不重复计数
+    if is_initial_request():
+        download_counter.increment(plugin.id)
     
-    return send_from_directory(directory, filename, as_attachment=True, 
-                              download_name=f"{plugin.name}-{plugin.version}.zip")
+    # 返回文件，支持Range请求
+    return send_plugin_package(plugin, full_path, download_name=f"{plugin.name}-{plugin.version}.zip")
 
 # 在应用启动时初始化数据
 create_initial_data()
@@ -0,0 +1,56 @@
+"""比较两次基准测试结果
+
+    python -m benchmarks.compare base.json new.json --threshold 0.2 --query-tolerance 0.1
+
+按 (规模, 请求方式, 场景) 对齐两份结果，输出延迟和SQL语句数的变化。
+p95延迟变慢超过 threshold 或每个请求的SQL语句数增加超过 query_tolerance 时以非零状态退出。
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return {(r['catalog_size'], r['driver'], r['scenario']): r for r in report['results']}
+
+
+def compare(base, new, threshold, query_tolerance=0.1):
+    """返回 (比较结果行, 回退的场景列表)
+
+    query_tolerance 为允许增加的每个请求SQL语句数，容纳缓存定期检查等偶尔执行的查询。
+    """
+    rows, regressions = [], []
+    for key in sorted(base.keys() & new.keys()):
+        old, cur = base[key], new[key]
+        change = (cur['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0.0
+        more_queries = (cur['queries_per_request'] or 0) - (old['queries_per_request'] or 0) > query_tolerance
+        regressed = change > threshold or more_queries
+        rows.append((key, old, cur, change, regressed))
+        if regressed:
+            regressions.append(key)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='比较两次基准测试结果')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.2, help='允许的p95延迟增幅，默认0.2(20%%)')
+    parser.add_argument('--query-tolerance', type=float, default=0.1, help='允许增加的每个请求SQL语句数，默认0.1')
+    args = parser.parse_args(argv)
+
+    rows, regressions = compare(load(args.base), load(args.new), args.threshold, args.query_tolerance)
+    for (size, driver, scenario), old, cur, change, regressed in rows:
+        print(f"{'!' if regressed else ' '} {size:>7} {driver:<11} {scenario:<26} "
+              f"p95 {old['p95_ms']} -> {cur['p95_ms']}ms ({change:+.1%}) "
+              f"queries {old['queries_per_request']} -> {cur['queries_per_request']}")
+    if regressions:
+        print(f"{len(regressions)} 个场景性能回退", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""插件API基准测试的数据生成、请求驱动和统计"""
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import string
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import has_request_context
+from PIL import Image
+from sqlalchemy import event
+
+from models import db, User, Plugin
+from utils.blob_store import blob_path
+from utils.changes import reconcile_change_log
+from utils.counters import download_counter
+from utils.facets import rebuild_category_facets
+from utils.jobs import job_queue
+from utils.package_index import package_index
+from utils.search import rebuild_search_index
+
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench123'
+
+CATEGORIES = ['Computer Vision', 'Audio', 'NLP', 'Robotics', 'Sensors', 'Utilities']
+
+# 描述长度: 短文本、普通说明、带完整文档的长描述
+DESCRIPTION_SIZES = [200, 2 * 1024, 32 * 1024]
+
+# 插件包大小，插件按顺序引用这几个内容寻址的插件包
+PACKAGE_SIZES = [16 * 1024, 512 * 1024, 4 * 1024 * 1024]
+
+# 生成图标的插件数(图标接口从这些插件中取样)
+ICON_COUNT = 200
+
+SEED_BATCH = 5000
+
+
+def _text(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def _make_package(size, rng):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr('manifest.json', json.dumps({'name': 'bench', 'version': '1.0.0', 'entry_point': 'main.py'}))
+        zf.writestr('main.py', 'print("bench")\n')
+        zf.writestr('model.bin', rng.randbytes(size))
+    return buf.getvalue()
+
+
+def _write_packages(upload_folder, rng):
+    """写入基准测试用的插件包，返回 [(相对路径, SHA-256, 字节数)]"""
+    packages = []
+    for size in PACKAGE_SIZES:
+        data = _make_package(size, rng)
+        sha256 = hashlib.sha256(data).hexdigest()
+        package_path = blob_path(sha256)
+        full_path = os.path.join(upload_folder, package_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if not os.path.exists(full_path):
+            with open(full_path, 'wb') as f:
+                f.write(data)
+        packages.append((package_path, sha256, len(data)))
+    return packages
+
+
+def _write_icons(upload_folder, plugin_ids):
+    icons_dir = os.path.join(upload_folder, 'icons')
+    os.makedirs(icons_dir, exist_ok=True)
+    for i, plugin_id in enumerate(plugin_ids):
+        path = os.path.join(icons_dir, f'{plugin_id}.png')
+        if not os.path.exists(path):
+            Image.new('RGB', (128, 128), (i * 37 % 256, i * 91 % 256, 128)).save(path)
+
+
+def seed_catalog(target, upload_folder, seed=0):
+    """通过模型层把插件目录补充到 target 个已批准的插件
+
+    按批量插入，完成后重建全文索引和分类统计。多个规模依次测试时只补充差额。
+    返回新插入的插件数。
+    """
+    rng = random.Random(seed + target)
+    author = User.query.filter_by(username=BENCH_USER).first()
+    if author is None:
+        from werkzeug.security import generate_password_hash
+        author = User(username=BENCH_USER, email='bench@example.com',
+                      password_hash=generate_password_hash(BENCH_PASSWORD))
+        db.session.add(author)
+        db.session.commit()
+
+    existing = Plugin.query.filter_by(author_id=author.id).count()
+    if existing >= target:
+        return 0
+
+    packages = _write_packages(upload_folder, rng)
+    descriptions = [_text(rng, size) for size in DESCRIPTION_SIZES]
+    start = datetime.utcnow() - timedelta(days=365)
+    for batch_start in range(existing, target, SEED_BATCH):
+        plugins = []
+        for n in range(batch_start, min(batch_start + SEED_BATCH, target)):
+            package_path, sha256, size = packages[n % len(packages)]
+            plugins.append(Plugin(
+                name=f'Bench Plugin {n}',
+                short_description=_text(rng, 80),
+                description=descriptions[n % len(descriptions)],
+                version=f'1.{n % 10}.0',
+                author_id=author.id,
+                package_path=package_path,
+                package_sha256=sha256,
+                package_size=size,
+                category=CATEGORIES[n % len(CATEGORIES)],
+                created_at=start + timedelta(seconds=n),
+                status='approved',
+                downloads=rng.randint(0, 10000),
+            ))
+        # bulk_save_objects 不触发映射器事件，插入后统一重建全文索引、分类统计、变更日志和插件包索引
+        db.session.bulk_save_objects(plugins)
+        db.session.commit()
+
+    rebuild_search_index()
+    rebuild_category_facets()
+    reconcile_change_log()
+    package_index.build(db.session.query(Plugin.id, Plugin.name, Plugin.package_path).all())
+    _write_icons(upload_folder, icon_ids())
+    return target - existing
+
+
+def sample_ids(count, seed=0):
+    """随机选取基准测试插件ID"""
+    author = User.query.filter_by(username=BENCH_USER).first()
+    ids = [row.id for row in Plugin.query.filter_by(author_id=author.id).with_entities(Plugin.id)]
+    rng = random.Random(seed)
+    return rng.sample(ids, min(count, len(ids)))
+
+
+def icon_ids():
+    author = User.query.filter_by(username=BENCH_USER).first()
+    return [row.id for row in Plugin.query.filter_by(author_id=author.id)
+            .with_entities(Plugin.id).order_by(Plugin.created_at).limit(ICON_COUNT)]
+
+
+def scenarios(plugin_ids, icon_plugin_ids, token):
+    """基准测试场景: 名称 -> 第 i 个请求的 (方法, URL, 请求参数)"""
+    auth = {'Authorization': f'Bearer {token}'}
+    login = {'username': BENCH_USER, 'password': BENCH_PASSWORD}
+
+    def pick(ids):
+        return lambda i: ids[i % len(ids)]
+
+    plugin = pick(plugin_ids)
+    icon = pick(icon_plugin_ids)
+    return {
+        'get_plugins': lambda i: ('GET', '/api/plugins?limit=100', {}),
+        'get_plugins_stream': lambda i: ('GET', '/api/plugins?limit=1000', {'headers': {'Accept': 'application/x-ndjson'}}),
+        'get_plugins_category': lambda i: ('GET', f'/api/plugins?limit=100&category={CATEGORIES[i % len(CATEGORIES)]}', {}),
+        'catalog_changes': lambda i: ('GET', '/api/plugins/changes?since=0&limit=100', {}),
+        'get_plugin': lambda i: ('GET', f'/api/plugins/{plugin(i)}', {}),
+        'download_plugin': lambda i: ('GET', f'/api/plugins/{plugin(i)}/download', {}),
+        'get_plugin_download_info': lambda i: ('GET', f'/api/plugins/{plugin(i)}/download-info', {}),
+        'get_plugin_icon': lambda i: ('GET', f'/api/plugins/plugins/{icon(i)}/icon', {}),
+        'auth_login': lambda i: ('POST', '/api/auth/login', {'json': login}),
+        'auth_user': lambda i: ('GET', '/api/auth/user', {'headers': auth}),
+    }
+
+
+def percentile(values, pct):
+    """最近秩法百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class QueryCounter:
+    """统计处理请求时执行的SQL语句数(WSGI服务器模式下来自多个线程)
+
+    只统计在请求上下文中执行的语句，后台任务工作线程和下载计数写入线程执行的语句不计入，
+    否则结果随这些线程的执行时机波动。
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _before_cursor_execute(self, *args):
+        if not has_request_context():
+            return
+        with self._lock:
+            self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+def quiesce(app):
+    """测量前写入累计的下载计数并执行完排队的后台任务，上一个场景遗留的工作不影响本场景"""
+    with app.app_context():
+        download_counter.flush()
+        job_queue.run_pending()
+
+
+def summarize(latencies, elapsed, queries, errors):
+    """汇总一个场景的结果，延迟单位为毫秒"""
+    ms = [t * 1000 for t in latencies]
+    return {
+        'requests': len(ms),
+        'errors': errors,
+        'p50_ms': _round(percentile(ms, 50)),
+        'p95_ms': _round(percentile(ms, 95)),
+        'p99_ms': _round(percentile(ms, 99)),
+        'mean_ms': _round(sum(ms) / len(ms)) if ms else None,
+        'throughput_rps': _round(len(ms) / elapsed) if elapsed else None,
+        'queries_per_request': _round(queries / len(ms)) if ms else None,
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def run_test_client(app, build_request, count):
+    """用 Flask 测试客户端顺序发送 count 个请求
+
+    调用时不应处于应用上下文中，否则各请求共用同一个数据库会话，查询结果被会话缓存。
+    """
+    client = app.test_client()
+    latencies, errors = [], 0
+    quiesce(app)
+    with QueryCounter(db.get_engine(app)) as queries:
+        started = time.perf_counter()
+        for i in range(count):
+            method, url, kwargs = build_request(i)
+            t0 = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()
+            latencies.append(time.perf_counter() - t0)
+            errors += response.status_code >= 400
+            response.close()
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, queries.count, errors)
+
+
+class WsgiServer:
+    """在后台线程中运行的多线程WSGI服务器"""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join()
+
+
+def run_wsgi(app, server, build_request, count, concurrency):
+    """通过真实的HTTP连接并发发送 count 个请求"""
+    import requests
+
+    local = threading.local()
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def send(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, url, kwargs = build_request(i)
+        t0 = time.perf_counter()
+        response = session.request(method, server.url + url, **kwargs)
+        response.content
+        latency = time.perf_counter() - t0
+        with lock:
+            latencies.append(latency)
+            errors[0] += response.status_code >= 400
+
+    quiesce(app)
+    with QueryCounter(db.get_engine(app)) as queries:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(send, range(count)))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, queries.count, errors[0])
@@ -0,0 +1,118 @@
+"""插件API基准测试
+
+在临时目录(或 --workdir 指定的目录)中生成不同规模的插件目录，分别通过 Flask
+测试客户端和真实的WSGI服务器请求主要接口，以JSON格式输出各场景的延迟百分位数、
+吞吐量和每个请求的SQL语句数，便于在不同提交之间比较:
+
+    python -m benchmarks.run --sizes 1000,10000 --output bench.json
+    python -m benchmarks.compare base.json bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='插件API基准测试')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='插件目录规模，逗号分隔')
+    parser.add_argument('--requests', type=int, default=500, help='每个场景的请求数')
+    parser.add_argument('--concurrency', type=int, default=8, help='WSGI服务器模式的并发连接数')
+    parser.add_argument('--drivers', default='test_client,wsgi', help='请求方式: test_client, wsgi')
+    parser.add_argument('--scenarios', default='', help='只运行指定的场景，逗号分隔')
+    parser.add_argument('--workdir', help='数据库和上传目录所在的目录，默认使用临时目录')
+    parser.add_argument('--output', help='结果JSON文件，默认输出到标准输出')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='edgeplughub-bench-')
+    # app.py 在导入时即完成配置和初始化，需要先设置环境变量
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ['DATA_DIR'] = os.path.join(workdir, 'data')
+    os.makedirs(os.environ['DATA_DIR'], exist_ok=True)
+    # 压测的是接口本身的处理能力，关闭限速
+    os.environ.setdefault('RATELIMIT_ENABLED', 'false')
+    sys.path.insert(0, ROOT)
+
+    from app import app
+    from benchmarks import harness
+    from utils.cache import response_cache
+    from utils.counters import download_counter
+
+    app.logger.disabled = True
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    drivers = [d for d in args.drivers.split(',') if d]
+    selected = [s for s in args.scenarios.split(',') if s]
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'requests_per_scenario': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'results': [],
+    }
+
+    for size in sorted(int(s) for s in args.sizes.split(',')):
+        with app.app_context():
+            t0 = time.perf_counter()
+            inserted = harness.seed_catalog(size, app.config['UPLOAD_FOLDER'], seed=args.seed)
+            print(f"插件目录规模 {size}: 新增 {inserted} 个插件，用时 {time.perf_counter() - t0:.1f}s",
+                  file=sys.stderr)
+            plugin_ids = harness.sample_ids(args.requests, args.seed)
+            icon_plugin_ids = harness.icon_ids()
+            response_cache.invalidate()
+        token = app.test_client().post('/api/auth/login', json={
+            'username': harness.BENCH_USER, 'password': harness.BENCH_PASSWORD}).json['access_token']
+        scenarios = harness.scenarios(plugin_ids, icon_plugin_ids, token)
+        for driver in drivers:
+            for name, build_request in scenarios.items():
+                if selected and name not in selected:
+                    continue
+                if driver == 'wsgi':
+                    with harness.WsgiServer(app) as server:
+                        result = harness.run_wsgi(app, server, build_request, args.requests, args.concurrency)
+                else:
+                    result = harness.run_test_client(app, build_request, args.requests)
+                result = dict(catalog_size=size, driver=driver, scenario=name, **result)
+                report['results'].append(result)
+                print(f"{size:>7} {driver:<11} {name:<26} p50={result['p50_ms']}ms "
+                      f"p95={result['p95_ms']}ms rps={result['throughput_rps']} "
+                      f"queries={result['queries_per_request']} errors={result['errors']}",
+                      file=sys.stderr)
+    download_counter.flush()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+import json
 import uuid
 
 db = SQLAlchemy()
@@ -18,6 +19,18 @@ class User(db.Model):
         return f'<User {self.username}>'
 
 class Plugin(db.Model):
+    __table_args__ = (
+        # 列表接口: WHERE status=? ORDER BY created_at, id (游标分页)
+        db.Index('ix_plugin_status_created_at', 'status', 'created_at', 'id'),
+        # 按分类筛选的列表接口，以及 SELECT DISTINCT category WHERE status=?
+        db.Index('ix_plugin_status_category_created_at', 'status', 'category', 'created_at', 'id'),
+        # User.plugins 关联查询
+        db.Index('ix_plugin_author_id', 'author_id'),
+        # 插件包和图标引用计数
+        db.Index('ix_plugin_package_path', 'package_path'),
+        db.Index('ix_plugin_icon_hash', 'icon_hash'),
+    )
+    
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(100), nullable=False)
     short_description = db.Column(db.String(255), nullable=False)
@@ -25,7 +38,10 @@ class Plugin(db.Model):
     version = db.Column(db.String(20), nullable=False)
     author_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
     icon_path = db.Column(db.String(255))
+    icon_hash = db.Column(db.String(64))  # 图标原始文件的SHA-256，各尺寸变体按其保存
     package_path = db.Column(db.String(255), nullable=False)
+    package_sha256 = db.Column(db.String(64))  # 上传时计算的插件包SHA-256
+    package_size = db.Column(db.Integer)  # 插件包字节数
     category = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -34,25 +50,226 @@ class Plugin(db.Model):
     rating = db.Column(db.Float, default=0.0)
     git_repo = db.Column(db.String(255))
     requires_auth = db.Column(db.Boolean, default=False)
+    scan_status = db.Column(db.String(20))  # pending, passed, failed；为空表示尚未检查
+    scan_result = db.Column(db.Text)  # 插件包检查结果(JSON)，由后台任务写入
+    scanned_at = db.Column(db.DateTime)
+    # 以下由 utils.manifests 从插件包的 manifest.json 中提取，供兼容性筛选
+    entry_point = db.Column(db.String(255))
+    python_requires = db.Column(db.String(100))
+    python_min = db.Column(db.Integer)  # python_requires 换算的版本范围 [python_min, python_max)，见 utils.manifests.encode_version
+    python_max = db.Column(db.Integer)
+    min_memory_mb = db.Column(db.Integer)
+    file_count = db.Column(db.Integer)
+    installed_size = db.Column(db.Integer)  # 解压后总字节数
     
     def __repr__(self):
         return f'<Plugin {self.name}>'
         
+    @property
+    def author_name(self):
+        return self.author.username
+    
+    @property
+    def scan(self):
+        """插件包检查结果，尚未检查时为None"""
+        return json.loads(self.scan_result) if self.scan_result else None
+    
+    def to_dict(self, fields=None):
+        """序列化插件，fields 为需要输出的字段列表，未指定时输出全部字段"""
+        return plugin_row_to_dict(self, fields)
+
+def plugin_row_to_dict(row, fields=None):
+    """序列化插件查询结果行
+    
+    row 可以是 Plugin 实例，也可以是包含对应列和 author_name 的查询结果元组，
+    列表接口使用后者以避免为每个插件单独查询作者。
+    """
+    return {field: PLUGIN_FIELDS[field](row) for field in (fields or PLUGIN_FIELDS)}
+
+# to_dict 输出字段及其取值方式
+PLUGIN_FIELDS = {
+    'id': lambda p: p.id,
+    'name': lambda p: p.name,
+    'short_description': lambda p: p.short_description,
+    'description': lambda p: p.description,
+    'version': lambda p: p.version,
+    'author': lambda p: p.author_name,
+    'icon_url': lambda p: icon_url(p),
+    'category': lambda p: p.category,
+    'created_at': lambda p: p.created_at.isoformat(),
+    'updated_at': lambda p: p.updated_at.isoformat(),
+    'status': lambda p: p.status,
+    'downloads': lambda p: p.downloads,
+    'rating': lambda p: p.rating,
+    'git_repo': lambda p: p.git_repo,
+    'requires_auth': lambda p: p.requires_auth
+}
+
+# 输出字段依赖的数据库列，用于稀疏字段查询时只加载需要的列(author 通过关联查询用户名)
+PLUGIN_FIELD_COLUMNS = {
+    'author': (),
+    'icon_url': ('icon_path', 'icon_hash')
+}
+
+def icon_url(plugin):
+    """有图标变体时返回内容寻址的图标地址(可通过 size 参数选择尺寸)，否则返回原始图标文件地址"""
+    if plugin.icon_hash:
+        return f'/api/plugins/icons/{plugin.icon_hash}'
+    return f'/static/{plugin.icon_path}' if plugin.icon_path else None
+
+class CategoryFacet(db.Model):
+    """分类统计: 每个分类已批准的插件数和下载总数，由 utils.facets 随插件变更同步更新"""
+    __tablename__ = 'category_facet'
+    
+    category = db.Column(db.String(50), primary_key=True)
+    plugin_count = db.Column(db.Integer, nullable=False, default=0)
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+    
     def to_dict(self):
         return {
-            'id': self.id,
-            'name': self.name,
-            'short_description': self.short_description,
-            'description': self.description,
-            'version': self.version,
-            'author': self.author.username,
-            'icon_url': f'/static/{self.icon_path}' if self.icon_path else None,
             'category': self.category,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
+            'count': self.plugin_count,
+            'downloads': self.downloads
+        }
+
+class CatalogChange(db.Model):
+    """插件目录变更日志，由 utils.changes 随插件变更写入
+
+    每个插件只保留最近一次变更，seq 单调递增，边缘设备按 seq 增量同步。
+    visible_since 为插件最近一次进入目录(被批准)时的 seq，用于区分新增和修改。
+    """
+    __tablename__ = 'catalog_change'
+    # AUTOINCREMENT 保证删除旧记录后 seq 也不会被重用
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    seq = db.Column(db.Integer, primary_key=True)
+    plugin_id = db.Column(db.String(36), unique=True, nullable=False)
+    removed = db.Column(db.Boolean, nullable=False, default=False)
+    visible_since = db.Column(db.Integer)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class CacheVersion(db.Model):
+    """进程内缓存的版本，每种缓存一行，由 utils.cache 在缓存失效时递增，供多个工作进程共享"""
+    __tablename__ = 'cache_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class Job(db.Model):
+    """后台任务队列，由 utils.jobs 写入和执行
+
+    执行成功的任务直接删除，表中只保留排队、执行中和多次重试后失败的任务。
+    """
+    __tablename__ = 'job'
+    __table_args__ = (
+        # 认领任务: WHERE status='queued' AND run_after<=? ORDER BY id
+        db.Index('ix_job_status_run_after', 'status', 'run_after', 'id'),
+        db.Index('ix_job_kind_status', 'kind', 'status'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # 处理函数的关键字参数(JSON)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    
+    @property
+    def args(self):
+        return json.loads(self.payload)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'args': self.args,
             'status': self.status,
-            'downloads': self.downloads,
-            'rating': self.rating,
-            'git_repo': self.git_repo,
-            'requires_auth': self.requires_auth
-        } 
\ No newline at end of file
+            'attempts': self.attempts,
+            'error': self.error,
+            'run_after': self.run_after.isoformat(),
+            'created_at': self.created_at.isoformat()
+        }
+
+class PluginDependency(db.Model):
+    """插件清单中声明的依赖: kind 为 python (pip包) 或 plugin (其他插件)"""
+    __tablename__ = 'plugin_dependency'
+    __table_args__ = (
+        # 按依赖查找插件
+        db.Index('ix_plugin_dependency_kind_name', 'kind', 'name', 'plugin_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    plugin_id = db.Column(db.String(36), db.ForeignKey('plugin.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)
+    name = db.Column(db.String(100), nullable=False)  # 规范化的名称(小写，- _ . 统一为 -)
+    specifier = db.Column(db.String(100), nullable=False, default='')
+    marker = db.Column(db.String(255))
+    requirement = db.Column(db.String(255), nullable=False)  # 清单中的原始写法
+
+class PluginPlatform(db.Model):
+    """插件支持的平台(如 linux-aarch64)，没有记录的插件支持所有平台"""
+    __tablename__ = 'plugin_platform'
+    __table_args__ = (
+        db.Index('ix_plugin_platform_platform', 'platform', 'plugin_id'),
+    )
+    
+    plugin_id = db.Column(db.String(36), db.ForeignKey('plugin.id'), primary_key=True)
+    platform = db.Column(db.String(50), primary_key=True)
+
+class PluginCapability(db.Model):
+    """插件提供的能力(如 face_detection)"""
+    __tablename__ = 'plugin_capability'
+    __table_args__ = (
+        db.Index('ix_plugin_capability_name', 'name', 'plugin_id'),
+    )
+    
+    plugin_id = db.Column(db.String(36), db.ForeignKey('plugin.id'), primary_key=True)
+    name = db.Column(db.String(100), primary_key=True)
+
+class PluginFile(db.Model):
+    """插件包中的文件及其大小"""
+    __tablename__ = 'plugin_file'
+    
+    plugin_id = db.Column(db.String(36), db.ForeignKey('plugin.id'), primary_key=True)
+    path = db.Column(db.String(1024), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    compressed_size = db.Column(db.Integer, nullable=False)
+
+class PluginVersion(db.Model):
+    """插件的版本历史，每个版本对应一个插件包，由 utils.versions 写入"""
+    __tablename__ = 'plugin_version'
+    __table_args__ = (
+        db.UniqueConstraint('plugin_id', 'version', name='uq_plugin_version'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    plugin_id = db.Column(db.String(36), db.ForeignKey('plugin.id'), nullable=False)
+    version = db.Column(db.String(20), nullable=False)
+    package_path = db.Column(db.String(255), nullable=False, index=True)
+    package_sha256 = db.Column(db.String(64), nullable=False, index=True)
+    package_size = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'sha256': self.package_sha256,
+            'size': self.package_size,
+            'created_at': self.created_at.isoformat()
+        }
+
+class PackageDelta(db.Model):
+    """两个插件包之间的差异包(只含新增和修改的条目)，按插件包内容寻址，由后台任务生成"""
+    __tablename__ = 'package_delta'
+    
+    from_sha256 = db.Column(db.String(64), primary_key=True)
+    to_sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(255), nullable=False)  # 相对于 UPLOAD_FOLDER
+    sha256 = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    changed = db.Column(db.Integer, nullable=False)  # 新增和修改的条目数
+    removed = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from flask_jwt_extended import jwt_required
+
+from models import Plugin, Job
+from utils.auth import current_user_is_admin
+from utils.catalog_io import export_catalog, import_catalog, CatalogImportError, IMPORT_MODES
+from utils.jobs import job_queue
+from utils.package_scan import enqueue_scan
+
+admin_bp = Blueprint('admin_api', __name__)
+
+@admin_bp.route('/catalog/export', methods=['GET'])
+@jwt_required()
+def export_catalog_api():
+    """流式导出用户和插件(NDJSON)，blobs=true 时导出包含插件包和图标文件的tar流"""
+    if not current_user_is_admin():
+        return jsonify({"msg": "Admin privileges required"}), 403
+    
+    with_blobs = request.args.get('blobs', '').lower() in ('1', 'true', 'yes')
+    extension, mimetype = ('tar', 'application/x-tar') if with_blobs else ('ndjson', 'application/x-ndjson')
+    filename = f"catalog-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{extension}"
+    response = Response(stream_with_context(export_catalog(with_blobs)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@admin_bp.route('/catalog/import', methods=['POST'])
+@jwt_required()
+def import_catalog_api():
+    """从请求体流式导入 export 生成的NDJSON或tar数据，mode 为 skip 或 replace"""
+    if not current_user_is_admin():
+        return jsonify({"msg": "Admin privileges required"}), 403
+    
+    mode = request.args.get('mode', 'skip')
+    if mode not in IMPORT_MODES:
+        return jsonify({"msg": f"Invalid mode: {mode}"}), 400
+    try:
+        stats = import_catalog(request.stream, mode=mode)
+    except CatalogImportError as e:
+        return jsonify({"msg": str(e)}), 400
+    return jsonify(stats)
+
+@admin_bp.route('/plugins/<plugin_id>/scan', methods=['GET'])
+@jwt_required()
+def get_plugin_scan(plugin_id):
+    """获取后台任务预先计算的插件包检查结果"""
+    if not current_user_is_admin():
+        return jsonify({"msg": "Admin privileges required"}), 403
+    
+    plugin = Plugin.query.get_or_404(plugin_id)
+    return jsonify({
+        "plugin_id": plugin.id,
+        "status": plugin.scan_status,
+        "scanned_at": plugin.scanned_at.isoformat() if plugin.scanned_at else None,
+        "result": plugin.scan
+    })
+
+@admin_bp.route('/plugins/<plugin_id>/scan', methods=['POST'])
+@jwt_required()
+def rescan_plugin(plugin_id):
+    """重新检查插件包，返回后台任务ID"""
+    if not current_user_is_admin():
+        return jsonify({"msg": "Admin privileges required"}), 403
+    
+    plugin = Plugin.query.get_or_404(plugin_id)
+    return jsonify({"job_id": enqueue_scan(plugin.id)}), 202
+
+@admin_bp.route('/jobs', methods=['GET'])
+@jwt_required()
+def list_jobs():
+    """列出排队、执行中和失败的后台任务，status 参数按状态筛选"""
+    if not current_user_is_admin():
+        return jsonify({"msg": "Admin privileges required"}), 403
+    
+    query = Job.query
+    status = request.args.get('status')
+    if status:
+        query = query.filter_by(status=status)
+    return jsonify([job.to_dict() for job in query.order_by(Job.id).limit(500)])
+
+@admin_bp.route('/jobs/retry', methods=['POST'])
+@jwt_required()
+def retry_jobs():
+    """将失败的后台任务重新放回队列"""
+    if not current_user_is_admin():
+        return jsonify({"msg": "Admin privileges required"}), 403
+    
+    return jsonify({"retried": job_queue.retry_failed()})
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import jwt_required
 from models import db, User
+from utils.auth import hash_password, verify_password, create_user_token, current_identity
+from utils.ratelimit import rate_limiter
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -21,7 +22,7 @@ def register():
     user = User(
         username=data['username'],
         email=data['email'],
-        password_hash=generate_password_hash(data['password'])
+        password_hash=hash_password(data['password'])
     )
     
     db.session.add(user)
@@ -30,6 +31,7 @@ def register():
     return jsonify({"msg": "User registered successfully"}), 201
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limiter.limit('RATELIMIT_LOGIN', key='ip')
 def login():
     data = request.get_json()
     
@@ -38,24 +40,25 @@ def login():
     
     user = User.query.filter_by(username=data['username']).first()
     
-    if not user or not check_password_hash(user.password_hash, data['password']):
+    if not verify_password(user, data['password']):
         return jsonify({"msg": "Bad username or password"}), 401
     
-    access_token = create_access_token(identity=user.id)
+    # 令牌携带角色声明，鉴权时无需查询数据库
+    access_token = create_user_token(user)
     return jsonify({"access_token": access_token, "user_id": user.id})
 
 @auth_bp.route('/user', methods=['GET'])
 @jwt_required()
 def get_user():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    # 从用户身份缓存获取，不查询数据库
+    user = current_identity()
     
     if not user:
         return jsonify({"msg": "User not found"}), 404
     
     return jsonify({
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "is_admin": user.is_admin
-    }) 
\ No newline at end of file
+        "id": user['id'],
+        "username": user['username'],
+        "email": user['email'],
+        "is_admin": user['is_admin']
+    })
@@ -1,9 +1,29 @@
 import os
-from flask import Blueprint, request, jsonify, current_app, send_from_directory, send_file, abort
+import sys
+from flask import Blueprint, request, jsonify, current_app, send_from_directory, send_file, abort, url_for, redirect
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
-from models import db, Plugin, User
-import uuid
+from sqlalchemy import and_, or_
+from models import db, Plugin, PluginFile, PluginVersion, PackageDelta, User, CategoryFacet, PLUGIN_FIELDS, PLUGIN_FIELD_COLUMNS, plugin_row_to_dict
+from utils.package_index import package_index
+from utils.pagination import encode_cursor, decode_cursor, parse_limit, parse_fields
+from utils.cache import response_cache
+from utils.json_store import plugins_store
+from utils.streaming import STREAM_BATCH_SIZE, stream_list, wants_stream
+from utils.installed_store import installed_plugins
+from utils.counters import download_counter
+from utils.package_delivery import is_initial_request, send_package, send_plugin_package
+from utils.uploads import UploadError, save_package_upload
+from utils.blob_store import blob_lock
+from utils.search import search_plugin_ids
+from utils.changes import VISIBLE_STATUS, parse_token, latest_seq, changes_since
+from utils.auth import current_identity, current_user_is_admin
+from utils.ratelimit import rate_limiter
+from utils.icons import store_icon, send_icon, backfill_icon, is_icon_hash, rendition_path, DEFAULT_ICON_SIZE
+from utils.jobs import job_queue
+from utils.package_scan import enqueue_scan
+from utils.manifests import manifest_to_dict, filter_compatible
+from utils.versions import publish_version, release_versions, version_history, enqueue_deltas
 from os import path, listdir
 import json
 from datetime import datetime
@@ -11,10 +31,81 @@ import shutil
 
 plugins_bp = Blueprint('plugins', __name__)
 
+def get_manifest_path():
+    web_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(web_dir, 'public', 'plugins', 'manifest', 'plugins.json')
+
+def manifest_mtime():
+    # 清单文件可能被直接修改，将其mtime作为缓存键的一部分
+    try:
+        return os.stat(get_manifest_path()).st_mtime_ns
+    except OSError:
+        return None
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in {'zip'}
 
+def select_plugin_rows(query, fields):
+    """只查询需要的列并关联作者用户名，结果行用 plugin_row_to_dict 序列化，避免逐个插件查询作者"""
+    columns = ['id', 'created_at']
+    for f in (fields or PLUGIN_FIELDS):
+        columns.extend(PLUGIN_FIELD_COLUMNS.get(f, (f,)))
+    entities = [getattr(Plugin, c) for c in dict.fromkeys(columns)]
+    if not fields or 'author' in fields:
+        query = query.join(User, Plugin.author_id == User.id)
+        entities.append(User.username.label('author_name'))
+    return query.with_entities(*entities)
+
+def paginate_plugins(query):
+    """按 (created_at, id) 进行游标分页，并支持 fields 稀疏字段选择
+    
+    指定 limit 或 cursor 时分页，下一页的游标通过 X-Next-Cursor 和 Link 响应头返回，
+    响应体保持为插件数组；两者都未指定时与分页之前的客户端兼容，返回全部结果。
+    请求流式响应时(见 wants_stream)不分页，从游标处起流式返回全部结果(或前 limit 条)。
+    """
+    streaming = wants_stream()
+    try:
+        fields = parse_fields(request.args.get('fields'), PLUGIN_FIELDS)
+        if streaming:
+            limit = parse_limit(request.args.get('limit'), None, sys.maxsize)
+        elif request.args.get('limit') or request.args.get('cursor'):
+            limit = parse_limit(request.args.get('limit'),
+                                current_app.config['PLUGINS_PAGE_SIZE'],
+                                current_app.config['PLUGINS_MAX_PAGE_SIZE'])
+        else:
+            limit = None
+        cursor = request.args.get('cursor')
+        if cursor:
+            created_at, plugin_id = decode_cursor(cursor)
+            query = query.filter(or_(Plugin.created_at > created_at,
+                                     and_(Plugin.created_at == created_at, Plugin.id > plugin_id)))
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    
+    query = select_plugin_rows(query, fields).order_by(Plugin.created_at, Plugin.id)
+    if streaming:
+        # 分批从游标读取行，逐条序列化输出
+        rows = query.limit(limit) if limit else query
+        return stream_list(plugin_row_to_dict(p, fields) for p in rows.yield_per(STREAM_BATCH_SIZE))
+    
+    if limit is None:
+        plugins, has_more = query.all(), False
+    else:
+        plugins = query.limit(limit + 1).all()
+        has_more = len(plugins) > limit
+        plugins = plugins[:limit]
+    
+    response = jsonify([plugin_row_to_dict(p, fields) for p in plugins])
+    response.vary.add('Accept')
+    if has_more:
+        next_cursor = encode_cursor(plugins[-1].created_at, plugins[-1].id)
+        args = request.args.to_dict()
+        args.update(cursor=next_cursor, limit=limit)
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(request.endpoint, **request.view_args, **args)}>; rel="next"'
+    return response
+
 @plugins_bp.route('', methods=['GET'])
 def get_plugins():
     status = request.args.get('status', 'approved')
@@ -27,26 +118,147 @@ def get_plugins():
     if category:
         query = query.filter_by(category=category)
     
-    plugins = query.all()
-    return jsonify([p.to_dict() for p in plugins])
+    return paginate_plugins(query)
+
+@plugins_bp.route('/search', methods=['GET'])
+def search_plugins():
+    """全文搜索已批准的插件(名称、简介和描述)，按相关度排序并分页"""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({"msg": "Missing search query"}), 400
+    try:
+        fields = parse_fields(request.args.get('fields'), PLUGIN_FIELDS)
+        limit = parse_limit(request.args.get('limit'),
+                            current_app.config['PLUGINS_PAGE_SIZE'],
+                            current_app.config['PLUGINS_MAX_PAGE_SIZE'])
+        page = int(request.args.get('page', 1))
+        if page < 1:
+            raise ValueError(f"Invalid page: {page}")
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    
+    plugin_ids = search_plugin_ids(q, limit + 1, (page - 1) * limit)
+    has_more = len(plugin_ids) > limit
+    plugin_ids = plugin_ids[:limit]
+    
+    rows = {}
+    if plugin_ids:
+        query = select_plugin_rows(Plugin.query.filter(Plugin.id.in_(plugin_ids)), fields)
+        rows = {row.id: row for row in query}
+    
+    # 保持搜索结果的相关度顺序
+    response = jsonify([plugin_row_to_dict(rows[pid], fields) for pid in plugin_ids if pid in rows])
+    if has_more:
+        args = request.args.to_dict()
+        args.update(page=page + 1, limit=limit)
+        response.headers['Link'] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+    return response
+
+@plugins_bp.route('/compatible', methods=['GET'])
+@response_cache.cached(ttl_key='PAGE_CACHE_SECONDS', bypass=wants_stream)
+def get_compatible_plugins():
+    """返回能在指定设备上运行的已批准插件，条件来自插件包清单(见 utils.manifests.filter_compatible)
+    
+    参数 platform、python、memory(MB)、storage(MB)、capability(可重复)，分页方式与 /api/plugins 相同。
+    """
+    query = Plugin.query.filter_by(status='approved')
+    category = request.args.get('category')
+    if category:
+        query = query.filter_by(category=category)
+    try:
+        query = filter_compatible(query,
+                                  platform=request.args.get('platform'),
+                                  python=request.args.get('python'),
+                                  memory=request.args.get('memory'),
+                                  storage=request.args.get('storage'),
+                                  capabilities=request.args.getlist('capability'))
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    
+    return paginate_plugins(query)
+
+@plugins_bp.route('/changes', methods=['GET'])
+@response_cache.cached(key_func=latest_seq)
+def get_catalog_changes():
+    """返回 since 令牌之后新增、修改和移除的已批准插件以及新的令牌，供边缘设备增量同步
+    
+    未指定 since 时返回完整目录；令牌比服务端最新的还新(如数据库被重建)时同样返回完整
+    目录并设置 reset，客户端应丢弃本地数据。more 为 true 时用返回的令牌继续获取。
+    缓存按数据库中最新的 seq 区分，其他进程写入的变更也不会读到旧的缓存。
+    """
+    try:
+        since = parse_token(request.args.get('since'))
+        fields = parse_fields(request.args.get('fields'), PLUGIN_FIELDS)
+        limit = parse_limit(request.args.get('limit'),
+                            current_app.config['PLUGINS_PAGE_SIZE'],
+                            current_app.config['PLUGINS_MAX_PAGE_SIZE'])
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    
+    reset = since > latest_seq()
+    if reset:
+        since = 0
+    changes = changes_since(since, limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    
+    live_ids = [c.plugin_id for c in changes if not c.removed]
+    rows = {}
+    if live_ids:
+        query = Plugin.query.filter(Plugin.id.in_(live_ids), Plugin.status == VISIBLE_STATUS)
+        rows = {row.id: row for row in select_plugin_rows(query, fields)}
+    
+    added, updated, removed = [], [], []
+    for change in changes:
+        if change.removed:
+            # 在 since 之后才进入目录的插件客户端从未见过，无需通知移除
+            if change.visible_since is None or change.visible_since <= since:
+                removed.append(change.plugin_id)
+        elif change.plugin_id in rows:
+            target = added if change.visible_since > since else updated
+            target.append(plugin_row_to_dict(rows[change.plugin_id], fields))
+    
+    return jsonify({
+        "token": str(changes[-1].seq if changes else since),
+        "added": added,
+        "updated": updated,
+        "removed": removed,
+        "more": has_more,
+        "reset": reset
+    })
 
 @plugins_bp.route('/<plugin_id>', methods=['GET'])
 def get_plugin(plugin_id):
     plugin = Plugin.query.get_or_404(plugin_id)
     
-    # Increment download counter for detail view
-    plugin.downloads += 1
-    db.session.commit()
+    # Increment download counter for detail view (flushed to the database in batches)
+    download_counter.increment(plugin.id)
     
-    return jsonify(plugin.to_dict())
+    data = plugin.to_dict()
+    data['downloads'] += download_counter.pending(plugin.id)
+    data['manifest'] = manifest_to_dict(plugin)
+    return jsonify(data)
+
+@plugins_bp.route('/<plugin_id>/files', methods=['GET'])
+def get_plugin_files(plugin_id):
+    """返回插件包中的文件列表及大小(插件包检查时记录)，无需下载插件包"""
+    plugin = Plugin.query.get_or_404(plugin_id)
+    if plugin.file_count is None:
+        return jsonify({"msg": "Package has not been scanned"}), 404
+    
+    files = PluginFile.query.filter_by(plugin_id=plugin.id).order_by(PluginFile.path)
+    return jsonify([{
+        'path': f.path,
+        'size': f.size,
+        'compressed_size': f.compressed_size
+    } for f in files])
 
 @plugins_bp.route('', methods=['POST'])
 @jwt_required()
 def create_plugin():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
     
-    if not user:
+    if current_identity() is None:
         return jsonify({"msg": "User not found"}), 404
     
     # Parse form data
@@ -61,17 +273,6 @@ def create_plugin():
     if not name or not description or not version or not category:
         return jsonify({"msg": "Missing required fields"}), 400
     
-    # Handle icon upload
-    icon_path = None
-    if 'icon' in request.files:
-        icon = request.files['icon']
-        if icon.filename:
-            filename = secure_filename(icon.filename)
-            icon_uuid = str(uuid.uuid4())
-            icon_filename = f"{icon_uuid}_{filename}"
-            icon_path = os.path.join('icons', icon_filename)
-            icon.save(os.path.join(current_app.config['UPLOAD_FOLDER'], icon_path))
-    
     # Handle package upload
     if 'package' not in request.files:
         return jsonify({"msg": "No package file"}), 400
@@ -83,33 +284,56 @@ def create_plugin():
     if not allowed_file(package.filename):
         return jsonify({"msg": "File type not allowed"}), 400
     
-    filename = secure_filename(package.filename)
-    package_uuid = str(uuid.uuid4())
-    package_filename = f"{package_uuid}_{filename}"
-    package_path = os.path.join('packages', package_filename)
-    package.save(os.path.join(current_app.config['UPLOAD_FOLDER'], package_path))
-    
-    # Create plugin
-    plugin = Plugin(
-        name=name,
-        short_description=short_description,
-        description=description,
-        version=version,
-        author_id=user_id,
-        icon_path=icon_path,
-        package_path=package_path,
-        category=category,
-        git_repo=git_repo,
-        requires_auth=requires_auth,
-        status='pending'  # All plugins start as pending
-    )
-    
-    db.session.add(plugin)
-    db.session.commit()
+    # 插件包和图标按内容寻址保存，相同的文件只保存一份；提交插件记录前不允许删除这些文件
+    with blob_lock():
+        # 图标处理为固定尺寸的变体
+        icon_path, icon_hash = None, None
+        icon = request.files.get('icon')
+        if icon and icon.filename:
+            try:
+                icon_hash = store_icon(icon)
+            except UploadError as e:
+                return jsonify({"msg": str(e)}), e.status
+            icon_path = rendition_path(icon_hash, DEFAULT_ICON_SIZE, 'png')
+        
+        try:
+            package_path, package_sha256, package_size = save_package_upload(package)
+        except UploadError as e:
+            return jsonify({"msg": str(e)}), e.status
+        
+        # Create plugin
+        plugin = Plugin(
+            name=name,
+            short_description=short_description,
+            description=description,
+            version=version,
+            author_id=user_id,
+            icon_path=icon_path,
+            icon_hash=icon_hash,
+            package_path=package_path,
+            package_sha256=package_sha256,
+            package_size=package_size,
+            category=category,
+            git_repo=git_repo,
+            requires_auth=requires_auth,
+            status='pending'  # All plugins start as pending
+        )
+        
+        db.session.add(plugin)
+        db.session.commit()
+    package_index.register(plugin.id, plugin.name, plugin.package_path)
+    response_cache.invalidate()
+    
+    # 插件包已写入磁盘即返回，检查插件包和生成图标变体在后台执行
+    if icon_hash:
+        job_queue.enqueue('render_icon', icon_hash=icon_hash)
+    enqueue_scan(plugin.id)
     
     return jsonify(plugin.to_dict()), 201
 
 @plugins_bp.route('/<plugin_id>/download', methods=['GET'])
+@rate_limiter.limit('RATELIMIT_DOWNLOAD', key='ip')
+@rate_limiter.concurrency('DOWNLOAD_MAX_CONCURRENCY')
 def download_plugin(plugin_id):
     try:
         plugin = Plugin.query.get_or_404(plugin_id)
@@ -117,108 +341,18 @@ def download_plugin(plugin_id):
         if plugin.status != 'approved':
             return jsonify({"msg": "插件未批准，不允许下载"}), 403
         
-        # 增加日志记录
-        current_app.logger.info(f"请求下载插件: {plugin_id}, 名称: {plugin.name}, 状态: {plugin.status}")
-        
-        # 使用web目录路径
-        web_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 获取web目录路径
-        packages_dir = os.path.join(web_dir, 'uploads', 'packages')
-        current_app.logger.info(f"查找插件包目录(web目录): {packages_dir}")
-        
-        if not os.path.exists(packages_dir):
-            current_app.logger.error(f"插件包目录不存在: {packages_dir}")
-            os.makedirs(packages_dir, exist_ok=True)
-            current_app.logger.info(f"已创建插件包目录: {packages_dir}")
-            return jsonify({"msg": "插件目录不存在，请联系管理员"}), 404
-        
-        # 列出目录内容
-        try:
-            files = os.listdir(packages_dir)
-            current_app.logger.info(f"web/uploads/packages目录内容: {files}")
-        except Exception as e:
-            current_app.logger.error(f"读取插件包目录失败: {str(e)}")
-            return jsonify({"msg": f"读取插件包目录失败: {str(e)}"}), 500
-        
-        # 优先级搜索策略：
-        # 1. 检查数据库中记录的路径
-        # 2. 特殊插件文件匹配
-        # 3. 按插件ID查找
-        # 4. 按插件名称查找
-        # 5. 按包含插件名称的文件名查找
-        
-        # 方案1: 检查数据库中记录的路径
-        package_path = plugin.package_path
-        if package_path:
-            full_path = os.path.join(web_dir, 'uploads', package_path)
-            if os.path.exists(full_path) and os.path.isfile(full_path):
-                current_app.logger.info(f"从数据库记录找到插件包(web目录): {full_path}")
-                return send_file(full_path, as_attachment=True)
-            current_app.logger.warning(f"数据库记录的包路径无效(web目录): {full_path}")
-        
-        # 方案2: 特殊插件文件匹配
-        special_files = {
-            'face': 'face_detector.zip',
-            'detector': 'face_detector.zip',
-            'skin': 'skin_analyzer.zip',
-            'analyzer': 'skin_analyzer.zip'
-        }
-        
-        # 首先尝试特殊文件匹配
-        file_candidates = []
-        for keyword, special_file in special_files.items():
-            if keyword in plugin.name.lower() and special_file in files:
-                file_candidates.append(special_file)
-                current_app.logger.info(f"按特殊规则找到匹配文件: {special_file}")
-        
-        # 方案3: 按插件ID查找
-        id_filename = f"{plugin_id}.zip"
-        if id_filename in files and id_filename not in file_candidates:
-            file_candidates.append(id_filename)
-            current_app.logger.info(f"按ID找到匹配文件: {id_filename}")
-        
-        # 方案4: 按插件名称查找
-        name_filename = f"{plugin.name.lower().replace(' ', '_')}.zip"
-        if name_filename in files and name_filename not in file_candidates:
-            file_candidates.append(name_filename)
-            current_app.logger.info(f"按名称找到匹配文件: {name_filename}")
+        # 按记录中的包路径查找，旧插件从插件包索引中按名称匹配，无需每次列出目录
+        full_path = package_index.resolve(plugin)
+        if not full_path:
+            current_app.logger.error(f"未找到匹配的插件包文件: {plugin.name} (ID: {plugin_id})")
+            return jsonify({"msg": "插件文件未找到，请联系管理员上传正确的插件包", "files_available": package_index.filenames()}), 404
         
-        # 方案5: 按包含插件名称的文件查找
-        plugin_name_lower = plugin.name.lower().replace(' ', '_')
-        for filename in files:
-            if plugin_name_lower in filename.lower() and filename not in file_candidates:
-                file_candidates.append(filename)
-                current_app.logger.info(f"按名称部分匹配找到文件: {filename}")
+        # 更新下载计数(批量写入数据库)，断点续传的后续请求不重复计数
+        if is_initial_request():
+            download_counter.increment(plugin.id)
         
-        # 如果找到了候选文件，返回第一个
-        if file_candidates:
-            selected_file = file_candidates[0]
-            full_path = os.path.join(packages_dir, selected_file)
-            
-            # 检查文件是否是有效的zip文件
-            try:
-                import zipfile
-                if zipfile.is_zipfile(full_path):
-                    current_app.logger.info(f"验证为有效的zip文件(web目录): {full_path}")
-                    
-                    # 更新下载计数
-                    plugin.downloads += 1
-                    db.session.commit()
-                    
-                    # 返回文件
-                    return send_file(full_path, as_attachment=True)
-                else:
-                    current_app.logger.error(f"找到的文件不是有效的zip文件(web目录): {full_path}")
-            except Exception as e:
-                current_app.logger.error(f"验证zip文件时出错: {str(e)}")
-        
-        # 没有找到匹配的文件
-        current_app.logger.error(f"未找到匹配的插件包文件(web目录): {plugin.name} (ID: {plugin_id})")
-        
-        # 列出所有可用文件供参考
-        file_info = "\n".join([f"- {f}" for f in files]) if files else "目录为空"
-        current_app.logger.info(f"可用的包文件(web目录):\n{file_info}")
-        
-        return jsonify({"msg": "插件文件未找到，请联系管理员上传正确的插件包", "files_available": files}), 404
+        # 返回文件，支持Range请求
+        return send_plugin_package(plugin, full_path)
         
     except Exception as e:
         current_app.logger.error(f"下载插件时出错: {str(e)}")
@@ -226,14 +360,109 @@ def download_plugin(plugin_id):
         current_app.logger.error(traceback.format_exc())
         return jsonify({"msg": f"下载插件时出错: {str(e)}"}), 500
 
+@plugins_bp.route('/<plugin_id>/versions', methods=['GET'])
+def get_plugin_versions(plugin_id):
+    """返回插件的版本历史(从新到旧)，列出的旧版本可以通过差异包升级到当前版本"""
+    plugin = Plugin.query.get_or_404(plugin_id)
+    return jsonify(version_history(plugin))
+
+@plugins_bp.route('/<plugin_id>/versions', methods=['POST'])
+@jwt_required()
+def upload_plugin_version(plugin_id):
+    """上传插件的新版本，旧版本保留在版本历史中，后台生成从旧版本升级的差异包
+    
+    作者上传的新版本需要重新审核，管理员上传的新版本保持插件原来的状态。
+    """
+    plugin = Plugin.query.get_or_404(plugin_id)
+    is_admin = current_user_is_admin()
+    if not is_admin and plugin.author_id != get_jwt_identity():
+        return jsonify({"msg": "Unauthorized"}), 403
+    
+    version = request.form.get('version')
+    if not version:
+        return jsonify({"msg": "Missing required fields"}), 400
+    if version == plugin.version or \
+            PluginVersion.query.filter_by(plugin_id=plugin.id, version=version).first() is not None:
+        return jsonify({"msg": f"Version {version} already exists"}), 409
+    
+    package = request.files.get('package')
+    if package is None or not package.filename:
+        return jsonify({"msg": "No package file"}), 400
+    if not allowed_file(package.filename):
+        return jsonify({"msg": "File type not allowed"}), 400
+    
+    with blob_lock():
+        try:
+            package_path, package_sha256, package_size = save_package_upload(package)
+        except UploadError as e:
+            return jsonify({"msg": str(e)}), e.status
+        
+        stale_packages = publish_version(plugin, version, package_path, package_sha256, package_size)
+        if not is_admin:
+            plugin.status = 'pending'
+        db.session.commit()
+    release_versions(stale_packages)
+    package_index.register(plugin.id, plugin.name, plugin.package_path)
+    response_cache.invalidate()
+    
+    enqueue_scan(plugin.id)
+    enqueue_deltas(plugin.id)
+    
+    return jsonify(plugin.to_dict()), 201
+
+@plugins_bp.route('/<plugin_id>/delta', methods=['GET'])
+@rate_limiter.limit('RATELIMIT_DOWNLOAD', key='ip')
+@rate_limiter.concurrency('DOWNLOAD_MAX_CONCURRENCY')
+def download_plugin_delta(plugin_id):
+    """下载从 from 版本升级到当前版本的差异包
+    
+    差异包为zip文件，只包含新增和修改的条目，被删除的条目记录在根目录的 .delta.json 中。
+    已是当前版本时返回204；差异包尚未生成时返回202，客户端稍后重试或下载完整插件包；
+    差异包不比完整插件包小时重定向到完整插件包的下载地址。
+    """
+    plugin = Plugin.query.get_or_404(plugin_id)
+    if plugin.status != 'approved':
+        return jsonify({"msg": "插件未批准，不允许下载"}), 403
+    
+    from_version = request.args.get('from')
+    if not from_version:
+        return jsonify({"msg": "Missing from version"}), 400
+    if from_version == plugin.version:
+        return '', 204
+    base = PluginVersion.query.filter_by(plugin_id=plugin.id, version=from_version).first()
+    if base is None or not plugin.package_sha256:
+        return jsonify({"msg": f"Unknown version: {from_version}"}), 404
+    if base.package_sha256 == plugin.package_sha256:
+        return '', 204
+    
+    key = (base.package_sha256, plugin.package_sha256)
+    delta = PackageDelta.query.get(key)
+    if delta is None:
+        job_queue.enqueue('build_delta', from_sha256=key[0], to_sha256=key[1])
+        # JOBS_EAGER 时差异包已在入队时生成
+        delta = PackageDelta.query.get(key)
+    if delta is None:
+        response = jsonify({"msg": "Delta is being prepared"})
+        response.headers['Retry-After'] = '10'
+        return response, 202
+    if plugin.package_size and delta.size >= plugin.package_size:
+        return redirect(url_for('.download_plugin', plugin_id=plugin.id), 303)
+    
+    if is_initial_request():
+        download_counter.increment(plugin.id)
+    
+    download_name = f"{secure_filename(plugin.name) or plugin.id}-{from_version}-{plugin.version}.delta.zip"
+    response = send_package(os.path.join(current_app.config['UPLOAD_FOLDER'], delta.path),
+                            download_name, delta.sha256, delta.size)
+    response.headers['X-Delta-From'] = from_version
+    response.headers['X-Delta-To'] = plugin.version
+    return response
+
 @plugins_bp.route('/review/<plugin_id>', methods=['POST'])
 @jwt_required()
 def review_plugin(plugin_id):
-    # 检查是否为管理员
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    
-    if not user or not user.is_admin:
+    # 按令牌的角色声明和缓存的用户身份检查是否为管理员
+    if not current_user_is_admin():
         return jsonify({'message': 'Only admin can review plugins'}), 403
     
     plugin = Plugin.query.get_or_404(plugin_id)
@@ -249,10 +478,12 @@ def review_plugin(plugin_id):
     
     plugin.status = status
     db.session.commit()
+    response_cache.invalidate()
     
     return jsonify({'message': f'Plugin {status}', 'plugin': plugin.to_dict()})
 
 @plugins_bp.route('/available', methods=['GET'])
+@response_cache.cached(ttl_key='PAGE_CACHE_SECONDS', bypass=wants_stream)
 def get_available_plugins():
     """获取可供下载的插件列表，供客户端应用中心使用"""
     category = request.args.get('category')
@@ -262,15 +493,20 @@ def get_available_plugins():
     if category:
         query = query.filter_by(category=category)
     
-    plugins = query.all()
-    return jsonify([p.to_dict() for p in plugins])
+    return paginate_plugins(query)
 
 @plugins_bp.route('/categories', methods=['GET'])
+@response_cache.cached(ttl_key='PAGE_CACHE_SECONDS')
 def get_plugin_categories():
-    """获取所有可用的插件分类"""
-    # 从所有已批准的插件中获取唯一的分类列表
-    categories = db.session.query(Plugin.category).distinct().filter(Plugin.status=='approved').all()
-    return jsonify([c[0] for c in categories])
+    """获取所有可用的插件分类，counts=true 时同时返回各分类的插件数和下载总数
+
+    下载总数由下载计数写入时更新，不会使缓存失效，因此缓存最多保留 PAGE_CACHE_SECONDS 秒。
+    """
+    # 分类统计表随插件变更同步更新，只包含有已批准插件的分类
+    facets = CategoryFacet.query.order_by(CategoryFacet.category).all()
+    if request.args.get('counts', '').lower() in ('1', 'true', 'yes'):
+        return jsonify([f.to_dict() for f in facets])
+    return jsonify([f.category for f in facets])
 
 @plugins_bp.route('/plugins/available', methods=['GET'])
 def get_available_plugins_json():
@@ -278,33 +514,21 @@ def get_available_plugins_json():
     # 获取查询参数
     category = request.args.get('category')
     
-    # 读取插件数据
-    plugins_file = os.path.join(current_app.config['DATA_DIR'], 'plugins.json')
-    if not os.path.exists(plugins_file):
-        return jsonify([])
-    
-    with open(plugins_file, 'r') as f:
-        plugins = json.load(f)
+    # 如果指定了分类，从分类索引中获取
+    plugins = plugins_store.by_category(category) if category else plugins_store.all()
     
-    # 如果指定了分类，筛选结果
-    if category:
-        plugins = [p for p in plugins if p.get('category') == category]
+    # 流式序列化，不在内存中生成整个目录的JSON
+    if wants_stream():
+        return stream_list(plugins)
     
-    return jsonify(plugins)
+    response = jsonify(plugins)
+    response.vary.add('Accept')
+    return response
 
 @plugins_bp.route('/plugins/<plugin_id>', methods=['GET'])
 def get_plugin_json(plugin_id):
     """获取特定插件的详情"""
-    # 读取插件数据
-    plugins_file = os.path.join(current_app.config['DATA_DIR'], 'plugins.json')
-    if not os.path.exists(plugins_file):
-        return jsonify({"error": "Plugin not found"}), 404
-    
-    with open(plugins_file, 'r') as f:
-        plugins = json.load(f)
-    
-    # 查找插件
-    plugin = next((p for p in plugins if p.get('id') == plugin_id), None)
+    plugin = plugins_store.get(plugin_id)
     if not plugin:
         return jsonify({"error": "Plugin not found"}), 404
     
@@ -312,89 +536,114 @@ def get_plugin_json(plugin_id):
 
 @plugins_bp.route('/plugins/categories', methods=['GET'])
 def get_categories():
-    """获取插件分类列表"""
-    # 读取插件数据
-    plugins_file = os.path.join(current_app.config['DATA_DIR'], 'plugins.json')
-    if not os.path.exists(plugins_file):
-        return jsonify([])
-    
-    with open(plugins_file, 'r') as f:
-        plugins = json.load(f)
-    
-    # 提取并去重分类
-    categories = list(set(p.get('category', '未分类') for p in plugins))
-    
-    return jsonify(categories)
+    """获取插件分类列表，counts=true 时同时返回各分类的插件数"""
+    if request.args.get('counts', '').lower() in ('1', 'true', 'yes'):
+        return jsonify([{'category': c, 'count': n} for c, n in plugins_store.category_counts().items()])
+    return jsonify(plugins_store.categories())
+
+@plugins_bp.route('/icons/<icon_hash>', methods=['GET'])
+def get_icon_rendition(icon_hash):
+    """按内容寻址获取图标，size 参数选择尺寸，内容永不改变"""
+    if not is_icon_hash(icon_hash):
+        return jsonify({"error": "Icon not found"}), 404
+    try:
+        response = send_icon(icon_hash, immutable=True)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    if response is None:
+        return jsonify({"error": "Icon not found"}), 404
+    return response
 
 @plugins_bp.route('/plugins/<plugin_id>/icon', methods=['GET'])
 def get_plugin_icon(plugin_id):
-    """获取插件图标"""
-    # 设置图标目录
-    icons_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'icons')
-    
-    # 尝试多种可能的图标文件名，按优先级排列
-    possible_icon_paths = [
-        os.path.join(icons_dir, f"{plugin_id}.png"),  # 插件ID.png
-        os.path.join(icons_dir, f"{plugin_id}.jpg"),  # 插件ID.jpg
-    ]
-    
-    # 尝试查找插件数据，提取名称生成更多可能的文件名
+    """获取插件图标，size 参数选择尺寸"""
+    plugin = Plugin.query.get(plugin_id)
+    icon_path = None
     try:
-        # 尝试从数据库获取插件
-        plugin = Plugin.query.get(plugin_id)
-        if plugin and plugin.name:
-            plugin_name = plugin.name.lower().replace(' ', '_')
-            possible_icon_paths.extend([
-                os.path.join(icons_dir, f"{plugin_name}.png"),
-                os.path.join(icons_dir, f"{plugin_name}.jpg")
-            ])
-    except Exception as e:
-        current_app.logger.warning(f"从数据库获取插件信息失败: {e}")
-        pass
+        if plugin and plugin.icon_hash:
+            response = send_icon(plugin.icon_hash)
+            if response is not None:
+                return response
         
-    # 尝试从plugins.json文件获取插件信息
-    try:
-        plugins_file = os.path.join(current_app.config['DATA_DIR'], 'plugins.json')
-        if os.path.exists(plugins_file):
-            with open(plugins_file, 'r') as f:
-                plugins = json.load(f)
-                plugin_info = next((p for p in plugins if p.get('id') == plugin_id), None)
-                if plugin_info and plugin_info.get('name'):
-                    plugin_name = plugin_info['name'].lower().replace(' ', '_')
-                    possible_icon_paths.extend([
-                        os.path.join(icons_dir, f"{plugin_name}.png"),
-                        os.path.join(icons_dir, f"{plugin_name}.jpg")
-                    ])
-    except Exception as e:
-        current_app.logger.warning(f"从JSON文件获取插件信息失败: {e}")
-        pass
-    
-    # 检查所有可能的图标路径
-    for icon_path in possible_icon_paths:
-        if os.path.exists(icon_path):
-            current_app.logger.info(f"使用图标: {icon_path}")
-            return send_file(icon_path)
+        # 还没有图标变体的旧插件，查找原始图标文件并在后台生成变体，生成之前返回原始文件
+        icon_path = find_legacy_icon(plugin_id, plugin)
+        if icon_path and plugin:
+            job_queue.enqueue('backfill_icon', plugin_id=plugin.id)
+            if plugin.icon_hash:
+                response = send_icon(plugin.icon_hash)
+                if response is not None:
+                    return response
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
+    
+    if icon_path:
+        current_app.logger.debug(f"使用图标: {icon_path}")
+        return send_file(icon_path)
     
     # 如果没有找到特定图标，返回默认图标
-    default_icon_path = os.path.join(icons_dir, 'default.png')
+    default_icon_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'icons', 'default.png')
     if os.path.exists(default_icon_path):
-        current_app.logger.info(f"使用默认图标: {default_icon_path}")
+        current_app.logger.debug(f"使用默认图标: {default_icon_path}")
         return send_file(default_icon_path)
     else:
         current_app.logger.warning(f"图标未找到: {plugin_id}")
         return jsonify({"error": "Icon not found"}), 404
 
+def find_legacy_icon(plugin_id, plugin=None):
+    """按插件记录、插件ID和名称查找原始图标文件，未找到时返回None"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    icons_dir = os.path.join(upload_folder, 'icons')
+    
+    # 尝试多种可能的图标文件名，按优先级排列
+    possible_icon_paths = []
+    if plugin and plugin.icon_path:
+        possible_icon_paths.append(os.path.join(upload_folder, plugin.icon_path))
+    possible_icon_paths.extend([
+        os.path.join(icons_dir, f"{plugin_id}.png"),  # 插件ID.png
+        os.path.join(icons_dir, f"{plugin_id}.jpg"),  # 插件ID.jpg
+    ])
+    
+    names = []
+    if plugin and plugin.name:
+        names.append(plugin.name)
+    # 尝试从plugins.json文件获取插件信息
+    plugin_info = plugins_store.get(plugin_id)
+    if plugin_info and plugin_info.get('name'):
+        names.append(plugin_info['name'])
+    for name in names:
+        plugin_name = name.lower().replace(' ', '_')
+        possible_icon_paths.extend([
+            os.path.join(icons_dir, f"{plugin_name}.png"),
+            os.path.join(icons_dir, f"{plugin_name}.jpg")
+        ])
+    
+    for icon_path in possible_icon_paths:
+        if os.path.isfile(icon_path):
+            return icon_path
+    return None
+
+@job_queue.handler('backfill_icon')
+def backfill_legacy_icon(plugin_id):
+    """为只有原始图标文件的旧插件生成图标变体"""
+    plugin = Plugin.query.get(plugin_id)
+    if plugin is None or plugin.icon_hash:
+        return
+    icon_path = find_legacy_icon(plugin_id, plugin)
+    if not icon_path:
+        return
+    with blob_lock():
+        try:
+            backfill_icon(plugin, icon_path)
+        except UploadError as e:
+            current_app.logger.warning(f"图标文件无效: {icon_path}: {e}")
+            return
+        db.session.commit()
+    response_cache.invalidate()
+
 @plugins_bp.route('/plugins/installed', methods=['GET'])
 def get_installed_plugins():
     """获取已安装的插件列表"""
-    installed_file = os.path.join(current_app.config['DATA_DIR'], 'installed_plugins.json')
-    if not os.path.exists(installed_file):
-        return jsonify([])
-    
-    with open(installed_file, 'r') as f:
-        installed_plugins = json.load(f)
-    
-    return jsonify(installed_plugins)
+    return jsonify(installed_plugins.all())
 
 @plugins_bp.route('/plugins/installed/<plugin_id>', methods=['POST'])
 def add_installed_plugin(plugin_id):
@@ -408,50 +657,17 @@ def add_installed_plugin(plugin_id):
     if 'id' not in plugin_data:
         plugin_data['id'] = plugin_id
     
-    # 读取当前已安装插件列表
-    installed_file = os.path.join(current_app.config['DATA_DIR'], 'installed_plugins.json')
-    installed_plugins = []
-    if os.path.exists(installed_file):
-        with open(installed_file, 'r') as f:
-            installed_plugins = json.load(f)
-    
-    # 检查插件是否已经存在
-    existing_plugin = next((p for p in installed_plugins if p.get('id') == plugin_id), None)
-    if existing_plugin:
-        # 更新已存在的插件
-        for key, value in plugin_data.items():
-            existing_plugin[key] = value
-    else:
-        # 添加新插件
-        plugin_data['install_date'] = datetime.now().isoformat()
-        installed_plugins.append(plugin_data)
-    
-    # 保存更新后的列表
-    with open(installed_file, 'w') as f:
-        json.dump(installed_plugins, f, indent=2)
+    # 已存在时更新，否则添加并记录安装时间
+    installed_plugins.upsert(plugin_id, plugin_data)
     
     return jsonify({"success": True})
 
 @plugins_bp.route('/plugins/installed/<plugin_id>', methods=['DELETE'])
 def remove_installed_plugin(plugin_id):
     """移除已安装的插件"""
-    # 读取当前已安装插件列表
-    installed_file = os.path.join(current_app.config['DATA_DIR'], 'installed_plugins.json')
-    if not os.path.exists(installed_file):
-        return jsonify({"error": "No installed plugins"}), 404
-    
-    with open(installed_file, 'r') as f:
-        installed_plugins = json.load(f)
-    
-    # 查找并移除插件
-    updated_plugins = [p for p in installed_plugins if p.get('id') != plugin_id]
-    if len(updated_plugins) == len(installed_plugins):
+    if not installed_plugins.remove(plugin_id):
         return jsonify({"error": "Plugin not found"}), 404
     
-    # 保存更新后的列表
-    with open(installed_file, 'w') as f:
-        json.dump(updated_plugins, f, indent=2)
-    
     return jsonify({"success": True})
 
 @plugins_bp.route('/plugins/upload', methods=['POST'])
@@ -469,10 +685,13 @@ def upload_plugin():
     if not file.filename.endswith('.zip'):
         return jsonify({"error": "Invalid file format, only .zip files are allowed"}), 400
     
-    # 保存文件
+    # 校验并保存文件
     filename = secure_filename(file.filename)
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'packages', filename)
-    file.save(file_path)
+    try:
+        save_package_upload(file, filename)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    package_index.add_file(filename)
     
     return jsonify({"success": True, "filename": filename})
 
@@ -497,78 +716,15 @@ def get_plugin_download_info(plugin_id):
             return jsonify({"msg": "插件未批准，不允许下载"}), 403
         
         # 增加日志记录
-        current_app.logger.info(f"获取插件下载信息: {plugin_id}, 名称: {plugin.name}, 状态: {plugin.status}")
+        current_app.logger.debug(f"获取插件下载信息: {plugin_id}, 名称: {plugin.name}, 状态: {plugin.status}")
         
         # 构建基础URL
         host_url = request.host_url.rstrip('/')
         api_base = f"{host_url}/api/plugins"
         
-        # 获取web目录路径
-        web_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        packages_dir = os.path.join(web_dir, 'uploads', 'packages')
-        current_app.logger.info(f"查找插件包目录(web目录): {packages_dir}")
-        
-        file_exists = False
-        
-        # 确认目录存在
-        if not os.path.exists(packages_dir):
-            current_app.logger.error(f"插件包目录不存在(web目录): {packages_dir}")
-            os.makedirs(packages_dir, exist_ok=True)
-            current_app.logger.info(f"已创建插件包目录(web目录): {packages_dir}")
-        else:
-            # 列出目录内容
-            try:
-                files = os.listdir(packages_dir)
-                current_app.logger.info(f"web/uploads/packages目录内容: {files}")
-            except Exception as e:
-                current_app.logger.error(f"读取插件包目录失败(web目录): {str(e)}")
-                files = []
-            
-            # 优先级搜索策略
-            # 1. 检查数据库中记录的路径
-            if plugin.package_path:
-                full_path = os.path.join(web_dir, 'uploads', plugin.package_path)
-                if os.path.exists(full_path) and os.path.isfile(full_path):
-                    file_exists = True
-                    current_app.logger.info(f"从数据库记录确认文件存在(web目录): {full_path}")
-            
-            # 2. 特殊插件文件匹配
-            if not file_exists:
-                special_files = {
-                    'face': 'face_detector.zip',
-                    'detector': 'face_detector.zip',
-                    'skin': 'skin_analyzer.zip',
-                    'analyzer': 'skin_analyzer.zip'
-                }
-                
-                for keyword, special_file in special_files.items():
-                    if keyword in plugin.name.lower() and special_file in files:
-                        file_exists = True
-                        current_app.logger.info(f"按特殊规则确认文件存在: {special_file}")
-                        break
-            
-            # 3. 按插件ID查找
-            if not file_exists:
-                id_filename = f"{plugin_id}.zip"
-                if id_filename in files:
-                    file_exists = True
-                    current_app.logger.info(f"按ID确认文件存在: {id_filename}")
-            
-            # 4. 按插件名称查找
-            if not file_exists:
-                name_filename = f"{plugin.name.lower().replace(' ', '_')}.zip"
-                if name_filename in files:
-                    file_exists = True
-                    current_app.logger.info(f"按名称确认文件存在: {name_filename}")
-            
-            # 5. 按包含插件名称的文件查找
-            if not file_exists:
-                plugin_name_lower = plugin.name.lower().replace(' ', '_')
-                for filename in files:
-                    if plugin_name_lower in filename.lower():
-                        file_exists = True
-                        current_app.logger.info(f"按名称部分匹配确认文件存在: {filename}")
-                        break
+        # 从插件包索引确认文件是否存在
+        full_path = package_index.resolve(plugin)
+        file_exists = full_path is not None
         
         # 构建下载URL
         download_url = f"{api_base}/{plugin_id}/download"
@@ -576,18 +732,10 @@ def get_plugin_download_info(plugin_id):
         # 构建图标URL
         icon_url = f"{api_base}/{plugin_id}/icon"
         
-        # 如果存在图标文件但没有数据库记录，更新数据库
-        icons_dir = os.path.join(web_dir, 'uploads', 'icons')
-        if os.path.exists(icons_dir):
-            icon_filename = f"{plugin_id}.png"
-            icon_path = os.path.join(icons_dir, icon_filename)
-            
-            if os.path.exists(icon_path) and not plugin.icon_path:
-                # 更新数据库记录
-                rel_path = os.path.join('icons', icon_filename)
-                plugin.icon_path = rel_path
-                db.session.commit()
-                current_app.logger.info(f"更新了图标路径到数据库: {rel_path}")
+        # 如果存在图标文件但没有数据库记录，在后台生成图标变体并更新数据库
+        if not plugin.icon_path and not plugin.icon_hash and \
+                os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], 'icons', f"{plugin_id}.png")):
+            job_queue.enqueue('backfill_icon', plugin_id=plugin_id)
         
         # 返回下载信息
         result = {
@@ -598,8 +746,12 @@ def get_plugin_download_info(plugin_id):
             "plugin_id": plugin_id,
             "file_exists": file_exists
         }
+        if file_exists and plugin.package_sha256 and \
+                os.path.join(current_app.config['UPLOAD_FOLDER'], plugin.package_path) == full_path:
+            result["sha256"] = plugin.package_sha256
+            result["size"] = plugin.package_size
         
-        current_app.logger.info(f"获取到插件下载信息: {result}")
+        current_app.logger.debug(f"获取到插件下载信息: {result}")
         return jsonify(result)
         
     except Exception as e:
@@ -614,14 +766,14 @@ def direct_plugin_download(plugin_path):
     直接从public/plugins目录下载插件
     用于下载预置的插件包，如人脸检测和肤色分析插件
     """
-    current_app.logger.info(f"请求直接下载插件: {plugin_path}")
+    current_app.logger.debug(f"请求直接下载插件: {plugin_path}")
     
     # 构建插件文件路径
     web_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     plugins_dir = os.path.join(web_dir, 'public', 'plugins')
     full_path = os.path.join(plugins_dir, plugin_path)
     
-    current_app.logger.info(f"插件文件路径: {full_path}")
+    current_app.logger.debug(f"插件文件路径: {full_path}")
     
     # 检查文件是否存在
     if not os.path.exists(full_path) or not os.path.isfile(full_path):
@@ -634,21 +786,21 @@ def direct_plugin_download(plugin_path):
         return jsonify({"error": "Not a zip file"}), 400
     
     # 返回文件
-    current_app.logger.info(f"发送插件文件: {full_path}")
+    current_app.logger.debug(f"发送插件文件: {full_path}")
     return send_file(full_path, as_attachment=True)
 
 @plugins_bp.route('/manifest', methods=['GET'])
+@response_cache.cached(key_func=manifest_mtime)
 def get_plugins_manifest():
     """
     获取插件清单，提供可用插件的元数据
     """
-    current_app.logger.info("请求插件清单")
+    current_app.logger.debug("请求插件清单")
     
     # 构建清单文件路径
-    web_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    manifest_path = os.path.join(web_dir, 'public', 'plugins', 'manifest', 'plugins.json')
+    manifest_path = get_manifest_path()
     
-    current_app.logger.info(f"插件清单路径: {manifest_path}")
+    current_app.logger.debug(f"插件清单路径: {manifest_path}")
     
     # 检查文件是否存在
     if not os.path.exists(manifest_path) or not os.path.isfile(manifest_path):
@@ -659,7 +811,7 @@ def get_plugins_manifest():
     try:
         with open(manifest_path, 'r') as f:
             manifest = json.load(f)
-        current_app.logger.info("成功读取插件清单")
+        current_app.logger.debug("成功读取插件清单")
         return jsonify(manifest)
     except Exception as e:
         current_app.logger.error(f"读取插件清单出错: {str(e)}")
@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from flask import Blueprint, jsonify, current_app
+from flask import Blueprint, jsonify, current_app, Response
 import platform
 import os
 
+from utils.metrics import request_metrics
+
 server_bp = Blueprint('server', __name__)
 
 @server_bp.route('/status', methods=['GET'])
@@ -18,4 +20,9 @@ def get_server_status():
         'version': server_version,
         'platform': platform.platform(),
         'python_version': platform.python_version()
-    }) 
\ No newline at end of file
+    }) 
+
+@server_bp.route('/metrics', methods=['GET'])
+def get_server_metrics():
+    """Prometheus格式的请求统计"""
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,150 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py 在导入时即完成配置和初始化，因此需要先把数据库和上传目录指向临时目录
+TEST_ROOT = tempfile.mkdtemp(prefix='edgeplughub-test-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TEST_ROOT, 'test.db')}"
+os.environ['UPLOAD_FOLDER'] = os.path.join(TEST_ROOT, 'uploads')
+os.environ['DATA_DIR'] = os.path.join(TEST_ROOT, 'data')
+os.makedirs(os.environ['DATA_DIR'], exist_ok=True)
+# 测试中频繁登录和下载，默认关闭限速，由 test_ratelimit.py 单独开启
+os.environ['RATELIMIT_ENABLED'] = 'false'
+# 后台任务在请求中同步执行，由 test_jobs.py 单独测试队列
+os.environ['JOBS_EAGER'] = 'true'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app  # noqa: E402
+from models import db, User, Plugin  # noqa: E402
+from utils.cache import response_cache  # noqa: E402
+from utils.counters import download_counter  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        yield flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_plugins(app):
+    """批量创建测试插件，每个插件有单独的作者，测试结束后删除"""
+    created = []
+
+    def _make(count, status='approved', category='Testing'):
+        plugins = []
+        for i in range(count):
+            n = len(created) + i
+            author = User(username=f'author{n}', email=f'author{n}@example.com', password_hash='x')
+            db.session.add(author)
+            db.session.flush()
+            plugin = Plugin(
+                name=f'Test Plugin {n}',
+                short_description='测试插件',
+                description='测试插件描述',
+                version='1.0.0',
+                author_id=author.id,
+                package_path=f'packages/test_{n}.zip',
+                category=category,
+                status=status
+            )
+            db.session.add(plugin)
+            plugins.append(plugin)
+        db.session.commit()
+        created.extend((p.id, p.author_id) for p in plugins)
+        response_cache.invalidate()
+        return plugins
+
+    yield _make
+
+    # 测试中的请求结束时会移除会话，按ID重新加载后删除(测试中可能已删除插件)
+    for plugin_id, author_id in created:
+        plugin = Plugin.query.get(plugin_id)
+        if plugin:
+            db.session.delete(plugin)
+        db.session.delete(User.query.get(author_id))
+    db.session.commit()
+    response_cache.invalidate()
+
+
+@pytest.fixture
+def admin_headers(client):
+    response = client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin123'})
+    return {'Authorization': f"Bearer {response.json['access_token']}"}
+
+
+@pytest.fixture
+def count_queries(app):
+    """记录执行的SQL语句"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # 先写入之前测试累计的下载次数，避免后台线程的写入被计入
+    download_counter.flush()
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+PACKAGE_FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               'public', 'plugins', 'input', 'face_detector.zip')
+
+
+@pytest.fixture
+def package_file():
+    return PACKAGE_FIXTURE
+
+
+@pytest.fixture
+def upload_plugin(client, admin_headers):
+    """通过API上传并批准一个插件，测试结束后删除"""
+    created = []
+
+    def _upload(name='Uploaded Plugin', package=PACKAGE_FIXTURE, category='Uploads', **fields):
+        with open(package, 'rb') as f:
+            data = {
+                'name': name,
+                'short_description': '上传测试',
+                'description': '上传测试插件',
+                'version': '1.0.0',
+                'category': category,
+                'package': (f, os.path.basename(package))
+            }
+            data.update(fields)
+            response = client.post('/api/plugins', data=data, headers=admin_headers,
+                                   content_type='multipart/form-data')
+        assert response.status_code == 201, response.json
+        plugin_id = response.json['id']
+        client.post(f'/api/plugins/review/{plugin_id}', json={'status': 'approved'}, headers=admin_headers)
+        created.append(plugin_id)
+        return Plugin.query.get(plugin_id)
+
+    yield _upload
+
+    for plugin_id in created:
+        plugin = Plugin.query.get(plugin_id)
+        if plugin:
+            db.session.delete(plugin)
+    db.session.commit()
+    response_cache.invalidate()
+
+
+@pytest.fixture
+def admin_session(client):
+    """登录管理后台"""
+    response = client.post('/admin/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    return client
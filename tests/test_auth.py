@@ -0,0 +1,92 @@
+from flask_jwt_extended import decode_token
+from sqlalchemy import text
+
+from models import db, User
+from utils.auth import hash_password, user_cache
+from utils.cache import USER_CACHE_VERSION, bump_shared_version
+
+
+def user_queries(statements):
+    return [s for s in statements if s.lstrip().upper().startswith('SELECT') and 'FROM user' in s]
+
+
+def login(client, username, password):
+    return client.post('/api/auth/login', json={'username': username, 'password': password})
+
+
+def test_token_carries_role_claim(client):
+    token = login(client, 'admin', 'admin123').json['access_token']
+    assert decode_token(token)['is_admin'] is True
+
+
+def test_authorization_uses_cached_identity(client, admin_headers, make_plugins, count_queries):
+    plugin = make_plugins(1, status='pending')[0]
+    client.get('/api/auth/user', headers=admin_headers)
+
+    count_queries.clear()
+    assert client.get('/api/auth/user', headers=admin_headers).json['username'] == 'admin'
+    # 状态无效时在鉴权之后返回，响应不包含作者信息
+    response = client.post(f'/api/plugins/review/{plugin.id}', json={'status': 'bogus'}, headers=admin_headers)
+    assert response.status_code == 400
+    assert user_queries(count_queries) == []
+
+
+def test_user_changes_invalidate_cache(app, client):
+    user = User(username='demoted', email='demoted@example.com', password_hash=hash_password('secret'), is_admin=True)
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+    try:
+        headers = {'Authorization': f"Bearer {login(client, 'demoted', 'secret').json['access_token']}"}
+        assert client.get('/api/auth/user', headers=headers).json['is_admin'] is True
+
+        user = User.query.get(user_id)
+        user.is_admin = False
+        db.session.commit()
+        # 令牌中的角色声明仍为管理员，但权限撤销立即生效
+        assert client.get('/api/auth/user', headers=headers).json['is_admin'] is False
+        response = client.post('/api/plugins/review/unknown', json={'status': 'approved'}, headers=headers)
+        assert response.status_code == 403
+    finally:
+        db.session.delete(User.query.get(user_id))
+        db.session.commit()
+    assert user_cache.get(user_id) is None
+
+
+def test_user_changes_from_other_processes_invalidate_cache(app, client, monkeypatch):
+    monkeypatch.setattr(user_cache, 'check_interval', 0)
+    user = User(username='remote', email='remote@example.com', password_hash=hash_password('secret'), is_admin=True)
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+    try:
+        headers = {'Authorization': f"Bearer {login(client, 'remote', 'secret').json['access_token']}"}
+        assert client.get('/api/auth/user', headers=headers).json['is_admin'] is True
+
+        # 模拟其他进程: 不经过本进程的ORM事件修改用户并递增用户缓存版本
+        db.session.execute(text("UPDATE user SET is_admin = 0 WHERE id = :id"), {'id': user_id})
+        db.session.commit()
+        bump_shared_version(USER_CACHE_VERSION)
+        assert client.get('/api/auth/user', headers=headers).json['is_admin'] is False
+    finally:
+        db.session.delete(User.query.get(user_id))
+        db.session.commit()
+
+
+def test_password_is_rehashed_with_configured_work_factor(app, client, monkeypatch):
+    user = User(username='rehash', email='rehash@example.com', password_hash=hash_password('secret'))
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+    try:
+        monkeypatch.setitem(app.config, 'PASSWORD_HASH_ITERATIONS', 1000)
+        assert login(client, 'rehash', 'secret').status_code == 200
+        password_hash = User.query.get(user_id).password_hash
+        assert password_hash.startswith('pbkdf2:sha256:1000$')
+
+        assert login(client, 'rehash', 'wrong').status_code == 401
+        assert login(client, 'rehash', 'secret').status_code == 200
+        assert User.query.get(user_id).password_hash == password_hash
+    finally:
+        db.session.delete(User.query.get(user_id))
+        db.session.commit()
@@ -0,0 +1,60 @@
+import threading
+
+from benchmarks import compare, harness
+from models import db, Plugin
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert harness.percentile(values, 50) == 50
+    assert harness.percentile(values, 95) == 95
+    assert harness.percentile(values, 99) == 99
+    assert harness.percentile([7], 99) == 7
+    assert harness.percentile([], 50) is None
+
+
+def test_test_client_driver_reports_latency_and_queries(app, make_plugins):
+    plugin_ids = [p.id for p in make_plugins(3)]
+    result = harness.run_test_client(app, lambda i: ('GET', f'/api/plugins/{plugin_ids[i % 3]}', {}), 9)
+    assert result['requests'] == 9
+    assert result['errors'] == 0
+    assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+    assert result['queries_per_request'] >= 1
+
+
+def test_query_counter_ignores_background_threads(app, client, make_plugins):
+    plugin_id = make_plugins(1)[0].id
+
+    def background():
+        with app.app_context():
+            Plugin.query.count()
+
+    with harness.QueryCounter(db.get_engine(app)) as queries:
+        thread = threading.Thread(target=background)
+        thread.start()
+        thread.join()
+        assert queries.count == 0
+        client.get(f'/api/plugins/{plugin_id}')
+        assert queries.count >= 1
+
+
+def test_compare_flags_latency_and_query_regressions():
+    base = {
+        (1000, 'wsgi', 'get_plugins'): {'p95_ms': 10.0, 'queries_per_request': 1.0},
+        (1000, 'wsgi', 'get_plugin'): {'p95_ms': 2.0, 'queries_per_request': 1.0},
+        (1000, 'wsgi', 'auth_login'): {'p95_ms': 100.0, 'queries_per_request': 1.0},
+    }
+    new = {
+        (1000, 'wsgi', 'get_plugins'): {'p95_ms': 11.0, 'queries_per_request': 1.0},
+        (1000, 'wsgi', 'get_plugin'): {'p95_ms': 2.0, 'queries_per_request': 3.0},
+        (1000, 'wsgi', 'auth_login'): {'p95_ms': 150.0, 'queries_per_request': 1.0},
+    }
+    _, regressions = compare.compare(base, new, threshold=0.2)
+    assert sorted(regressions) == [(1000, 'wsgi', 'auth_login'), (1000, 'wsgi', 'get_plugin')]
+
+
+def test_compare_tolerates_occasional_queries():
+    base = {(1000, 'wsgi', 'get_plugins'): {'p95_ms': 10.0, 'queries_per_request': 1.0}}
+    new = {(1000, 'wsgi', 'get_plugins'): {'p95_ms': 10.0, 'queries_per_request': 1.02}}
+    assert compare.compare(base, new, threshold=0.2)[1] == []
+    assert compare.compare(base, new, threshold=0.2, query_tolerance=0)[1] == [(1000, 'wsgi', 'get_plugins')]
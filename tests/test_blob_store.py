@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+
+from werkzeug.datastructures import FileStorage
+
+from models import db, Plugin
+from utils.blob_store import blob_lock, release_package
+from utils.uploads import save_package_upload
+
+
+def test_identical_packages_share_one_blob(app, upload_plugin, admin_session):
+    first = upload_plugin(name='Fork A')
+    second = upload_plugin(name='Fork B')
+    assert first.package_path == second.package_path == os.path.join('packages', f'{first.package_sha256}.zip')
+    blob = os.path.join(app.config['UPLOAD_FOLDER'], first.package_path)
+
+    admin_session.post(f'/admin/plugins/{first.id}/delete')
+    assert os.path.exists(blob)
+    assert admin_session.get(f'/api/plugins/{second.id}/download').status_code == 200
+
+    admin_session.post(f'/admin/plugins/{second.id}/delete')
+    assert not os.path.exists(blob)
+    assert admin_session.get(f'/api/plugins/{second.id}/download-info').status_code != 200
+
+
+def test_delete_waits_for_concurrent_upload_commit(app, upload_plugin, package_file):
+    """删除插件时若另一个上传已写入同一插件包但尚未提交，引用计数须等到上传提交后再统计"""
+    existing = upload_plugin(name='Fork C')
+    existing_id, author_id, package_path = existing.id, existing.author_id, existing.package_path
+    blob = os.path.join(app.config['UPLOAD_FOLDER'], package_path)
+    claimed, created = threading.Event(), []
+
+    def upload():
+        with app.app_context():
+            with blob_lock(), open(package_file, 'rb') as f:
+                path, sha256, size = save_package_upload(FileStorage(f, 'fork.zip'))
+                claimed.set()
+                time.sleep(0.2)
+                plugin = Plugin(name='Fork D', short_description='x', description='x', version='1.0.0',
+                                author_id=author_id, package_path=path, package_sha256=sha256,
+                                package_size=size, category='Uploads')
+                db.session.add(plugin)
+                db.session.commit()
+                created.append(plugin.id)
+            db.session.remove()
+
+    thread = threading.Thread(target=upload)
+    thread.start()
+    try:
+        assert claimed.wait(5)
+        db.session.delete(Plugin.query.get(existing_id))
+        db.session.commit()
+        assert release_package(package_path) is None
+        assert os.path.exists(blob)
+    finally:
+        thread.join()
+        for plugin_id in created:
+            db.session.delete(Plugin.query.get(plugin_id))
+        db.session.commit()
+        release_package(package_path)
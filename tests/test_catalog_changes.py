@@ -0,0 +1,111 @@
+from models import db, Plugin
+from utils.cache import response_cache
+from utils.changes import reconcile_change_log
+from utils.facets import rebuild_category_facets
+
+
+def poll(client, token, **params):
+    response = client.get('/api/plugins/changes', query_string={'since': token, **params})
+    assert response.status_code == 200
+    return response.json
+
+
+def ids(plugins):
+    return [p['id'] for p in plugins]
+
+
+def edit(plugin_id, **values):
+    plugin = Plugin.query.get(plugin_id)
+    for key, value in values.items():
+        setattr(plugin, key, value)
+    db.session.commit()
+    response_cache.invalidate()
+
+
+def test_full_sync_then_deltas(client, make_plugins, admin_headers):
+    snapshot = poll(client, '')
+    assert not snapshot['reset'] and not snapshot['more']
+    assert snapshot['updated'] == [] and snapshot['removed'] == []
+    token = snapshot['token']
+    assert poll(client, token) == {'token': token, 'added': [], 'updated': [], 'removed': [],
+                                   'more': False, 'reset': False}
+
+    approved = make_plugins(1, category='Changes')[0].id
+    pending = make_plugins(1, status='pending', category='Changes')[0].id
+    delta = poll(client, token)
+    assert ids(delta['added']) == [approved]
+    assert int(delta['token']) > int(token)
+    token = delta['token']
+
+    client.post(f'/api/plugins/review/{pending}', json={'status': 'approved'}, headers=admin_headers)
+    edit(approved, name='Renamed')
+    delta = poll(client, token)
+    assert ids(delta['added']) == [pending]
+    assert [p['name'] for p in delta['updated']] == ['Renamed']
+    token = delta['token']
+
+    # 下载量变化不计为修改
+    edit(approved, downloads=999)
+    assert poll(client, token)['token'] == token
+
+    client.post(f'/api/plugins/review/{pending}', json={'status': 'rejected'}, headers=admin_headers)
+    delta = poll(client, token)
+    assert delta['removed'] == [pending] and delta['added'] == [] and delta['updated'] == []
+
+
+def test_plugin_added_and_removed_between_polls_is_omitted(client, make_plugins, admin_headers):
+    token = poll(client, '')['token']
+    plugin_id = make_plugins(1, category='Changes')[0].id
+    client.post(f'/api/plugins/review/{plugin_id}', json={'status': 'rejected'}, headers=admin_headers)
+    delta = poll(client, token)
+    assert delta['added'] == [] and delta['removed'] == []
+    assert int(delta['token']) > int(token)
+
+
+def test_changes_are_paginated_by_token(client, make_plugins):
+    token = poll(client, '')['token']
+    created = [p.id for p in make_plugins(3, category='Changes')]
+    seen = []
+    while True:
+        delta = poll(client, token, limit=2, fields='id')
+        seen.extend(ids(delta['added']))
+        token = delta['token']
+        if not delta['more']:
+            break
+    assert seen == created
+    assert delta['added'] == [] or list(delta['added'][0]) == ['id']
+
+
+def test_token_ahead_of_server_resets(client):
+    latest = int(poll(client, '')['token'])
+    delta = poll(client, str(latest + 1000))
+    assert delta['reset']
+    assert delta['token'] == str(latest)
+
+
+def test_invalid_token(client):
+    response = client.get('/api/plugins/changes?since=abc')
+    assert response.status_code == 400
+
+
+def test_reconcile_records_bulk_changes(app, client, make_plugins):
+    plugin_id = make_plugins(1, category='Changes')[0].id
+    token = poll(client, '')['token']
+    # 绕过ORM修改的插件由 reconcile_change_log 补齐变更记录
+    Plugin.query.filter_by(id=plugin_id).update({'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+    rebuild_category_facets()
+    assert reconcile_change_log() == 1
+    response_cache.invalidate()
+    assert poll(client, token)['removed'] == [plugin_id]
+
+
+def test_changes_written_by_another_process_are_not_cached(client, make_plugins):
+    plugin_id = make_plugins(1, category='Changes')[0].id
+    token = poll(client, '')['token']
+    assert poll(client, token)['updated'] == []
+    # 其他工作进程提交的修改不会使本进程的响应缓存失效
+    plugin = Plugin.query.get(plugin_id)
+    plugin.name = 'Edited Elsewhere'
+    db.session.commit()
+    assert [p['name'] for p in poll(client, token)['updated']] == ['Edited Elsewhere']
@@ -0,0 +1,199 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+from models import db, User, Plugin, PluginFile, PluginVersion
+from utils.cache import response_cache
+from utils.catalog_io import CATALOG_MEMBER
+
+
+def export(client, headers, **params):
+    response = client.get('/api/admin/catalog/export', query_string=params, headers=headers)
+    assert response.status_code == 200
+    return response
+
+
+def records(data):
+    return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+
+def import_data(client, headers, data, mode='skip'):
+    return client.post(f'/api/admin/catalog/import?mode={mode}', data=data, headers=headers)
+
+
+def delete_plugin(plugin_id):
+    db.session.delete(Plugin.query.get(plugin_id))
+    db.session.commit()
+    response_cache.invalidate()
+
+
+def test_export_streams_ndjson(client, admin_headers, make_plugins):
+    plugin_id = make_plugins(1, category='Export')[0].id
+    response = export(client, admin_headers)
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    lines = records(response.data)
+    assert lines[0]['type'] == 'header' and lines[0]['format'] == 'edgeplughub-catalog'
+    types = [r['type'] for r in lines[1:]]
+    # 用户在插件之前导出
+    assert types == sorted(types, key=lambda t: t != 'user')
+    exported = next(r for r in lines if r.get('id') == plugin_id)
+    assert exported['category'] == 'Export' and 'password_hash' not in exported
+
+
+def test_export_requires_admin(client):
+    assert client.get('/api/admin/catalog/export').status_code == 401
+
+
+def test_round_trip_restores_deleted_plugin(client, admin_headers, make_plugins):
+    plugin_id = make_plugins(1, category='RoundTrip')[0].id
+    data = export(client, admin_headers).data
+    token = client.get('/api/plugins/changes').json['token']
+    delete_plugin(plugin_id)
+
+    response = import_data(client, admin_headers, data)
+    assert response.status_code == 200, response.json
+    assert response.json['plugins'] == 1
+    assert response.json['skipped_plugins'] >= 1
+    assert response.json['users'] == 0
+
+    assert Plugin.query.get(plugin_id).category == 'RoundTrip'
+    # 派生数据随导入重建
+    assert client.get('/api/plugins/categories').json.count('RoundTrip') == 1
+    changes = client.get(f'/api/plugins/changes?since={token}').json
+    assert plugin_id in [p['id'] for p in changes['added']]
+
+
+def test_replace_mode_overwrites_existing_plugins(client, admin_headers, make_plugins):
+    plugin_id = make_plugins(1, category='Replace')[0].id
+    data = export(client, admin_headers).data
+    plugin = Plugin.query.get(plugin_id)
+    plugin.name = 'Changed locally'
+    db.session.commit()
+    token = client.get('/api/plugins/changes').json['token']
+
+    response = import_data(client, admin_headers, data, mode='replace')
+    assert response.status_code == 200, response.json
+    assert response.json['replaced'] >= 1 and response.json['plugins'] == 0
+    assert Plugin.query.get(plugin_id).name != 'Changed locally'
+    changes = client.get(f'/api/plugins/changes?since={token}').json
+    assert plugin_id in [p['id'] for p in changes['updated']]
+
+
+def test_replace_mode_removes_dependent_rows(app, client, admin_headers, tmp_path, upload_plugin):
+    def package(name, source):
+        path = os.path.join(tmp_path, name)
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr('demo/plugin.py', source)
+        return path
+
+    plugin = upload_plugin('Replaced Plugin', package=package('v1.zip', 'VERSION = 1'))
+    plugin_id, v1_path = plugin.id, plugin.package_path
+    with open(package('v2.zip', 'VERSION = 2'), 'rb') as f:
+        response = client.post(f'/api/plugins/{plugin_id}/versions', headers=admin_headers,
+                               data={'version': '2.0.0', 'package': (f, 'v2.zip')},
+                               content_type='multipart/form-data')
+    assert response.status_code == 201, response.json
+    assert PluginVersion.query.filter_by(plugin_id=plugin_id).count() == 2
+    data = export(client, admin_headers).data
+
+    response = import_data(client, admin_headers, data, mode='replace')
+    assert response.status_code == 200, response.json
+    assert PluginVersion.query.filter_by(plugin_id=plugin_id).count() == 0
+    # 只被版本历史引用的旧插件包被释放，清单附属表由重新检查插件包生成
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], v1_path))
+    assert [f.path for f in PluginFile.query.filter_by(plugin_id=plugin_id)] == ['demo/plugin.py']
+    assert client.get(f'/api/plugins/{plugin_id}/download').status_code == 200
+
+
+def test_existing_users_are_matched_by_username(client, admin_headers):
+    admin = User.query.filter_by(username='admin').first()
+    lines = [
+        {'type': 'header', 'format': 'edgeplughub-catalog', 'version': 1},
+        {'type': 'user', 'id': 'other-admin-id', 'username': 'admin', 'email': 'other@example.com',
+         'password_hash': 'x', 'is_admin': True},
+        {'type': 'plugin', 'id': 'imported-plugin', 'name': 'Imported', 'short_description': 's',
+         'description': 'd', 'version': '1.0.0', 'author_id': 'other-admin-id', 'package_path': 'packages/x.zip',
+         'category': 'Imported', 'status': 'approved', 'created_at': '2024-01-02T03:04:05'},
+    ]
+    data = b''.join(json.dumps(line).encode() + b'\n' for line in lines)
+    try:
+        response = import_data(client, admin_headers, data)
+        assert response.status_code == 200, response.json
+        assert response.json['skipped_users'] == 1 and response.json['plugins'] == 1
+        plugin = Plugin.query.get('imported-plugin')
+        assert plugin.author_id == admin.id
+        assert plugin.downloads == 0
+        assert User.query.get('other-admin-id') is None
+    finally:
+        delete_plugin('imported-plugin')
+
+
+def test_invalid_imports_are_rejected_atomically(client, admin_headers):
+    assert import_data(client, admin_headers, b'{"type": "plugin"}\n').status_code == 400
+    lines = [
+        {'type': 'header', 'format': 'edgeplughub-catalog', 'version': 1},
+        {'type': 'user', 'id': 'orphan-user', 'username': 'orphan', 'email': 'orphan@example.com',
+         'password_hash': 'x'},
+        {'type': 'plugin', 'id': 'orphan-plugin', 'name': 'Orphan', 'short_description': 's', 'description': 'd',
+         'version': '1.0.0', 'author_id': 'missing-author', 'package_path': 'packages/x.zip', 'category': 'X'},
+    ]
+    data = b''.join(json.dumps(line).encode() + b'\n' for line in lines)
+    response = import_data(client, admin_headers, data)
+    assert response.status_code == 400
+    assert 'missing-author' in response.json['msg']
+    assert User.query.get('orphan-user') is None
+    assert import_data(client, admin_headers, data, mode='merge').status_code == 400
+
+
+def test_tar_export_bundles_package_blobs(app, client, admin_headers, upload_plugin):
+    plugin = upload_plugin(name='Bundled Plugin')
+    package_path = plugin.package_path
+    response = export(client, admin_headers, blobs='true')
+    assert response.mimetype == 'application/x-tar'
+    data = response.data
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r|') as tar:
+        names = [member.name for member in tar]
+    assert names[0] == CATALOG_MEMBER
+    assert package_path in names
+
+    full_path = os.path.join(app.config['UPLOAD_FOLDER'], package_path)
+    os.remove(full_path)
+    response = import_data(client, admin_headers, data)
+    assert response.status_code == 200, response.json
+    assert response.json['files'] >= 1
+    assert os.path.exists(full_path)
+
+
+def test_truncated_archive_imports_nothing(app, client, admin_headers, upload_plugin):
+    plugin = upload_plugin(name='Truncated Plugin')
+    plugin_id, package_path = plugin.id, plugin.package_path
+    data = export(client, admin_headers, blobs='true').data
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r:') as tar:
+        member = tar.getmember(package_path)
+    # 在插件包内容中间截断
+    truncated = data[:member.offset_data + member.size // 2]
+
+    delete_plugin(plugin_id)
+    upload_folder = app.config['UPLOAD_FOLDER']
+    os.remove(os.path.join(upload_folder, package_path))
+    response = import_data(client, admin_headers, truncated)
+    assert response.status_code == 400
+    assert Plugin.query.get(plugin_id) is None
+    assert not os.path.exists(os.path.join(upload_folder, package_path))
+    assert not [name for name in os.listdir(upload_folder) if name.startswith('.import-')]
+
+
+def test_cli_round_trip(app, tmp_path, make_plugins):
+    plugin_id = make_plugins(1, category='Cli')[0].id
+    path = os.path.join(tmp_path, 'catalog.ndjson')
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['catalog', 'export', '-o', path])
+    assert result.exit_code == 0, result.output
+    delete_plugin(plugin_id)
+
+    result = runner.invoke(args=['catalog', 'import', path, '--batch-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert Plugin.query.get(plugin_id) is not None
@@ -0,0 +1,83 @@
+import time
+
+from sqlalchemy import func
+
+from models import db, Plugin, CategoryFacet
+from utils.counters import download_counter
+from utils.facets import rebuild_category_facets
+
+
+def facet_counts():
+    return {f.category: (f.plugin_count, f.downloads) for f in CategoryFacet.query.all()}
+
+
+def recomputed_counts():
+    rows = db.session.query(Plugin.category, func.count(), func.sum(Plugin.downloads)) \
+        .filter(Plugin.status == 'approved').group_by(Plugin.category)
+    return {category: (count, downloads or 0) for category, count, downloads in rows}
+
+
+def test_categories_endpoint_returns_counts(client, make_plugins):
+    make_plugins(2, category='Facets')
+    make_plugins(1, status='pending', category='Facets Pending')
+
+    assert 'Facets' in client.get('/api/plugins/categories').json
+    assert 'Facets Pending' not in client.get('/api/plugins/categories').json
+    facets = {f['category']: f for f in client.get('/api/plugins/categories?counts=true').json}
+    assert facets['Facets']['count'] == 2
+    assert facets['Facets']['downloads'] == 0
+
+
+def test_category_downloads_are_not_cached_forever(app, client, make_plugins, monkeypatch):
+    monkeypatch.setitem(app.config, 'PAGE_CACHE_SECONDS', 0.05)
+    plugin_id = make_plugins(1, category='Facets Downloads')[0].id
+
+    def downloads():
+        facets = client.get('/api/plugins/categories?counts=true').json
+        return {f['category']: f['downloads'] for f in facets}['Facets Downloads']
+
+    assert downloads() == 0
+    # 下载计数写入不会使响应缓存失效
+    download_counter.increment(plugin_id, 3)
+    download_counter.flush()
+    time.sleep(0.1)
+    assert downloads() == 3
+
+
+def test_facets_follow_plugin_changes(client, make_plugins, admin_headers):
+    approved = [p.id for p in make_plugins(2, category='Facets A')]
+    pending = make_plugins(1, status='pending', category='Facets A')
+    assert facet_counts()['Facets A'] == (2, 0)
+
+    client.post(f'/api/plugins/review/{pending[0].id}', json={'status': 'approved'}, headers=admin_headers)
+    assert facet_counts()['Facets A'] == (3, 0)
+
+    plugin_id = approved[0]
+    plugin = Plugin.query.get(plugin_id)
+    download_counter.increment(plugin_id, 5)
+    download_counter.flush()
+    assert facet_counts()['Facets A'] == (3, 5)
+
+    # 会话中的下载数已过时，修改分类时仍按数据库中的下载数转移
+    plugin.category = 'Facets B'
+    db.session.commit()
+    assert facet_counts()['Facets A'] == (2, 0)
+    assert facet_counts()['Facets B'] == (1, 5)
+
+    plugin.status = 'rejected'
+    db.session.commit()
+    assert 'Facets B' not in facet_counts()
+    assert facet_counts() == recomputed_counts()
+
+    db.session.delete(Plugin.query.get(approved[1]))
+    db.session.commit()
+    assert facet_counts()['Facets A'] == (1, 0)
+    assert facet_counts() == recomputed_counts()
+
+    rebuild_category_facets()
+    assert facet_counts() == recomputed_counts()
+
+
+def test_categories_endpoint_is_index_read(client, count_queries):
+    client.get('/api/plugins/categories?counts=true&fresh=1')
+    assert not any('FROM plugin' in s for s in count_queries)
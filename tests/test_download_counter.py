@@ -0,0 +1,38 @@
+import threading
+
+from models import db, Plugin
+from utils.counters import download_counter
+
+
+def test_detail_view_does_not_write(client, make_plugins, count_queries):
+    plugin = make_plugins(1)[0]
+    count_queries.clear()
+    first = client.get(f'/api/plugins/{plugin.id}').json
+    second = client.get(f'/api/plugins/{plugin.id}').json
+    assert second['downloads'] == first['downloads'] + 1
+    assert not [s for s in count_queries if s.lstrip().upper().startswith('UPDATE')]
+    download_counter.flush()
+
+
+def test_flush_batches_increments_from_many_threads(app, make_plugins, count_queries):
+    plugin_ids = [p.id for p in make_plugins(3)]
+    download_counter.flush()
+
+    def hit():
+        for plugin_id in plugin_ids:
+            for _ in range(50):
+                download_counter.increment(plugin_id)
+
+    threads = [threading.Thread(target=hit) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    count_queries.clear()
+    assert download_counter.flush() == 3
+    assert len([s for s in count_queries if s.lstrip().upper().startswith('UPDATE PLUGIN ')]) == 1
+
+    db.session.expire_all()
+    assert [Plugin.query.get(pid).downloads for pid in plugin_ids] == [400, 400, 400]
+    assert download_counter.pending(plugin_ids[0]) == 0
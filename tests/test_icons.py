@@ -0,0 +1,153 @@
+import io
+import os
+import threading
+import time
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from models import db, Job, Plugin
+from utils import icons
+from utils.blob_store import blob_lock
+from utils.icons import ICON_SIZES, release_icon, store_icon
+from utils.jobs import job_queue
+
+
+def icon_file(width=300, height=200, color=(200, 40, 40)):
+    buf = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buf, 'PNG')
+    buf.seek(0)
+    return buf
+
+
+def open_image(response):
+    return Image.open(io.BytesIO(response.get_data()))
+
+
+def test_upload_generates_content_addressed_renditions(app, client, upload_plugin):
+    plugin = upload_plugin('Icon Plugin', icon=(icon_file(), 'icon.png'))
+    assert plugin.icon_hash
+    icon_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'icons', plugin.icon_hash)
+    assert sorted(os.listdir(icon_dir)) == sorted(f'{s}.{f}' for s in ICON_SIZES for f in ('png', 'webp'))
+
+    detail = client.get(f'/api/plugins/{plugin.id}').json
+    assert detail['icon_url'] == f'/api/plugins/icons/{plugin.icon_hash}'
+
+    response = client.get(detail['icon_url'] + '?size=48', headers={'Accept': 'image/webp,*/*'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept' in response.headers['Vary']
+    assert open_image(response).size == (64, 64)
+
+    response = client.get(detail['icon_url'] + '?size=32', headers={'Accept': '*/*'})
+    assert response.mimetype == 'image/png'
+    assert open_image(response).size == (32, 32)
+
+
+def test_identical_icons_share_renditions(upload_plugin):
+    first = upload_plugin('Icon Plugin A', icon=(icon_file(color=(1, 2, 3)), 'a.png'))
+    second = upload_plugin('Icon Plugin B', icon=(icon_file(color=(1, 2, 3)), 'b.png'))
+    assert first.icon_hash == second.icon_hash
+
+
+def test_plugin_icon_endpoint_selects_size_and_revalidates(client, upload_plugin):
+    plugin = upload_plugin('Icon Plugin', icon=(icon_file(), 'icon.png'))
+    response = client.get(f'/api/plugins/plugins/{plugin.id}/icon?size=100')
+    assert response.status_code == 200
+    assert open_image(response).size == (128, 128)
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    cached = client.get(f'/api/plugins/plugins/{plugin.id}/icon?size=100',
+                        headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+    assert client.get(f'/api/plugins/plugins/{plugin.id}/icon?size=abc').status_code == 400
+    assert client.get(f'/api/plugins/icons/{"0" * 64}').status_code == 404
+    assert client.get('/api/plugins/icons/..').status_code == 404
+
+
+def test_invalid_icon_is_rejected(client, admin_headers, package_file):
+    with open(package_file, 'rb') as f:
+        response = client.post('/api/plugins', headers=admin_headers, content_type='multipart/form-data', data={
+            'name': 'Bad Icon', 'short_description': 'x', 'description': 'x', 'version': '1.0.0',
+            'category': 'Uploads', 'package': (f, 'bad.zip'), 'icon': (io.BytesIO(b'not an image'), 'icon.png')})
+    assert response.status_code == 400
+    assert response.json['msg'] == 'Invalid icon image'
+
+
+def test_legacy_icon_is_backfilled_on_first_request(app, client, make_plugins):
+    plugin_id = make_plugins(1)[0].id
+    legacy_path = os.path.join(app.config['UPLOAD_FOLDER'], 'icons', f'{plugin_id}.png')
+    Image.new('RGB', (40, 80), (0, 128, 0)).save(legacy_path)
+    try:
+        response = client.get(f'/api/plugins/plugins/{plugin_id}/icon?size=64')
+        assert response.status_code == 200
+        assert open_image(response).size == (64, 64)
+        plugin = Plugin.query.get(plugin_id)
+        assert plugin.icon_hash
+        assert client.get(f'/api/plugins/{plugin_id}').json['icon_url'] == f'/api/plugins/icons/{plugin.icon_hash}'
+    finally:
+        os.remove(legacy_path)
+
+
+def test_source_icon_is_served_until_renditions_exist(app, client, upload_plugin, monkeypatch):
+    monkeypatch.setitem(app.config, 'JOBS_EAGER', False)
+    monkeypatch.setitem(app.config, 'JOBS_WORKERS', 0)
+    monkeypatch.setitem(app.config, 'JOBS_MAX_ATTEMPTS', 1)
+    plugin = upload_plugin('Pending Icon', icon=(icon_file(color=(7, 77, 177)), 'icon.png'))
+    icon_url = f'/api/plugins/icons/{plugin.icon_hash}'
+    try:
+        response = client.get(icon_url)
+        assert response.status_code == 200
+        assert response.mimetype == 'image/png'
+        assert response.headers['Cache-Control'] == 'no-cache'
+        assert open_image(response).size == (300, 200)
+
+        # 生成变体失败时继续返回原始文件，而不是默认图标
+        def fail(icon_hash, data):
+            raise OSError('disk full')
+        monkeypatch.setattr(icons, '_write_renditions', fail)
+        job_queue.run_pending()
+        assert Job.query.filter_by(kind='render_icon', status='failed').count() == 1
+        assert open_image(client.get(f'/api/plugins/plugins/{plugin.id}/icon')).size == (300, 200)
+    finally:
+        Job.query.delete()
+        db.session.commit()
+
+
+def test_release_waits_for_concurrent_icon_upload(app, client, upload_plugin):
+    """删除插件时若另一个上传已保存同一图标但尚未提交，引用计数须等到上传提交后再统计"""
+    existing = upload_plugin('Icon Fork A', icon=(icon_file(color=(9, 9, 9)), 'a.png'))
+    existing_id, author_id, icon_hash = existing.id, existing.author_id, existing.icon_hash
+    icon_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'icons', icon_hash)
+    claimed, created = threading.Event(), []
+
+    def upload():
+        with app.app_context():
+            with blob_lock():
+                stored = store_icon(FileStorage(icon_file(color=(9, 9, 9)), 'b.png'))
+                claimed.set()
+                time.sleep(0.2)
+                plugin = Plugin(name='Icon Fork B', short_description='x', description='x', version='1.0.0',
+                                author_id=author_id, package_path='packages/none.zip', icon_hash=stored,
+                                category='Uploads')
+                db.session.add(plugin)
+                db.session.commit()
+                created.append(plugin.id)
+            db.session.remove()
+
+    thread = threading.Thread(target=upload)
+    thread.start()
+    try:
+        assert claimed.wait(5)
+        db.session.delete(Plugin.query.get(existing_id))
+        db.session.commit()
+        assert release_icon(icon_hash) is False
+        assert os.path.isdir(icon_dir)
+    finally:
+        thread.join()
+        for plugin_id in created:
+            db.session.delete(Plugin.query.get(plugin_id))
+        db.session.commit()
+        release_icon(icon_hash)
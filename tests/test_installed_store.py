@@ -0,0 +1,84 @@
+import json
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from utils.installed_store import InstalledPluginsStore
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / 'installed_plugins.json')
+
+
+def _write_many(path, worker, count, compact_threshold):
+    store = InstalledPluginsStore(path, compact_threshold=compact_threshold)
+    for i in range(count):
+        store.upsert(f'{worker}-{i}', {'version': '1.0.0'})
+
+
+def test_parallel_writers_do_not_lose_updates(store_path):
+    ctx = multiprocessing.get_context('fork')
+    processes = [ctx.Process(target=_write_many, args=(store_path, f'p{n}', 50, 40)) for n in range(4)]
+    threads = [threading.Thread(target=_write_many, args=(store_path, f't{n}', 50, 40)) for n in range(4)]
+    for worker in processes + threads:
+        worker.start()
+    for worker in processes + threads:
+        worker.join()
+    assert all(p.exitcode == 0 for p in processes)
+
+    records = InstalledPluginsStore(store_path).all()
+    assert len(records) == 400
+    assert {r['id'] for r in records} == {f'{w}{n}-{i}' for w in 'pt' for n in range(4) for i in range(50)}
+
+
+def test_updates_merge_and_keep_install_date(store_path):
+    store = InstalledPluginsStore(store_path)
+    store.upsert('a', {'id': 'a', 'version': '1.0.0'})
+    install_date = store.get('a')['install_date']
+    store.upsert('a', {'id': 'a', 'version': '1.1.0'})
+
+    reloaded = InstalledPluginsStore(store_path)
+    assert reloaded.get('a') == {'id': 'a', 'version': '1.1.0', 'install_date': install_date}
+    assert reloaded.remove('a')
+    assert not reloaded.remove('a')
+    assert store.all() == []
+
+
+def test_compaction_writes_snapshot_and_truncates_log(store_path):
+    store = InstalledPluginsStore(store_path, compact_threshold=3)
+    for plugin_id in 'abc':
+        store.upsert(plugin_id, {'id': plugin_id})
+    with open(store_path) as f:
+        assert [r['id'] for r in json.load(f)] == ['a', 'b', 'c']
+    assert os.path.getsize(store_path + '.log') == 0
+    store.remove('b')
+    assert [r['id'] for r in InstalledPluginsStore(store_path).all()] == ['a', 'c']
+
+
+def test_torn_log_tail_is_ignored(store_path):
+    store = InstalledPluginsStore(store_path)
+    store.upsert('a', {'id': 'a'})
+    with open(store_path + '.log', 'ab') as f:
+        f.write(b'{"op": "upsert", "id": "b"')
+    assert [r['id'] for r in InstalledPluginsStore(store_path).all()] == ['a']
+
+
+def test_write_after_torn_log_tail(store_path):
+    store = InstalledPluginsStore(store_path)
+    store.upsert('a', {'id': 'a'})
+    with open(store_path + '.log', 'ab') as f:
+        f.write(b'{"op": "upsert", "id": "b"')
+    store.upsert('c', {'id': 'c'})
+    assert [r['id'] for r in store.all()] == ['a', 'c']
+    assert [r['id'] for r in InstalledPluginsStore(store_path).all()] == ['a', 'c']
+
+
+def test_installed_plugin_endpoints(client):
+    assert client.post('/api/plugins/plugins/installed/demo', json={'version': '1.0.0'}).json == {'success': True}
+    installed = client.get('/api/plugins/plugins/installed').json
+    assert [p['id'] for p in installed] == ['demo']
+    assert client.delete('/api/plugins/plugins/installed/demo').status_code == 200
+    assert client.delete('/api/plugins/plugins/installed/demo').status_code == 404
@@ -0,0 +1,175 @@
+import io
+import os
+import shutil
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+
+from models import db, Job, Plugin
+from utils.jobs import job_queue
+from utils.package_index import package_index
+from utils.package_scan import enqueue_scan
+
+
+@pytest.fixture
+def deferred_jobs(app, monkeypatch):
+    """任务只入队不执行，由测试调用 run_pending"""
+    monkeypatch.setitem(app.config, 'JOBS_EAGER', False)
+    monkeypatch.setitem(app.config, 'JOBS_WORKERS', 0)
+    monkeypatch.setitem(app.config, 'JOBS_RETRY_DELAY', 0)
+    calls = []
+    monkeypatch.setitem(job_queue.handlers, 'record', lambda **kwargs: calls.append(kwargs))
+    yield calls
+    Job.query.delete()
+    db.session.commit()
+
+
+def write_zip(path, files, compression=zipfile.ZIP_DEFLATED):
+    with zipfile.ZipFile(path, 'w', compression) as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return path
+
+
+def test_jobs_are_durable_until_run(deferred_jobs):
+    job_id = job_queue.enqueue('record', n=1)
+    assert job_queue.enqueue('record', n=1) == job_id
+    job_queue.enqueue('record', n=2)
+    assert deferred_jobs == []
+    assert Job.query.get(job_id).status == 'queued'
+
+    assert job_queue.run_pending() == 2
+    assert deferred_jobs == [{'n': 1}, {'n': 2}]
+    assert Job.query.count() == 0
+
+
+def test_failed_jobs_are_retried_then_kept(app, deferred_jobs, monkeypatch):
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        raise RuntimeError('boom')
+
+    monkeypatch.setitem(job_queue.handlers, 'flaky', flaky)
+    monkeypatch.setitem(app.config, 'JOBS_MAX_ATTEMPTS', 2)
+    job_id = job_queue.enqueue('flaky')
+    job_queue.run_pending()
+    job = Job.query.get(job_id)
+    assert len(attempts) == 2
+    assert job.status == 'failed' and job.attempts == 2
+    assert job.error == 'RuntimeError: boom'
+
+    assert job_queue.retry_failed() == 1
+    assert Job.query.get(job_id).status == 'queued'
+
+
+def test_recover_requeues_interrupted_jobs(deferred_jobs):
+    job_id = job_queue.enqueue('record')
+    job = Job.query.get(job_id)
+    job.status, job.started_at = 'running', datetime.utcnow() - timedelta(hours=1)
+    db.session.commit()
+    assert job_queue.recover() == 1
+    job_queue.run_pending()
+    assert deferred_jobs == [{}]
+
+
+def test_upload_returns_before_scan(client, deferred_jobs, upload_plugin):
+    plugin_id = upload_plugin('Deferred Scan').id
+    assert Plugin.query.get(plugin_id).scan_status == 'pending'
+    job_queue.run_pending()
+    assert Plugin.query.get(plugin_id).scan_status == 'passed'
+
+
+def test_upload_scan_results(client, admin_headers, admin_session, upload_plugin):
+    plugin = upload_plugin('Scanned Plugin')
+    assert plugin.scan_status == 'passed'
+    scan = plugin.scan
+    assert scan['problems'] == []
+    assert scan['sha256'] == plugin.package_sha256
+    assert scan['entries'] == 9
+    assert scan['manifest']['name'] == 'Face Detector'
+    assert scan['manifest_path'].endswith('face_detector/manifest.json')
+
+    response = client.get(f'/api/admin/plugins/{plugin.id}/scan', headers=admin_headers)
+    assert response.json['status'] == 'passed'
+    assert response.json['result']['manifest']['version'] == '1.0.0'
+
+    assert '通过' in admin_session.get('/admin/plugins').get_data(as_text=True)
+    page = admin_session.get(f'/admin/plugins/{plugin.id}/edit').get_data(as_text=True)
+    assert 'Face Detector 1.0.0' in page
+
+
+def test_corrupt_package_fails_scan(tmp_path, upload_plugin):
+    path = write_zip(os.path.join(tmp_path, 'corrupt.zip'), {'manifest.json': '{"name": "x"}', 'plugin.py': 'x' * 1000},
+                     compression=zipfile.ZIP_STORED)
+    with open(path, 'r+b') as f:
+        data = f.read()
+        f.seek(data.index(b'x' * 100))
+        f.write(b'y')
+    plugin = upload_plugin('Corrupt Plugin', package=path)
+    assert plugin.scan_status == 'failed'
+    assert plugin.scan['problems'] == ['Corrupt entry in zip package: plugin.py']
+
+
+def test_compression_bomb_is_not_decompressed(tmp_path, upload_plugin):
+    path = write_zip(os.path.join(tmp_path, 'bomb.zip'), {'zeros.bin': b'\0' * (10 * 1024 * 1024)})
+    plugin = upload_plugin('Bomb Plugin', package=path)
+    assert plugin.scan_status == 'failed'
+    assert plugin.scan['problems'][0].startswith('Compression ratio')
+
+
+def test_scan_backfills_legacy_checksum(app, make_plugins, package_file):
+    plugin = make_plugins(1)[0]
+    plugin_id, package_path = plugin.id, plugin.package_path
+    full_path = os.path.join(app.config['UPLOAD_FOLDER'], package_path)
+    shutil.copy(package_file, full_path)
+    package_index.register(plugin_id, plugin.name, package_path)
+    try:
+        enqueue_scan(plugin_id)
+        plugin = Plugin.query.get(plugin_id)
+        assert plugin.scan_status == 'passed'
+        assert plugin.package_size == os.path.getsize(package_file)
+        assert plugin.package_sha256 == plugin.scan['sha256']
+    finally:
+        os.remove(full_path)
+
+
+def test_scan_of_plugin_uploaded_by_another_process(deferred_jobs, upload_plugin):
+    plugin_id = upload_plugin('Elsewhere Plugin').id
+    # 插件由其他进程上传，执行检查任务的进程的插件包索引中没有该插件
+    package_index.discard(plugin_id)
+    job_queue.run_pending()
+    assert Plugin.query.get(plugin_id).scan_status == 'passed'
+
+
+def test_download_info_backfills_legacy_icon_in_background(app, client, make_plugins):
+    plugin_id = make_plugins(1)[0].id
+    legacy_path = os.path.join(app.config['UPLOAD_FOLDER'], 'icons', f'{plugin_id}.png')
+    buf = io.BytesIO()
+    Image.new('RGB', (40, 40), (0, 0, 200)).save(buf, 'PNG')
+    with open(legacy_path, 'wb') as f:
+        f.write(buf.getvalue())
+    try:
+        assert client.get(f'/api/plugins/{plugin_id}/download-info').status_code == 200
+        plugin = Plugin.query.get(plugin_id)
+        assert plugin.icon_hash
+        assert client.get(f'/api/plugins/icons/{plugin.icon_hash}').status_code == 200
+    finally:
+        os.remove(legacy_path)
+
+
+def test_worker_threads_run_jobs(deferred_jobs, monkeypatch, app):
+    monkeypatch.setitem(app.config, 'JOBS_WORKERS', 1)
+    monkeypatch.setitem(app.config, 'JOBS_POLL_INTERVAL', 0.05)
+    try:
+        job_queue.enqueue('record', n=3)
+        for _ in range(100):
+            if deferred_jobs:
+                break
+            time.sleep(0.05)
+        assert deferred_jobs == [{'n': 3}]
+    finally:
+        job_queue.shutdown()
@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+from utils import json_store
+
+
+@pytest.fixture
+def plugins_file(app):
+    path = os.path.join(app.config['DATA_DIR'], 'plugins.json')
+
+    def write(records):
+        with open(path, 'w') as f:
+            json.dump(records, f)
+        # 确保mtime变化可被检测到
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+    yield write
+    os.remove(path)
+
+
+def test_lookups_use_in_memory_index(client, plugins_file, monkeypatch):
+    plugins_file([
+        {'id': 'a', 'name': 'A', 'category': 'vision'},
+        {'id': 'b', 'name': 'B', 'category': 'audio'},
+        {'id': 'c', 'name': 'C'}
+    ])
+    assert client.get('/api/plugins/plugins/b').json['name'] == 'B'
+
+    loads = []
+    monkeypatch.setattr(json_store.json, 'load', lambda f: loads.append(f))
+    assert client.get('/api/plugins/plugins/a').json['name'] == 'A'
+    assert client.get('/api/plugins/plugins/missing').status_code == 404
+    assert [p['id'] for p in client.get('/api/plugins/plugins/available?category=vision').json] == ['a']
+    assert sorted(client.get('/api/plugins/plugins/categories').json) == ['audio', 'vision', '未分类']
+    assert loads == []
+
+
+def test_store_reloads_when_file_changes(client, plugins_file):
+    plugins_file([{'id': 'a', 'name': 'Old'}])
+    assert client.get('/api/plugins/plugins/a').json['name'] == 'Old'
+    plugins_file([{'id': 'a', 'name': 'Renamed'}])
+    assert client.get('/api/plugins/plugins/a').json['name'] == 'Renamed'
+
+
+def test_missing_file_returns_empty_list(client):
+    assert client.get('/api/plugins/plugins/available').json == []
+
+
+def test_available_plugins_stream(client, plugins_file):
+    records = [{'id': str(i), 'name': f'插件{i}'} for i in range(3)]
+    plugins_file(records)
+    response = client.get('/api/plugins/plugins/available', headers={'Accept': 'application/x-ndjson'})
+    assert response.is_streamed
+    assert [json.loads(line) for line in response.data.splitlines()] == records
+    response = client.get('/api/plugins/plugins/available?stream=true')
+    assert json.loads(response.data) == client.get('/api/plugins/plugins/available').json == records
@@ -0,0 +1,112 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+from models import PluginDependency, PluginFile
+from utils.manifests import python_range, encode_version
+
+
+def write_package(path, manifest, files=None):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('demo/manifest.json', json.dumps(manifest))
+        for name, data in (files or {'plugin.py': 'print(1)'}).items():
+            zf.writestr(f'demo/{name}', data)
+    return path
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('>=3.7', (30700, None)),
+    ('>=3.7,<3.12', (30700, 31200)),
+    ('==3.9.*', (30900, 31000)),
+    ('~=3.8', (30800, 40000)),
+    ('<=3.11', (None, 31101)),
+    ('!=3.8,>=3', (30000, None)),
+])
+def test_python_range(spec, expected):
+    assert python_range(spec) == expected
+
+
+@pytest.mark.parametrize('spec', ['>=3.12,<3.8', 'python3', '>=3.100'])
+def test_python_range_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        python_range(spec)
+
+
+def test_encode_version():
+    assert encode_version('3.9') == encode_version((3, 9, 0)) == 30900
+    with pytest.raises(ValueError):
+        encode_version('3.x')
+
+
+def test_upload_indexes_manifest(client, upload_plugin, package_file):
+    plugin = upload_plugin('Indexed Plugin')
+    assert plugin.entry_point == 'plugin.py'
+    assert plugin.file_count == 9
+    with zipfile.ZipFile(package_file) as zf:
+        assert plugin.installed_size == sum(i.file_size for i in zf.infolist())
+
+    dependency = PluginDependency.query.filter_by(plugin_id=plugin.id, name='mediapipe').one()
+    assert dependency.specifier == '>=0.8.9'
+    assert dependency.marker == 'python_version >= "3.7"'
+
+    manifest = client.get(f'/api/plugins/{plugin.id}').json['manifest']
+    assert manifest['capabilities'] == ['face_detection']
+    assert manifest['platforms'] == []
+    assert 'opencv-python>=4.5.0' in manifest['dependencies']
+
+    files = client.get(f'/api/plugins/{plugin.id}/files').json
+    assert len(files) == 9
+    assert files[0]['path'].startswith('fitverse/plugins/input/face_detector/')
+
+
+def test_unscanned_plugin_has_no_manifest(client, make_plugins):
+    plugin_id = make_plugins(1)[0].id
+    assert client.get(f'/api/plugins/{plugin_id}').json['manifest'] is None
+    assert client.get(f'/api/plugins/{plugin_id}/files').status_code == 404
+
+
+def test_compatibility_filter(client, tmp_path, upload_plugin):
+    arm = upload_plugin('ARM Plugin', package=write_package(os.path.join(tmp_path, 'arm.zip'), {
+        'runtime': {'python': '>=3.8', 'platforms': ['linux-aarch64'], 'min_memory_mb': 512},
+        'capabilities': ['pose'],
+        'plugin_dependencies': ['ARM_Base>=1.0']
+    }), category='Devices').id
+    legacy = upload_plugin('Legacy Plugin', package=write_package(os.path.join(tmp_path, 'legacy.zip'), {
+        'python_requires': '<3.8',
+        'platforms': ['linux-x86_64', 'windows-amd64']
+    }), category='Devices').id
+    generic = upload_plugin('Generic Plugin', package=write_package(os.path.join(tmp_path, 'generic.zip'), {
+        'name': 'generic'
+    }), category='Devices').id
+
+    def compatible(**args):
+        response = client.get('/api/plugins/compatible', query_string=dict(args, category='Devices'))
+        assert response.status_code == 200, response.json
+        return {p['id'] for p in response.json}
+
+    assert compatible() == {arm, legacy, generic}
+    assert compatible(platform='linux-aarch64') == {arm, generic}
+    assert compatible(platform='Windows-AMD64') == {legacy, generic}
+    assert compatible(python='3.7') == {legacy, generic}
+    assert compatible(python='3.11', memory=256) == {generic}
+    assert compatible(capability='pose') == {arm}
+
+    dependency = PluginDependency.query.filter_by(plugin_id=arm, kind='plugin').one()
+    assert dependency.name == 'arm-base'
+    assert PluginFile.query.filter_by(plugin_id=arm).count() == 2
+
+    assert client.get('/api/plugins/compatible?python=three').status_code == 400
+    assert client.get('/api/plugins/compatible?memory=-1').status_code == 400
+
+
+def test_invalid_manifest_fails_scan(tmp_path, upload_plugin):
+    plugin = upload_plugin('Bad Manifest', package=write_package(os.path.join(tmp_path, 'bad.zip'), {
+        'python_requires': '>=3.12,<3.8',
+        'dependencies': ['not a requirement!']
+    }))
+    assert plugin.scan_status == 'failed'
+    assert plugin.scan['problems'] == ['Unsatisfiable python_requires: >=3.12,<3.8',
+                                       'Invalid python dependency in manifest: not a requirement!']
+    assert plugin.python_requires is None
@@ -0,0 +1,63 @@
+import os
+import re
+import time
+
+from utils.metrics import request_metrics
+
+
+def metric_value(text, name, **labels):
+    label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+    match = re.search(rf'^{re.escape(name)}\{{{re.escape(label_text)}\}} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else None
+
+
+def test_metrics_endpoint_reports_histograms(client, make_plugins):
+    plugin = make_plugins(1)[0]
+    plugin_id = plugin.id
+    for _ in range(3):
+        client.get(f'/api/plugins/{plugin_id}').close()
+    client.get('/api/plugins/no-such-plugin').close()
+
+    response = client.get('/api/server/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE edgeplughub_request_duration_seconds histogram' in text
+
+    endpoint = 'plugins.get_plugin'
+    assert metric_value(text, 'edgeplughub_responses_total', endpoint=endpoint, method='GET', status='200') >= 3
+    assert metric_value(text, 'edgeplughub_responses_total', endpoint=endpoint, method='GET', status='404') >= 1
+    count = metric_value(text, 'edgeplughub_request_duration_seconds_count', endpoint=endpoint, method='GET')
+    assert metric_value(text, 'edgeplughub_request_duration_seconds_bucket',
+                        endpoint=endpoint, method='GET', le='+Inf') == count
+    assert metric_value(text, 'edgeplughub_request_sql_queries_sum', endpoint=endpoint) > 0
+    assert metric_value(text, 'edgeplughub_response_bytes_sum', endpoint=endpoint) > 0
+
+
+def test_filesystem_calls_are_counted(client, package_file, upload_plugin):
+    plugin = upload_plugin('Metrics Plugin', package_file)
+    before_calls, before_count = request_metrics.fs_calls.snapshot('plugins.download_plugin')
+    client.get(f'/api/plugins/{plugin.id}/download').close()
+    after_calls, after_count = request_metrics.fs_calls.snapshot('plugins.download_plugin')
+    assert after_count == before_count + 1
+    assert after_calls > before_calls
+
+
+def test_slow_requests_dump_folded_stacks(app, client, tmp_path, monkeypatch):
+    monkeypatch.setattr(request_metrics, 'profile_threshold', 0.05)
+    monkeypatch.setattr(request_metrics, 'profile_interval', 0.001)
+    monkeypatch.setattr(request_metrics, 'profile_dir', str(tmp_path))
+
+    @app.route('/_test/slow')
+    def slow_view():
+        time.sleep(0.1)
+        return 'ok'
+
+    client.get('/_test/slow').close()
+    client.get('/api/server/status').close()
+
+    files = os.listdir(tmp_path)
+    assert len(files) == 1 and 'slow_view' in files[0]
+    with open(tmp_path / files[0]) as f:
+        stacks = f.read().splitlines()
+    assert any('slow_view (test_metrics.py' in line for line in stacks)
+    assert all(re.match(r'.+ \d+$', line) for line in stacks)
@@ -0,0 +1,62 @@
+import hashlib
+import os
+import zipfile
+
+from models import db, Plugin
+from utils.package_index import package_index
+
+
+def test_upload_stores_checksum_and_size(upload_plugin, client, package_file):
+    with open(package_file, 'rb') as f:
+        content = f.read()
+    plugin = upload_plugin()
+    assert plugin.package_sha256 == hashlib.sha256(content).hexdigest()
+    assert plugin.package_size == len(content)
+
+    info = client.get(f'/api/plugins/{plugin.id}/download-info').json
+    assert info['file_exists']
+    assert info['sha256'] == plugin.package_sha256
+
+
+def test_download_supports_ranges_and_resume(upload_plugin, client, package_file):
+    with open(package_file, 'rb') as f:
+        content = f.read()
+    plugin = upload_plugin()
+
+    full = client.get(f'/api/plugins/{plugin.id}/download')
+    assert full.status_code == 200
+    assert full.data == content
+    assert full.headers['X-Checksum-SHA256'] == plugin.package_sha256
+    assert full.headers['ETag'] == f'"{plugin.package_sha256}"'
+    assert full.headers['Accept-Ranges'] == 'bytes'
+
+    partial = client.get(f'/api/plugins/{plugin.id}/download',
+                         headers={'Range': 'bytes=1000-', 'If-Range': full.headers['ETag']})
+    assert partial.status_code == 206
+    assert partial.data == content[1000:]
+    assert partial.headers['Content-Range'] == f'bytes 1000-{len(content) - 1}/{len(content)}'
+
+    stale = client.get(f'/api/plugins/{plugin.id}/download',
+                       headers={'Range': 'bytes=1000-', 'If-Range': '"stale"'})
+    assert stale.status_code == 200
+    assert stale.data == content
+
+
+def test_download_resolves_packages_recorded_by_other_processes(client, tmp_path, upload_plugin, package_file):
+    plugin_id = upload_plugin().id
+    # 模拟其他进程上传的插件: 本进程的插件包索引中没有该插件
+    package_index.discard(plugin_id)
+    with open(package_file, 'rb') as f:
+        assert client.get(f'/api/plugins/{plugin_id}/download').data == f.read()
+    assert client.get(f'/api/plugins/{plugin_id}/download-info').json['file_exists']
+
+    # 其他进程发布了新的插件包，本进程登记的仍是旧路径
+    other_package = os.path.join(tmp_path, 'other.zip')
+    with zipfile.ZipFile(other_package, 'w') as zf:
+        zf.writestr('other/plugin.py', 'VERSION = 2')
+    other = upload_plugin('Other Plugin', package=other_package)
+    plugin = Plugin.query.get(plugin_id)
+    plugin.package_path, plugin.package_sha256 = other.package_path, other.package_sha256
+    db.session.commit()
+    with open(other_package, 'rb') as f:
+        assert client.get(f'/api/plugins/{plugin_id}/download').data == f.read()
@@ -0,0 +1,71 @@
+import time
+
+from werkzeug.http import http_date
+
+
+def test_home_page_is_cached(client, make_plugins, count_queries):
+    plugin = make_plugins(1, category='PageCache')[0]
+    first = client.get('/')
+    assert first.status_code == 200
+    assert plugin.name.encode() in first.data
+    assert 'Last-Modified' in first.headers
+
+    count_queries.clear()
+    cached = client.get('/')
+    assert cached.data == first.data
+    assert count_queries == []
+
+    assert client.get('/', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+    assert client.get('/', headers={'If-Modified-Since': first.headers['Last-Modified']}).status_code == 304
+    stale = http_date(time.time() - 3600)
+    assert client.get('/', headers={'If-Modified-Since': stale}).status_code == 200
+
+
+def test_review_invalidates_pages(client, make_plugins, admin_headers):
+    plugin = make_plugins(1, status='pending', category='PageReview')[0]
+    assert plugin.name.encode() not in client.get('/').data
+    assert client.get(f'/plugin/{plugin.id}').status_code == 302
+
+    response = client.post(f'/api/plugins/review/{plugin.id}', json={'status': 'approved'}, headers=admin_headers)
+    assert response.status_code == 200
+    assert plugin.name.encode() in client.get('/').data
+    assert client.get(f'/plugin/{plugin.id}').status_code == 200
+
+
+def test_flashed_messages_bypass_page_cache(client, make_plugins, count_queries):
+    make_plugins(1, category='PageFlash')
+    client.get('/')
+    with client.session_transaction() as flask_session:
+        flask_session['_flashes'] = [('error', 'flash-only-once')]
+
+    count_queries.clear()
+    flashed = client.get('/')
+    assert b'flash-only-once' in flashed.data
+    # 插件列表片段仍然来自缓存
+    assert not [s for s in count_queries if 'FROM plugin' in s]
+    assert b'flash-only-once' not in client.get('/').data
+
+
+def test_detail_page_is_cached(client, make_plugins, count_queries):
+    plugin_id = make_plugins(1, category='PageDetail')[0].id
+    first = client.get(f'/plugin/{plugin_id}')
+    assert first.status_code == 200
+
+    count_queries.clear()
+    assert client.get(f'/plugin/{plugin_id}').data == first.data
+    assert count_queries == []
+    not_modified = client.get(f'/plugin/{plugin_id}', headers={'If-None-Match': first.headers['ETag']})
+    assert not_modified.status_code == 304
+
+
+def test_pages_expire_after_ttl(app, client, make_plugins, count_queries, monkeypatch):
+    plugin_id = make_plugins(1, category='PageTTL')[0].id
+    monkeypatch.setitem(app.config, 'PAGE_CACHE_SECONDS', 0.05)
+    first = client.get(f'/plugin/{plugin_id}')
+    time.sleep(0.1)
+
+    count_queries.clear()
+    second = client.get(f'/plugin/{plugin_id}')
+    assert count_queries
+    # 内容没有变化，修改时间不变
+    assert second.headers['Last-Modified'] == first.headers['Last-Modified']
@@ -0,0 +1,132 @@
+import json
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from models import db
+from routes import plugins as plugins_routes
+from utils import streaming
+from utils.pagination import encode_cursor
+
+
+@pytest.mark.parametrize('url', ['/api/plugins', '/api/plugins/available'])
+def test_listing_query_count_is_constant(client, make_plugins, count_queries, url):
+    make_plugins(3)
+    count_queries.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    small = len(count_queries)
+
+    make_plugins(20)
+    count_queries.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    assert len(response.json) >= 23
+    assert len(count_queries) == small
+    assert all(p['author'].startswith(('author', 'admin')) for p in response.json)
+
+
+def test_listing_pages_with_cursor(client, make_plugins):
+    make_plugins(5, category='Paging')
+    seen = []
+    url = '/api/plugins?category=Paging&limit=2&fields=id,name'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert all(set(p) == {'id', 'name'} for p in response.json)
+        seen.extend(p['id'] for p in response.json)
+        link = response.headers.get('Link')
+        url = link[1:link.index('>')] if link else None
+    assert len(seen) == len(set(seen)) == 5
+
+
+@pytest.mark.parametrize('url', ['/api/plugins', '/api/plugins/available'])
+def test_listing_without_paging_params_returns_everything(app, client, make_plugins, monkeypatch, url):
+    monkeypatch.setitem(app.config, 'PLUGINS_PAGE_SIZE', 2)
+    make_plugins(3, category='Unpaged')
+    response = client.get(f'{url}?category=Unpaged')
+    assert len(response.json) == 3
+    assert 'X-Next-Cursor' not in response.headers
+
+    paged = client.get(f'{url}?category=Unpaged&cursor={encode_cursor(datetime.min, "")}')
+    assert len(paged.json) == 2
+    assert 'X-Next-Cursor' in paged.headers
+
+
+def test_listing_rejects_unknown_fields(client):
+    response = client.get('/api/plugins?fields=id,password_hash')
+    assert response.status_code == 400
+
+
+def test_home_page_query_count_is_constant(client, make_plugins, count_queries):
+    make_plugins(3)
+    count_queries.clear()
+    assert client.get('/').status_code == 200
+    small = len(count_queries)
+
+    make_plugins(20)
+    count_queries.clear()
+    assert client.get('/').status_code == 200
+    assert len(count_queries) == small
+
+
+def ndjson(data):
+    return [json.loads(line) for line in data.splitlines()]
+
+
+@pytest.mark.parametrize('url', ['/api/plugins?category=Streaming', '/api/plugins/available?category=Streaming'])
+def test_listing_streams_ndjson(client, make_plugins, url):
+    make_plugins(3, category='Streaming')
+    paged = client.get(url + '&limit=2')
+    assert paged.headers['Vary'] == 'Accept'
+    # 缓存的JSON响应不返回给请求NDJSON的客户端
+    assert len(client.get(url).json) == 3
+
+    response = client.get(url, headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    assert 'Link' not in response.headers
+    # 流式响应不分页，与分页响应内容一致
+    streamed = ndjson(response.data)
+    assert len(streamed) == 3
+    assert streamed[:2] == paged.json
+
+
+def test_listing_streams_json_array(client, make_plugins):
+    make_plugins(3, category='Streaming')
+    response = client.get('/api/plugins?category=Streaming&stream=true&limit=2&fields=id')
+    assert response.is_streamed
+    assert response.mimetype == 'application/json'
+    assert [set(p) for p in json.loads(response.data)] == [{'id'}, {'id'}]
+
+
+def test_stream_chunks_large_listings(client, make_plugins, monkeypatch):
+    monkeypatch.setattr(streaming, 'STREAM_CHUNK_SIZE', 100)
+    make_plugins(5, category='Streaming')
+    response = client.get('/api/plugins?category=Streaming&stream=true')
+    chunks = list(response.response)
+    assert len(chunks) > 1
+    assert len(json.loads(b''.join(chunks))) == 5
+
+
+def test_stream_does_not_block_writers(app, client, make_plugins, monkeypatch):
+    monkeypatch.setattr(streaming, 'STREAM_CHUNK_SIZE', 1)
+    monkeypatch.setattr(plugins_routes, 'STREAM_BATCH_SIZE', 1)
+    plugin_ids = [p.id for p in make_plugins(3, category='Streaming')]
+    response = client.get('/api/plugins?category=Streaming&stream=true', buffered=False)
+    body = iter(response.response)
+    assert next(body) == b'['
+    assert next(body).startswith(b'{')
+
+    # 响应体传输过程中，其他连接的写入不会因数据库被锁定而失败
+    conn = sqlite3.connect(db.engine.url.database, timeout=0.1)
+    try:
+        conn.execute("UPDATE plugin SET downloads = downloads + 1 WHERE id = ?", (plugin_ids[0],))
+        conn.commit()
+    finally:
+        conn.close()
+    rest = b''.join(body)
+    response.close()
+    assert rest
@@ -0,0 +1,63 @@
+import re
+
+import pytest
+from sqlalchemy import event
+
+from models import db
+
+# 对 plugin / user 表的全表扫描(FTS虚拟表除外)
+FULL_SCAN = re.compile(r'\bSCAN (plugin|user)\b(?! VIRTUAL TABLE)')
+
+
+@pytest.fixture
+def captured_statements(app):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def query_plans(statements):
+    with db.engine.connect() as conn:
+        for statement, parameters in statements:
+            rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            yield statement, [row[-1] for row in rows]
+
+
+def endpoint_urls(plugin_id, cursor):
+    return [
+        '/api/plugins',
+        '/api/plugins?category=Plans',
+        f'/api/plugins?category=Plans&limit=1&cursor={cursor}',
+        '/api/plugins?status=pending',
+        '/api/plugins/available',
+        '/api/plugins/available?category=Plans&fields=id,name',
+        '/api/plugins/categories',
+        '/api/plugins/search?q=plugin',
+        '/api/plugins/changes?since=0&limit=10',
+        '/api/plugins/compatible?platform=linux-aarch64&python=3.9&memory=512&capability=face_detection',
+        f'/api/plugins/{plugin_id}',
+        f'/api/plugins/{plugin_id}/download-info',
+        f'/api/plugins/{plugin_id}/versions',
+        '/',
+        f'/plugin/{plugin_id}',
+    ]
+
+
+def test_catalog_queries_do_not_scan_tables(client, make_plugins, captured_statements):
+    plugins = make_plugins(3, category='Plans')
+    first_page = client.get('/api/plugins?category=Plans&limit=1')
+    cursor = first_page.headers['X-Next-Cursor']
+
+    for url in endpoint_urls(plugins[0].id, cursor):
+        captured_statements.clear()
+        response = client.get(url)
+        assert response.status_code in (200, 304), url
+        for statement, plan in query_plans(captured_statements):
+            scans = [line for line in plan if FULL_SCAN.search(line)]
+            assert not scans, f'{url}: {statement}\n{plan}'
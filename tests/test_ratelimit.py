@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from utils.ratelimit import MemoryBackend, SqliteBackend, parse_rate, rate_limiter
+
+
+@pytest.fixture
+def limited(app, monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'enabled', True)
+    monkeypatch.setattr(rate_limiter, 'backend', MemoryBackend())
+    yield app.config
+
+
+def test_parse_rate():
+    assert parse_rate('10/minute') == (10, 10 / 60)
+    assert parse_rate('2/seconds') == (2, 2.0)
+    for rate in ('10', 'ten/minute', '0/minute', '5/fortnight'):
+        with pytest.raises(ValueError):
+            parse_rate(rate)
+
+
+def test_token_bucket_refills():
+    backend = MemoryBackend()
+    assert backend.consume('k', 2, 1.0, now=100) == (True, 0.0)
+    assert backend.consume('k', 2, 1.0, now=100) == (True, 0.0)
+    allowed, retry_after = backend.consume('k', 2, 1.0, now=100.25)
+    assert not allowed and retry_after == pytest.approx(0.75)
+    assert backend.consume('k', 2, 1.0, now=101)[0]
+
+
+def test_sqlite_backend_shared_between_instances(tmp_path):
+    path = os.path.join(tmp_path, 'ratelimit.db')
+    first, second = SqliteBackend(path), SqliteBackend(path)
+    assert first.consume('k', 1, 0.1, now=100)[0]
+    allowed, retry_after = second.consume('k', 1, 0.1, now=101)
+    assert not allowed and retry_after == pytest.approx(9)
+
+
+def test_download_rate_limited_per_ip(client, limited, monkeypatch):
+    monkeypatch.setitem(limited, 'RATELIMIT_DOWNLOAD', '2/minute')
+    for _ in range(2):
+        assert client.get('/api/plugins/missing/download').status_code != 429
+    response = client.get('/api/plugins/missing/download')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) == 30
+
+    other = client.get('/api/plugins/missing/download', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert other.status_code != 429
+
+
+def test_login_rate_limited(client, limited, monkeypatch):
+    monkeypatch.setitem(limited, 'RATELIMIT_LOGIN', '1/hour')
+    credentials = {'username': 'admin', 'password': 'wrong'}
+    assert client.post('/api/auth/login', json=credentials).status_code == 401
+    assert client.post('/api/auth/login', json=credentials).status_code == 429
+    # 管理界面只对提交登录表单限速
+    assert client.get('/admin/login').status_code == 200
+    assert client.post('/admin/login', data=credentials).status_code == 200
+    assert client.post('/admin/login', data=credentials).status_code == 429
+
+
+def test_download_concurrency_cap(client, limited, monkeypatch):
+    monkeypatch.setitem(limited, 'DOWNLOAD_MAX_CONCURRENCY', 1)
+    semaphore = rate_limiter._semaphore('plugins.download_plugin', 1)
+    assert semaphore.acquire(blocking=False)
+    try:
+        response = client.get('/api/plugins/missing/download')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        semaphore.release()
+    assert client.get('/api/plugins/missing/download').status_code != 503
+
+
+def test_disabled_by_config(client):
+    assert not rate_limiter.enabled
+    for _ in range(20):
+        assert client.post('/api/auth/login', json={'username': 'admin', 'password': 'wrong'}).status_code == 401
+
+
+def test_concurrency_cap_covers_file_transfer(client, limited, monkeypatch, upload_plugin):
+    monkeypatch.setitem(limited, 'DOWNLOAD_MAX_CONCURRENCY', 1)
+    plugin_id = upload_plugin('Concurrent Download').id
+    url = f'/api/plugins/{plugin_id}/download'
+
+    # 第一个下载的响应体尚未传输完毕时仍占用名额
+    first = client.get(url, buffered=False)
+    assert first.status_code == 200
+    next(iter(first.response))
+    assert client.get(url).status_code == 503
+
+    first.close()
+    assert client.get(url).status_code == 200
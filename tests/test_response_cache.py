@@ -0,0 +1,81 @@
+import time
+
+from sqlalchemy import text
+
+from models import db, Plugin
+from utils.cache import response_cache
+from utils.counters import download_counter
+
+
+def test_available_plugins_support_etag(client, make_plugins, count_queries):
+    make_plugins(2)
+    first = client.get('/api/plugins/available')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert not etag.startswith('W/')
+
+    count_queries.clear()
+    cached = client.get('/api/plugins/available')
+    assert cached.data == first.data
+    assert count_queries == []
+
+    not_modified = client.get('/api/plugins/available', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+    assert count_queries == []
+
+
+def test_cache_is_keyed_by_query_args(client, make_plugins):
+    make_plugins(1, category='CacheA')
+    make_plugins(1, category='CacheB')
+    a = client.get('/api/plugins/available?category=CacheA').json
+    b = client.get('/api/plugins/available?category=CacheB').json
+    assert [p['category'] for p in a] == ['CacheA']
+    assert [p['category'] for p in b] == ['CacheB']
+
+
+def test_review_invalidates_cache(client, make_plugins, admin_headers):
+    plugin = make_plugins(1, status='pending', category='Review')[0]
+    before = client.get('/api/plugins/available?category=Review')
+    assert before.json == []
+
+    response = client.post(f'/api/plugins/review/{plugin.id}', json={'status': 'approved'}, headers=admin_headers)
+    assert response.status_code == 200
+
+    after = client.get('/api/plugins/available?category=Review', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert [p['id'] for p in after.json] == [plugin.id]
+
+
+def test_manifest_is_cached(client):
+    first = client.get('/api/plugins/manifest')
+    assert first.status_code == 200
+    second = client.get('/api/plugins/manifest', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+
+
+def test_invalidation_by_another_process(client, make_plugins, monkeypatch):
+    monkeypatch.setattr(response_cache, 'check_interval', 0)
+    plugin = make_plugins(1, category='Shared')[0]
+    plugin_id = plugin.id
+    assert client.get('/api/plugins/available?category=Shared').json[0]['name'] == plugin.name
+
+    # 模拟另一个工作进程: 提交修改并递增数据库中的缓存版本，本进程的缓存没有被清空
+    Plugin.query.get(plugin_id).name = 'Renamed Elsewhere'
+    db.session.commit()
+    db.session.execute(text("UPDATE cache_version SET version = version + 1"))
+    db.session.commit()
+    assert client.get('/api/plugins/available?category=Shared').json[0]['name'] == 'Renamed Elsewhere'
+
+
+def test_cached_listing_downloads_expire(app, client, make_plugins, monkeypatch):
+    monkeypatch.setitem(app.config, 'PAGE_CACHE_SECONDS', 0.05)
+    plugin_id = make_plugins(1, category='Downloads')[0].id
+    for url in ('/api/plugins/available?category=Downloads', '/api/plugins/compatible?category=Downloads'):
+        assert client.get(url).json[0]['downloads'] == 0
+    # 下载计数写入不会使响应缓存失效，缓存过期后重新生成
+    download_counter.increment(plugin_id, 2)
+    download_counter.flush()
+    time.sleep(0.1)
+    for url in ('/api/plugins/available?category=Downloads', '/api/plugins/compatible?category=Downloads'):
+        assert client.get(url).json[0]['downloads'] == 2
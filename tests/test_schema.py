@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import inspect, text
+
+from models import db
+from utils.schema import upgrade_schema
+
+
+@pytest.fixture
+def probe_table(app):
+    """数据库中只有 id 列的表，模型中的列由测试添加"""
+    db.session.execute(text('CREATE TABLE schema_probe (id INTEGER PRIMARY KEY)'))
+    db.session.execute(text('INSERT INTO schema_probe (id) VALUES (1)'))
+    db.session.commit()
+    table = db.Table('schema_probe', db.metadata, db.Column('id', db.Integer, primary_key=True))
+    yield table
+    db.metadata.remove(table)
+    db.session.execute(text('DROP TABLE schema_probe'))
+    db.session.commit()
+
+
+def test_added_columns_are_quoted_and_filled(probe_table):
+    probe_table.append_column(db.Column('order', db.Integer, nullable=False, default=5))
+    probe_table.append_column(db.Column('status', db.String(20), nullable=False, default="it's new"))
+    probe_table.append_column(db.Column('note', db.Text))
+    upgrade_schema()
+
+    columns = {c['name']: c for c in inspect(db.engine).get_columns('schema_probe')}
+    assert not columns['order']['nullable'] and columns['note']['nullable']
+    row = db.session.execute(text('SELECT "order", status, note FROM schema_probe')).one()
+    assert tuple(row) == (5, "it's new", None)
+
+
+def test_not_null_column_without_default_is_refused(probe_table):
+    probe_table.append_column(db.Column('name', db.String(50), nullable=False))
+    with pytest.raises(RuntimeError, match='schema_probe.name'):
+        upgrade_schema()
+    assert 'name' not in {c['name'] for c in inspect(db.engine).get_columns('schema_probe')}
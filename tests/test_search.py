@@ -0,0 +1,58 @@
+from models import db
+
+
+def test_search_ranks_name_matches_first(client, make_plugins):
+    by_description, by_name, unrelated = make_plugins(3)
+    by_description.description = '支持 thermal camera 输入的插件'
+    by_name.name = 'Thermal Camera Reader'
+    unrelated.name = 'Audio Mixer'
+    db.session.commit()
+
+    results = client.get('/api/plugins/search?q=thermal').json
+    assert [p['id'] for p in results] == [by_name.id, by_description.id]
+
+
+def test_search_matches_chinese_text_and_short_terms(client, make_plugins):
+    plugin = make_plugins(1)[0]
+    plugin.description = '实时人脸检测，支持多人脸'
+    db.session.commit()
+
+    assert plugin.id in [p['id'] for p in client.get('/api/plugins/search?q=人脸检测').json]
+    assert plugin.id in [p['id'] for p in client.get('/api/plugins/search?q=人脸').json]
+
+
+def test_search_index_follows_edits_reviews_and_deletes(client, make_plugins):
+    plugin = make_plugins(1, status='pending')[0]
+    plugin.name = 'Quasar Tracker'
+    db.session.commit()
+    assert client.get('/api/plugins/search?q=quasar').json == []
+
+    plugin.status = 'approved'
+    db.session.commit()
+    assert [p['id'] for p in client.get('/api/plugins/search?q=quasar').json] == [plugin.id]
+
+    plugin.name = 'Pulsar Tracker'
+    db.session.commit()
+    assert client.get('/api/plugins/search?q=quasar').json == []
+    assert [p['id'] for p in client.get('/api/plugins/search?q=pulsar').json] == [plugin.id]
+
+
+def test_search_paginates(client, make_plugins):
+    plugins = make_plugins(5)
+    for plugin in plugins:
+        plugin.short_description = 'paginated search result'
+    db.session.commit()
+
+    seen = []
+    url = '/api/plugins/search?q=paginated&limit=2&fields=id'
+    while url:
+        response = client.get(url)
+        seen.extend(p['id'] for p in response.json)
+        link = response.headers.get('Link')
+        url = link[1:link.index('>')] if link else None
+    assert sorted(seen) == sorted(p.id for p in plugins)
+
+
+def test_search_treats_query_syntax_as_text(client):
+    assert client.get('/api/plugins/search?q=NEAR(" OR *').status_code == 200
+    assert client.get('/api/plugins/search').status_code == 400
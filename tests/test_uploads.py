@@ -0,0 +1,47 @@
+import io
+import os
+import zipfile
+
+
+def _temp_files(app):
+    return os.listdir(os.path.join(app.config['UPLOAD_FOLDER'], 'temp'))
+
+
+def _zip_bytes(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, content in entries.items():
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+def _upload(client, content, filename='plugin.zip'):
+    return client.post('/api/plugins/plugins/upload',
+                       data={'file': (io.BytesIO(content), filename)},
+                       content_type='multipart/form-data')
+
+
+def test_valid_package_is_moved_into_place(app, client):
+    content = _zip_bytes({'plugin/manifest.json': '{}'})
+    response = _upload(client, content, 'streamed.zip')
+    assert response.status_code == 200
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'packages', 'streamed.zip'), 'rb') as f:
+        assert f.read() == content
+    assert _temp_files(app) == []
+
+
+def test_invalid_packages_are_rejected(app, client):
+    assert _upload(client, b'not a zip at all').status_code == 400
+    assert _upload(client, b'PK\x03\x04truncated').status_code == 400
+    assert _upload(client, _zip_bytes({'../evil.py': 'x'})).status_code == 400
+    assert _temp_files(app) == []
+
+
+def test_oversized_package_is_rejected(app, client):
+    app.config['MAX_PACKAGE_SIZE'] = 1024
+    try:
+        response = _upload(client, _zip_bytes({'big.bin': os.urandom(4096)}))
+    finally:
+        app.config['MAX_PACKAGE_SIZE'] = 200 * 1024 * 1024
+    assert response.status_code == 413
+    assert _temp_files(app) == []
@@ -0,0 +1,161 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+from models import db, User, Plugin, PluginVersion, PackageDelta
+from utils.auth import hash_password
+from utils.package_index import package_index
+from utils.versions import DELTA_MANIFEST
+
+# 不可压缩的大文件，新版本中保持不变
+MODEL_DATA = os.urandom(256 * 1024)
+
+
+def write_package(path, files):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            zf.writestr(f'demo/{name}', data)
+    return path
+
+
+def package_v1(tmp_path):
+    return write_package(os.path.join(tmp_path, 'v1.zip'), {
+        'manifest.json': '{"name": "demo"}', 'plugin.py': 'VERSION = 1', 'legacy.py': 'pass', 'model.bin': MODEL_DATA})
+
+
+def package_v2(tmp_path):
+    return write_package(os.path.join(tmp_path, 'v2.zip'), {
+        'manifest.json': '{"name": "demo"}', 'plugin.py': 'VERSION = 2', 'utils.py': 'pass', 'model.bin': MODEL_DATA})
+
+
+@pytest.fixture
+def publish(client, admin_headers):
+    def _publish(plugin_id, version, package, headers=admin_headers):
+        with open(package, 'rb') as f:
+            return client.post(f'/api/plugins/{plugin_id}/versions', headers=headers,
+                                data={'version': version, 'package': (f, os.path.basename(package))},
+                                content_type='multipart/form-data')
+    return _publish
+
+
+def test_delta_contains_only_changed_entries(app, client, tmp_path, upload_plugin, publish):
+    plugin_id = upload_plugin('Versioned Plugin', package=package_v1(tmp_path)).id
+    response = publish(plugin_id, '2.0.0', package_v2(tmp_path))
+    assert response.status_code == 201, response.json
+    assert response.json['version'] == '2.0.0'
+    assert response.json['status'] == 'approved'
+
+    versions = client.get(f'/api/plugins/{plugin_id}/versions').json
+    assert [v['version'] for v in versions] == ['2.0.0', '1.0.0']
+
+    full = client.get(f'/api/plugins/{plugin_id}/download')
+    delta = client.get(f'/api/plugins/{plugin_id}/delta?from=1.0.0')
+    assert delta.status_code == 200
+    assert delta.headers['X-Delta-From'] == '1.0.0' and delta.headers['X-Delta-To'] == '2.0.0'
+    assert len(delta.data) * 10 < len(full.data)
+
+    with zipfile.ZipFile(io.BytesIO(delta.data)) as zf:
+        meta = json.loads(zf.read(DELTA_MANIFEST))
+        assert sorted(zf.namelist()) == [DELTA_MANIFEST, 'demo/plugin.py', 'demo/utils.py']
+        assert zf.read('demo/plugin.py') == b'VERSION = 2'
+    assert meta['removed'] == ['demo/legacy.py']
+    assert meta['to_sha256'] == Plugin.query.get(plugin_id).package_sha256
+
+    assert client.get(f'/api/plugins/{plugin_id}/delta?from=2.0.0').status_code == 204
+    assert client.get(f'/api/plugins/{plugin_id}/delta?from=0.1.0').status_code == 404
+    assert client.get(f'/api/plugins/{plugin_id}/delta').status_code == 400
+    assert publish(plugin_id, '1.0.0', package_v2(tmp_path)).status_code == 409
+
+
+def test_history_uses_recorded_package(client, tmp_path, upload_plugin, publish):
+    plugin = upload_plugin('Recorded Plugin', package=package_v1(tmp_path))
+    plugin_id, v1_path, v1_sha256 = plugin.id, plugin.package_path, plugin.package_sha256
+    # 其他进程上传的插件不在本进程的插件包索引中
+    package_index.discard(plugin_id)
+    assert publish(plugin_id, '2.0.0', package_v2(tmp_path)).status_code == 201
+    row = PluginVersion.query.filter_by(plugin_id=plugin_id, version='1.0.0').one()
+    assert (row.package_path, row.package_sha256) == (v1_path, v1_sha256)
+    assert client.get(f'/api/plugins/{plugin_id}/delta?from=1.0.0').status_code == 200
+
+
+def test_delta_is_built_on_demand(app, client, tmp_path, upload_plugin, publish):
+    plugin_id = upload_plugin('On Demand Plugin', package=package_v1(tmp_path)).id
+    publish(plugin_id, '2.0.0', package_v2(tmp_path))
+    plugin = Plugin.query.get(plugin_id)
+    delta = PackageDelta.query.filter_by(to_sha256=plugin.package_sha256).one()
+    os.remove(os.path.join(app.config['UPLOAD_FOLDER'], delta.path))
+    db.session.delete(delta)
+    db.session.commit()
+
+    assert client.get(f'/api/plugins/{plugin_id}/delta?from=1.0.0').status_code == 200
+
+
+def test_large_delta_redirects_to_full_package(client, tmp_path, upload_plugin, publish):
+    plugin_id = upload_plugin('Rewritten Plugin', package=package_v1(tmp_path)).id
+    rewritten = write_package(os.path.join(tmp_path, 'v2.zip'), {'model.bin': os.urandom(256 * 1024)})
+    publish(plugin_id, '2.0.0', rewritten)
+    response = client.get(f'/api/plugins/{plugin_id}/delta?from=1.0.0')
+    assert response.status_code == 303
+    assert response.headers['Location'].endswith(f'/api/plugins/{plugin_id}/download')
+
+
+def test_old_versions_are_pruned(app, client, tmp_path, upload_plugin, publish, monkeypatch):
+    monkeypatch.setitem(app.config, 'PLUGIN_VERSION_HISTORY', 1)
+    plugin_id = upload_plugin('Pruned Plugin', package=package_v1(tmp_path)).id
+    v1_path = os.path.join(app.config['UPLOAD_FOLDER'], Plugin.query.get(plugin_id).package_path)
+    publish(plugin_id, '2.0.0', package_v2(tmp_path))
+    v3 = write_package(os.path.join(tmp_path, 'v3.zip'), {'plugin.py': 'VERSION = 3', 'model.bin': MODEL_DATA})
+    assert publish(plugin_id, '3.0.0', v3).status_code == 201
+
+    assert [v['version'] for v in client.get(f'/api/plugins/{plugin_id}/versions').json] == ['3.0.0', '2.0.0']
+    assert not os.path.exists(v1_path)
+    assert client.get(f'/api/plugins/{plugin_id}/delta?from=1.0.0').status_code == 404
+    assert client.get(f'/api/plugins/{plugin_id}/delta?from=2.0.0').status_code == 200
+    assert PackageDelta.query.filter_by(to_sha256=Plugin.query.get(plugin_id).package_sha256).count() == 1
+
+
+def test_author_versions_need_review(client, tmp_path, admin_headers, publish):
+    author = User(username='version_author', email='version_author@example.com',
+                  password_hash=hash_password('secret'))
+    db.session.add(author)
+    db.session.commit()
+    author_id = author.id
+    token = client.post('/api/auth/login', json={'username': 'version_author', 'password': 'secret'}).json
+    headers = {'Authorization': f"Bearer {token['access_token']}"}
+    plugin_id = None
+    try:
+        with open(package_v1(tmp_path), 'rb') as f:
+            plugin_id = client.post('/api/plugins', headers=headers, content_type='multipart/form-data', data={
+                'name': 'Author Plugin', 'short_description': '作者上传', 'description': '作者上传',
+                'version': '1.0.0', 'category': 'Uploads', 'package': (f, 'v1.zip')}).json['id']
+        client.post(f'/api/plugins/review/{plugin_id}', json={'status': 'approved'}, headers=admin_headers)
+
+        response = publish(plugin_id, '2.0.0', package_v2(tmp_path), headers=headers)
+        assert response.status_code == 201
+        assert response.json['status'] == 'pending'
+        assert client.get(f'/api/plugins/{plugin_id}/delta?from=1.0.0').status_code == 403
+    finally:
+        if plugin_id:
+            db.session.delete(Plugin.query.get(plugin_id))
+        db.session.delete(User.query.get(author_id))
+        db.session.commit()
+    assert PluginVersion.query.filter_by(plugin_id=plugin_id).count() == 0
+
+
+def test_only_author_or_admin_can_publish(client, tmp_path, upload_plugin, publish):
+    plugin_id = upload_plugin('Guarded Plugin', package=package_v1(tmp_path)).id
+    user = User(username='stranger', email='stranger@example.com', password_hash=hash_password('secret'))
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+    try:
+        token = client.post('/api/auth/login', json={'username': 'stranger', 'password': 'secret'}).json
+        response = publish(plugin_id, '2.0.0', package_v2(tmp_path),
+                           headers={'Authorization': f"Bearer {token['access_token']}"})
+        assert response.status_code == 403
+    finally:
+        db.session.delete(User.query.get(user_id))
+        db.session.commit()
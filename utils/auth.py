@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from models import db, User
+from utils.cache import USER_CACHE_VERSION, bump_shared_version, read_shared_version
+
+# werkzeug 默认的 PBKDF2 迭代次数
+DEFAULT_PASSWORD_HASH_ITERATIONS = 260000
+
+
+def password_hash_method():
+    iterations = current_app.config.get('PASSWORD_HASH_ITERATIONS', DEFAULT_PASSWORD_HASH_ITERATIONS)
+    return f'pbkdf2:sha256:{iterations}'
+
+
+def hash_password(password):
+    """按 PASSWORD_HASH_ITERATIONS 配置的工作量计算密码哈希"""
+    return generate_password_hash(password, method=password_hash_method())
+
+
+def needs_rehash(password_hash):
+    """密码哈希的算法或迭代次数与当前配置不同"""
+    return password_hash.split('$', 1)[0] != password_hash_method()
+
+
+def verify_password(user, password):
+    """校验密码，哈希的工作量与当前配置不同时用新配置重新计算并保存"""
+    if not user or not password or not check_password_hash(user.password_hash, password):
+        return False
+    if needs_rehash(user.password_hash):
+        user.password_hash = hash_password(password)
+        db.session.commit()
+        current_app.logger.info(f"已按新的工作量更新用户密码哈希: {user.username}")
+    return True
+
+
+def create_user_token(user):
+    """签发携带角色声明的访问令牌，鉴权时无需查询数据库"""
+    return create_access_token(identity=user.id, additional_claims={'is_admin': bool(user.is_admin)})
+
+
+class UserIdentityCache:
+    """用户身份缓存: 用户ID -> {id, username, email, is_admin}
+
+    缓存的是字典快照而不是ORM对象，可以在请求之间和线程之间共享。条目在
+    USER_CACHE_TTL 秒后过期。用户被修改或删除时本进程的缓存立即失效，提交后
+    递增数据库中的用户缓存版本(cache_version 表)；各进程最多每隔 check_interval
+    秒读取一次该版本，发现变化时清空本进程的缓存，因此其他进程的修改最多延迟
+    check_interval 秒可见。
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60.0
+        self.max_entries = 10000
+        self.check_interval = 1.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared_version = None
+        self._checked = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = float(app.config.get('USER_CACHE_TTL', self.ttl))
+        self.check_interval = app.config.get('USER_CACHE_CHECK_SECONDS', self.check_interval)
+        app.extensions['user_cache'] = self
+        # flask_jwt_extended 的 current_user 也从缓存获取
+        jwt_manager = app.extensions.get('flask-jwt-extended')
+        if jwt_manager is not None:
+            jwt_manager.user_lookup_loader(lambda jwt_header, jwt_data: self.get(jwt_data['sub']))
+
+    def get(self, user_id):
+        """返回用户身份，用户不存在时返回None"""
+        self._sync()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+        user = User.query.get(user_id)
+        identity = None
+        if user is not None:
+            identity = {'id': user.id, 'username': user.username, 'email': user.email,
+                        'is_admin': bool(user.is_admin)}
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, identity)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def notify(self, user_ids):
+        """用户的修改提交后使本进程的缓存失效，并通知其他进程"""
+        shared_version = bump_shared_version(USER_CACHE_VERSION)
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+            # 版本只比已读取的版本大1时，期间没有其他进程的修改，无需清空全部缓存
+            if self._shared_version == shared_version - 1:
+                self._shared_version = shared_version
+
+    def _sync(self):
+        """距上次检查超过 check_interval 秒时读取数据库中的用户缓存版本，与本进程不同时清空缓存"""
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        shared_version = read_shared_version(USER_CACHE_VERSION)
+        with self._lock:
+            if shared_version != self._shared_version:
+                self._entries.clear()
+                self._shared_version = shared_version
+
+
+user_cache = UserIdentityCache()
+
+
+def current_identity():
+    """当前访问令牌对应的用户身份，用户不存在时返回None"""
+    return user_cache.get(get_jwt_identity())
+
+
+def current_user_is_admin():
+    """令牌的角色声明和缓存的用户身份都为管理员
+
+    角色声明在令牌有效期内不变，同时检查用户身份缓存，管理员权限被撤销后在本进程
+    立即生效，在其他进程最多延迟 USER_CACHE_CHECK_SECONDS 秒生效。
+    旧令牌没有角色声明时只按用户身份判断。
+    """
+    identity = current_identity()
+    if identity is None or not identity['is_admin']:
+        return False
+    return get_jwt().get('is_admin', True)
+
+
+# 用户修改或删除时使缓存失效。提交前后各失效一次: 提交前失效保证本请求随后读到新数据，
+# 提交后失效清除并发请求在提交前读到并缓存的旧数据，同时通知其他进程
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+    session = db.inspect(target).session
+    if session is not None:
+        session.info.setdefault('changed_users', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session):
+    user_ids = session.info.pop('changed_users', ())
+    if user_ids:
+        user_cache.notify(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_rolled_back_users(session):
+    # 回滚前本事务中可能已缓存了未提交的数据
+    for user_id in session.info.pop('changed_users', ()):
+        user_cache.invalidate(user_id)
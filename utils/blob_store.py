@@ -0,0 +1,58 @@
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+from flask import current_app
+
+from models import Plugin, PluginVersion
+from utils.installed_store import file_lock
+
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}\.zip$')
+
+_blob_lock = threading.Lock()
+
+
+@contextmanager
+def blob_lock():
+    """串行化插件包和图标文件的写入和删除(跨线程和进程)
+
+    内容寻址的插件包和图标被多个记录共享，引用数来自已提交的记录。上传时从写入文件到
+    提交引用它的记录、删除时从统计引用到删除文件都持有该锁，否则删除可能发生在
+    上传写入文件之后、提交记录之前，留下指向不存在的文件的插件。
+    """
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'packages.lock')
+    with _blob_lock, file_lock(path):
+        yield
+
+
+def blob_path(sha256):
+    """内容寻址插件包相对于 UPLOAD_FOLDER 的路径，相同内容的插件包共享同一个文件"""
+    return os.path.join('packages', f'{sha256}.zip')
+
+
+def is_blob_path(package_path):
+    """是否为内容寻址保存的插件包(而不是按名称匹配的预置包)"""
+    return os.path.dirname(package_path) == 'packages' and bool(BLOB_NAME.match(os.path.basename(package_path)))
+
+
+def package_references(package_path):
+    """引用该插件包文件的记录数(插件的当前版本和版本历史)"""
+    return (Plugin.query.filter_by(package_path=package_path).count() +
+            PluginVersion.query.filter_by(package_path=package_path).count())
+
+
+def release_package(package_path):
+    """插件记录删除后调用，没有其他记录引用该插件包时删除文件
+
+    返回被删除的文件名，文件仍被引用或不存在时返回None。
+    """
+    if not package_path:
+        return None
+    full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], package_path)
+    with blob_lock():
+        if package_references(package_path) > 0 or not os.path.exists(full_path):
+            return None
+        os.remove(full_path)
+    current_app.logger.info(f"已删除不再被引用的插件包: {package_path}")
+    return os.path.basename(full_path)
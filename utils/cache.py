@@ -0,0 +1,196 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, make_response, current_app, session
+from sqlalchemy import text
+
+from models import db
+
+# 缓存响应时保留的响应头
+CACHED_HEADERS = ('X-Next-Cursor', 'Link', 'Vary')
+
+# cache_version 表中各缓存对应的行
+RESPONSE_CACHE_VERSION = 1
+USER_CACHE_VERSION = 2
+
+_BUMP_VERSION = text("UPDATE cache_version SET version = version + 1 WHERE id = :id")
+_INSERT_VERSION = text("INSERT INTO cache_version (id, version) VALUES (:id, 1)")
+_SELECT_VERSION = text("SELECT version FROM cache_version WHERE id = :id")
+
+
+def bump_shared_version(version_id):
+    """在单独的事务中递增 cache_version 表中的缓存版本，返回新版本"""
+    params = {'id': version_id}
+    with db.engine.begin() as conn:
+        if conn.execute(_BUMP_VERSION, params).rowcount == 0:
+            conn.execute(_INSERT_VERSION, params)
+        return conn.execute(_SELECT_VERSION, params).scalar()
+
+
+def read_shared_version(version_id):
+    """读取 cache_version 表中的缓存版本，不存在时返回0"""
+    return db.session.execute(_SELECT_VERSION, {'id': version_id}).scalar() or 0
+
+
+class ResponseCache:
+    """读接口的响应缓存
+
+    按 接口 + 路径参数 + 查询参数 缓存完整的响应体，并为其计算强ETag和
+    Last-Modified。客户端携带匹配的 If-None-Match 或 If-Modified-Since 时直接
+    返回304。fragment() 缓存页面中的片段。插件目录发生变化时调用 invalidate()
+    清空缓存。
+
+    缓存保存在各进程的内存中。invalidate() 同时递增数据库中的缓存版本(cache_version 表)，
+    各进程最多每隔 check_interval 秒读取一次该版本，发现其他进程(其他工作进程、flask jobs run)
+    失效过缓存时清空本进程的缓存，因此其他进程的修改最多延迟 check_interval 秒可见。
+    """
+
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0
+        self.max_entries = 1024
+        self.check_interval = 1.0
+        self._shared_version = None
+        self._checked = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', self.max_entries)
+        self.check_interval = app.config.get('RESPONSE_CACHE_CHECK_SECONDS', self.check_interval)
+        app.extensions['response_cache'] = self
+
+    def cached(self, key_func=None, ttl_key=None, bypass=None):
+        """缓存视图函数的200响应
+
+        key_func 返回值会作为缓存键的一部分(如文件mtime)；ttl_key 为配置项名，
+        缓存条目在该秒数后重新生成(用于包含下载量等不触发失效的数据的页面)；
+        bypass 返回True时本次请求不读写缓存。
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if bypass is not None and bypass():
+                    return f(*args, **kwargs)
+                self._sync()
+                key = (request.endpoint,
+                       tuple(sorted(kwargs.items())),
+                       tuple(sorted(request.args.items(multi=True))),
+                       key_func() if key_func else None)
+                entry = self._get(key, self._ttl(ttl_key))
+                if entry is None:
+                    version = self.version
+                    response = make_response(f(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    entry = self._store(key, version, response)
+                return self._respond(entry)
+            return wrapper
+        return decorator
+
+    def fragment(self, key, render, ttl_key=None):
+        """返回缓存的页面片段，不存在时调用 render() 生成"""
+        key = ('fragment', key)
+        self._sync()
+        entry = self._get(key, self._ttl(ttl_key))
+        if entry is None:
+            version = self.version
+            entry = {'body': render(), 'created': time.monotonic()}
+            self._put(key, version, entry)
+        return entry['body']
+
+    def invalidate(self):
+        """插件目录发生变化时清空所有缓存，并通知其他进程(修改提交后调用)"""
+        self._clear(bump_shared_version(RESPONSE_CACHE_VERSION))
+        current_app.logger.debug(f"响应缓存已失效, 版本: {self.version}")
+
+    def _sync(self):
+        """距上次检查超过 check_interval 秒时读取数据库中的缓存版本，与本进程不同时清空缓存"""
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        shared_version = read_shared_version(RESPONSE_CACHE_VERSION)
+        if shared_version != self._shared_version:
+            self._clear(shared_version)
+
+    def _clear(self, shared_version):
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+            self._shared_version = shared_version
+            self._checked = time.monotonic()
+
+    @staticmethod
+    def _ttl(ttl_key):
+        return float(current_app.config.get(ttl_key) or 0) if ttl_key else 0
+
+    def _get(self, key, ttl=0):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if ttl and time.monotonic() - entry['created'] >= ttl:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, version, entry):
+        with self._lock:
+            # 生成响应期间缓存被失效过时不保存，避免缓存旧数据
+            if version == self.version:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def _store(self, key, version, response):
+        body = response.get_data()
+        etag = hashlib.sha256(body).hexdigest()
+        # 过期后重新生成的内容没有变化时沿用原来的修改时间
+        with self._lock:
+            previous = self._entries.get(key)
+        if previous is not None and previous['etag'] == etag:
+            last_modified = previous['last_modified']
+        else:
+            last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        entry = {
+            'body': body,
+            'mimetype': response.mimetype,
+            'etag': etag,
+            'last_modified': last_modified,
+            'created': time.monotonic(),
+            'headers': {h: response.headers[h] for h in CACHED_HEADERS if h in response.headers}
+        }
+        self._put(key, version, entry)
+        return entry
+
+    def _respond(self, entry):
+        # 同时携带两者时以 If-None-Match 为准
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(entry['etag'])
+        else:
+            not_modified = request.if_modified_since is not None and \
+                entry['last_modified'] <= request.if_modified_since
+        if not_modified:
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+            response.headers.update(entry['headers'])
+        response.set_etag(entry['etag'])
+        response.last_modified = entry['last_modified']
+        # 要求客户端每次使用ETag重新验证
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+def has_flashed_messages():
+    """会话中有待显示的提示消息，此时页面因人而异不能缓存"""
+    return '_flashes' in session
+
+
+response_cache = ResponseCache()
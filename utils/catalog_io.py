@@ -0,0 +1,499 @@
+import json
+import os
+import tarfile
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, or_
+
+from models import db, User, Plugin, PluginVersion
+from utils.blob_store import blob_lock
+from utils.cache import response_cache
+from utils.changes import reconcile_change_log, record_updates
+from utils.facets import rebuild_category_facets
+from utils.icons import ICON_SIZES, ICON_FORMATS, rendition_path, release_icon
+from utils.manifests import SIDE_TABLES
+from utils.package_index import package_index
+from utils.package_scan import enqueue_scan
+from utils.search import rebuild_search_index
+from utils.uploads import CHUNK_SIZE
+from utils.versions import release_versions
+
+FORMAT = 'edgeplughub-catalog'
+FORMAT_VERSION = 1
+
+# tar 流中目录数据的文件名，其余成员为 UPLOAD_FOLDER 下的插件包和图标文件
+CATALOG_MEMBER = 'catalog.ndjson'
+BLOB_DIRS = ('packages', 'icons')
+
+# 每批读取和插入的记录数
+BATCH_SIZE = 1000
+
+# skip: 跳过ID已存在的插件；replace: 用导入的数据替换ID已存在的插件
+IMPORT_MODES = ('skip', 'replace')
+
+# 按依赖顺序导出，导入插件前作者必须已经导入
+TABLES = (('user', User.__table__), ('plugin', Plugin.__table__))
+# 导出为ISO格式字符串，导入时需要转换的列
+DATETIME_COLUMNS = {table.name: [c.key for c in table.columns if isinstance(c.type, db.DateTime)] for _, table in TABLES}
+
+
+class CatalogImportError(Exception):
+    """导入的数据格式无效"""
+
+
+# 导出
+
+def export_catalog(with_blobs=False):
+    """返回导出数据的字节块生成器
+
+    不带 with_blobs 时为NDJSON: 第一行为格式说明，随后依次为用户和插件，每行一条记录。
+    带 with_blobs 时为tar流，包含 catalog.ndjson 以及插件引用的插件包和图标文件。
+    数据库按批读取，文件按块读取，不会将整个目录载入内存。
+    """
+    if with_blobs:
+        return _tar_chunks()
+    return _ndjson_chunks(_export_lines())
+
+
+def _export_lines(blobs=None):
+    yield _dump({'type': 'header', 'format': FORMAT, 'version': FORMAT_VERSION,
+                 'exported_at': datetime.utcnow().isoformat()})
+    with db.engine.connect() as conn:
+        for kind, table in TABLES:
+            result = conn.execution_options(stream_results=True).execute(select(table))
+            for rows in result.partitions(BATCH_SIZE):
+                for row in rows:
+                    record = {'type': kind}
+                    record.update((key, _encode(value)) for key, value in row._mapping.items())
+                    if blobs is not None and kind == 'plugin':
+                        blobs.update(dict.fromkeys(_blob_paths(record)))
+                    yield _dump(record)
+
+
+def _ndjson_chunks(lines):
+    # 合并为较大的块输出，减少写入次数
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _dump(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _blob_paths(plugin):
+    """插件引用的文件相对于 UPLOAD_FOLDER 的路径"""
+    if plugin.get('package_path'):
+        yield plugin['package_path']
+    if plugin.get('icon_path'):
+        yield plugin['icon_path']
+    if plugin.get('icon_hash'):
+        for size in ICON_SIZES:
+            for fmt in ICON_FORMATS:
+                yield rendition_path(plugin['icon_hash'], size, fmt)
+
+
+def _tar_chunks():
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    mtime = int(time.time())
+    blobs = {}
+    # tar 成员头部需要文件大小，目录数据先写入临时文件
+    with tempfile.TemporaryFile() as catalog:
+        for chunk in _ndjson_chunks(_export_lines(blobs)):
+            catalog.write(chunk)
+        size = catalog.tell()
+        catalog.seek(0)
+        yield from _tar_member(CATALOG_MEMBER, size, mtime, catalog)
+
+    for rel_path in blobs:
+        full_path = os.path.join(upload_folder, rel_path)
+        if not _is_blob_path(rel_path) or not os.path.isfile(full_path):
+            continue
+        with open(full_path, 'rb') as f:
+            yield from _tar_member(rel_path.replace(os.sep, '/'), os.fstat(f.fileno()).st_size, mtime, f)
+    # tar 流以两个全零块结束
+    yield b'\0' * (2 * tarfile.BLOCKSIZE)
+
+
+def _tar_member(name, size, mtime, fileobj):
+    """逐块输出一个tar成员: 头部、内容和补齐到512字节的填充"""
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = mtime
+    info.mode = 0o644
+    yield info.tobuf(tarfile.PAX_FORMAT)
+    remaining = size
+    while remaining > 0:
+        chunk = fileobj.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise IOError(f"文件在导出过程中被截断: {name}")
+        remaining -= len(chunk)
+        yield chunk
+    if size % tarfile.BLOCKSIZE:
+        yield b'\0' * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE)
+
+
+def _is_blob_path(rel_path):
+    parts = os.path.normpath(rel_path).replace(os.sep, '/').split('/')
+    return len(parts) > 1 and parts[0] in BLOB_DIRS and '..' not in parts and not os.path.isabs(rel_path)
+
+
+# 导入
+
+def import_catalog(stream, mode='skip', batch_size=BATCH_SIZE):
+    """从 export_catalog 生成的NDJSON或tar流导入插件目录，返回各类记录的数量
+
+    用户按ID、用户名或邮箱匹配已有用户，已存在的用户不会被修改，其插件的作者指向已有用户。
+    插件按 mode 跳过或替换ID已存在的记录，被替换插件的版本历史和清单附属表一并删除，
+    提交后释放不再被引用的插件包和图标，并重新检查其插件包。全部记录在一个事务中按批插入，
+    tar流中的文件在提交前移入 UPLOAD_FOLDER，完成后重建全文索引、分类统计、变更日志和
+    插件包索引。数据无效时抛出 CatalogImportError，数据库和 UPLOAD_FOLDER 均不会被修改。
+    """
+    if mode not in IMPORT_MODES:
+        raise CatalogImportError(f"Invalid mode: {mode}")
+    head = stream.read(tarfile.BLOCKSIZE)
+    reader = _PrefixedReader(head, stream)
+    if head.lstrip()[:1] == b'{':
+        importer = _import_records(_iter_lines(reader.read), mode, batch_size)
+    else:
+        importer = _import_tar(reader, mode, batch_size)
+    # 释放文件时需要获取 blob_lock，在 _import_tar 持有的锁之外执行
+    release_versions(importer.superseded_packages)
+    for icon_hash in set(importer.superseded_icons):
+        release_icon(icon_hash)
+    for plugin_id in importer.replaced:
+        enqueue_scan(plugin_id)
+    stats = dict(importer.stats)
+    current_app.logger.info(f"插件目录导入完成: {stats}")
+    return stats
+
+
+def _import_tar(reader, mode, batch_size):
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    # 先将整个归档解包到 UPLOAD_FOLDER 下的临时目录，读取完成后才导入记录，
+    # 归档被截断或损坏时不会留下已提交的记录或文件
+    with tempfile.TemporaryDirectory(dir=upload_folder, prefix='.import-') as staging:
+        catalog_path = os.path.join(staging, CATALOG_MEMBER)
+        names = []
+        try:
+            with tarfile.open(fileobj=reader, mode='r|*') as tar:
+                for member in tar:
+                    if member.name == CATALOG_MEMBER:
+                        _extract_blob(tar.extractfile(member), staging, CATALOG_MEMBER)
+                    elif member.isfile() and _is_blob_path(member.name):
+                        if not os.path.exists(catalog_path):
+                            raise CatalogImportError(f"{CATALOG_MEMBER} must be the first member")
+                        name = os.path.normpath(member.name)
+                        # 已存在的文件不再解包(内容寻址的文件相同路径内容相同)
+                        if os.path.exists(os.path.join(upload_folder, name)):
+                            continue
+                        if _extract_blob(tar.extractfile(member), staging, name):
+                            names.append(name)
+        except tarfile.TarError as e:
+            raise CatalogImportError(f"Invalid archive: {str(e)}")
+        if not os.path.exists(catalog_path):
+            raise CatalogImportError(f"Missing {CATALOG_MEMBER}")
+
+        # 持有插件包锁直到记录提交，避免移入的插件包在提交前被当作无引用的文件删除
+        with open(catalog_path, 'rb') as f, blob_lock():
+            return _import_records(_iter_lines(f.read), mode, batch_size,
+                                   install_files=lambda: _install_files(staging, names, upload_folder))
+
+
+def _extract_blob(source, upload_folder, name):
+    """写入插件包或图标文件，已存在时跳过(内容寻址的文件相同路径内容相同)"""
+    dest = os.path.join(upload_folder, os.path.normpath(name))
+    if os.path.exists(dest):
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest), prefix='.import-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+        os.replace(tmp_path, dest)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def _install_files(staging, names, upload_folder):
+    """将解包到临时目录的文件移入 UPLOAD_FOLDER，返回移入的文件数"""
+    count = 0
+    for name in names:
+        dest = os.path.join(upload_folder, name)
+        if os.path.exists(dest):
+            continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(os.path.join(staging, name), dest)
+        count += 1
+    return count
+
+
+def _import_records(lines, mode, batch_size, install_files=None):
+    """在一个事务中导入记录并返回 _Importer，install_files 在提交前调用，返回移入的文件数，失败时事务回滚"""
+    with db.engine.begin() as conn:
+        importer = _Importer(conn, mode, batch_size)
+        for line_no, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise CatalogImportError(f"Invalid JSON on line {line_no}")
+            if not isinstance(record, dict):
+                raise CatalogImportError(f"Invalid record on line {line_no}")
+            importer.add(record, line_no)
+        importer.finish()
+        if install_files is not None:
+            importer.stats['files'] = install_files()
+
+    # 批量插入不触发映射器事件，统一重建派生数据
+    rebuild_search_index()
+    rebuild_category_facets()
+    reconcile_change_log()
+    record_updates(importer.replaced)
+    package_index.build(db.session.query(Plugin.id, Plugin.name, Plugin.package_path).all())
+    db.session.expire_all()
+    response_cache.invalidate()
+    return importer
+
+
+class _Importer:
+    def __init__(self, conn, mode, batch_size):
+        self.conn = conn
+        self.mode = mode
+        self.batch_size = batch_size
+        self.stats = Counter(users=0, plugins=0, skipped_users=0, skipped_plugins=0, replaced=0, files=0)
+        self.header = None
+        # 导入数据中的用户ID -> 数据库中的用户ID
+        self.user_ids = {}
+        self.replaced = []
+        # 被替换的插件及其版本历史引用的插件包和图标，提交后按引用释放
+        self.superseded_packages = []
+        self.superseded_icons = []
+        self._pending = {kind: [] for kind, _ in TABLES}
+
+    def add(self, record, line_no):
+        kind = record.pop('type', None)
+        if self.header is None:
+            if kind != 'header' or record.get('format') != FORMAT:
+                raise CatalogImportError("Not an EdgePlugHub catalog export")
+            if record.get('version', 0) > FORMAT_VERSION:
+                raise CatalogImportError(f"Unsupported catalog version: {record.get('version')}")
+            self.header = record
+            return
+        if kind not in self._pending:
+            raise CatalogImportError(f"Unknown record type on line {line_no}: {kind}")
+        pending = self._pending[kind]
+        pending.append(_decode(dict(TABLES)[kind], record, line_no))
+        if kind == 'plugin' and self._pending['user']:
+            # 作者在插件之前导出，插件的作者ID需要按已导入的用户映射
+            self._flush_users()
+        if len(pending) >= self.batch_size:
+            self._flush(kind)
+
+    def finish(self):
+        if self.header is None:
+            raise CatalogImportError("Empty catalog")
+        for kind, _ in TABLES:
+            self._flush(kind)
+
+    def _flush(self, kind):
+        if not self._pending[kind]:
+            return
+        if kind == 'user':
+            self._flush_users()
+        else:
+            self._flush_plugins()
+
+    def _flush_users(self):
+        rows, self._pending['user'] = self._pending['user'], []
+        table = User.__table__
+        existing = self.conn.execute(select(table.c.id, table.c.username, table.c.email).where(or_(
+            table.c.id.in_([r['id'] for r in rows]),
+            table.c.username.in_([r['username'] for r in rows]),
+            table.c.email.in_([r['email'] for r in rows])))).all()
+        by_id = {u.id: u.id for u in existing}
+        by_username = {u.username: u.id for u in existing}
+        by_email = {u.email: u.id for u in existing}
+        new_rows = []
+        for row in rows:
+            match = by_id.get(row['id']) or by_username.get(row['username']) or by_email.get(row['email'])
+            if match:
+                self.user_ids[row['id']] = match
+                self.stats['skipped_users'] += 1
+            else:
+                self.user_ids[row['id']] = row['id']
+                by_username[row['username']] = by_email[row['email']] = row['id']
+                new_rows.append(row)
+        if new_rows:
+            self.conn.execute(table.insert(), new_rows)
+            self.stats['users'] += len(new_rows)
+
+    def _flush_plugins(self):
+        rows, self._pending['plugin'] = self._pending['plugin'], []
+        table = Plugin.__table__
+        unknown = {r['author_id'] for r in rows if r['author_id'] not in self.user_ids}
+        if unknown:
+            known = set(self.conn.execute(select(User.__table__.c.id).where(User.__table__.c.id.in_(unknown))).scalars())
+            if unknown - known:
+                raise CatalogImportError(f"Unknown author: {sorted(unknown - known)[0]}")
+            self.user_ids.update((user_id, user_id) for user_id in known)
+        for row in rows:
+            row['author_id'] = self.user_ids[row['author_id']]
+
+        ids = [r['id'] for r in rows]
+        existing = set(self.conn.execute(select(table.c.id).where(table.c.id.in_(ids))).scalars())
+        if existing:
+            if self.mode == 'skip':
+                rows = [r for r in rows if r['id'] not in existing]
+                self.stats['skipped_plugins'] += len(existing)
+            else:
+                self._delete_plugins(existing)
+                self.replaced.extend(existing)
+                self.stats['replaced'] += len(existing)
+        if rows:
+            self.conn.execute(table.insert(), rows)
+            self.stats['plugins'] += len(rows) - (len(existing) if self.mode == 'replace' else 0)
+
+    def _delete_plugins(self, plugin_ids):
+        """删除被替换的插件及其附属记录
+
+        Core 删除不触发映射器事件，版本历史和清单附属表需要在同一事务中显式删除；
+        全文索引、分类统计和变更日志在导入完成后统一重建。
+        """
+        table = Plugin.__table__
+        versions = PluginVersion.__table__
+        for package_path, icon_hash in self.conn.execute(
+                select(table.c.package_path, table.c.icon_hash).where(table.c.id.in_(plugin_ids))):
+            if package_path:
+                self.superseded_packages.append(package_path)
+            if icon_hash:
+                self.superseded_icons.append(icon_hash)
+        self.superseded_packages.extend(self.conn.execute(
+            select(versions.c.package_path).where(versions.c.plugin_id.in_(plugin_ids))).scalars())
+        for model in SIDE_TABLES + (PluginVersion,):
+            side_table = model.__table__
+            self.conn.execute(side_table.delete().where(side_table.c.plugin_id.in_(plugin_ids)))
+        self.conn.execute(table.delete().where(table.c.id.in_(plugin_ids)))
+
+
+def _decode(table, record, line_no):
+    """将导出的记录转换为可插入的行，缺少的列使用模型的默认值"""
+    row = {column.key: record[column.key] for column in table.columns if column.key in record}
+    if len(row) < len(table.columns):
+        for column in table.columns:
+            if column.key in row:
+                continue
+            if column.default is not None:
+                row[column.key] = column.default.arg(None) if column.default.is_callable else column.default.arg
+            elif column.nullable:
+                row[column.key] = None
+            else:
+                raise CatalogImportError(f"Missing {column.key} on line {line_no}")
+    for key in DATETIME_COLUMNS[table.name]:
+        if isinstance(row[key], str):
+            try:
+                row[key] = datetime.fromisoformat(row[key])
+            except ValueError:
+                raise CatalogImportError(f"Invalid {key} on line {line_no}")
+    return row
+
+
+def _iter_lines(read):
+    """按行读取字节流，每次读取 CHUNK_SIZE 字节"""
+    rest = b''
+    while True:
+        chunk = read(CHUNK_SIZE)
+        if not chunk:
+            break
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
+
+
+class _PrefixedReader:
+    """先返回已读取的开头部分，再继续读取原始流"""
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size=-1):
+        if not self._head:
+            return self._stream.read(size)
+        if size is None or size < 0:
+            data, self._head = self._head + self._stream.read(), b''
+            return data
+        data, self._head = self._head[:size], self._head[size:]
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+
+# 命令行: flask catalog export / flask catalog import
+
+catalog_cli = AppGroup('catalog', help='插件目录的批量导出和导入')
+
+
+@catalog_cli.command('export')
+@click.option('-o', '--output', default='-', help='输出文件，- 表示标准输出')
+@click.option('--with-blobs', is_flag=True, help='输出tar流，同时包含插件包和图标文件')
+def export_command(output, with_blobs):
+    """导出用户和插件"""
+    started = time.perf_counter()
+    target = click.get_binary_stream('stdout') if output == '-' else open(output, 'wb')
+    size = 0
+    try:
+        for chunk in export_catalog(with_blobs):
+            target.write(chunk)
+            size += len(chunk)
+    finally:
+        if output != '-':
+            target.close()
+    click.echo(f"已导出 {size} 字节，耗时 {time.perf_counter() - started:.2f}s", err=True)
+
+
+@catalog_cli.command('import')
+@click.argument('source', default='-')
+@click.option('--mode', type=click.Choice(IMPORT_MODES), default='skip', show_default=True,
+              help='插件ID已存在时跳过或替换')
+@click.option('--batch-size', type=int, default=BATCH_SIZE, show_default=True, help='每批插入的记录数')
+def import_command(source, mode, batch_size):
+    """从 export 生成的NDJSON或tar文件导入"""
+    started = time.perf_counter()
+    stream = click.get_binary_stream('stdin') if source == '-' else open(source, 'rb')
+    try:
+        stats = import_catalog(stream, mode=mode, batch_size=batch_size)
+    except CatalogImportError as e:
+        raise click.ClickException(str(e))
+    finally:
+        if source != '-':
+            stream.close()
+    summary = ', '.join(f'{key}={value}' for key, value in stats.items())
+    click.echo(f"导入完成: {summary}，耗时 {time.perf_counter() - started:.2f}s", err=True)
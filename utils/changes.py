@@ -0,0 +1,137 @@
+from datetime import datetime
+
+from sqlalchemy import bindparam, event, text
+
+from models import db, Plugin, CatalogChange
+
+# 边缘设备可见的插件目录只包含已批准的插件
+VISIBLE_STATUS = 'approved'
+
+# 下载量等由计数器更新的列变化不计为插件修改
+IGNORED_COLUMNS = frozenset(('downloads', 'updated_at'))
+
+_PREVIOUS = text("SELECT visible_since FROM catalog_change WHERE plugin_id = :plugin_id")
+_DELETE = text("DELETE FROM catalog_change WHERE plugin_id = :plugin_id")
+_INSERT = text(
+    "INSERT INTO catalog_change (plugin_id, removed, visible_since, changed_at) "
+    "VALUES (:plugin_id, :removed, :visible_since, :changed_at)")
+# 新进入目录的插件的 visible_since 为本次变更的 seq
+_MARK_VISIBLE = text(
+    "UPDATE catalog_change SET visible_since = seq "
+    "WHERE plugin_id = :plugin_id AND visible_since IS NULL AND NOT removed")
+_MARK_ALL_VISIBLE = text("UPDATE catalog_change SET visible_since = seq WHERE visible_since IS NULL AND NOT removed")
+_PREVIOUS_MANY = text(
+    "SELECT plugin_id, visible_since FROM catalog_change WHERE plugin_id IN :plugin_ids").bindparams(
+        bindparam('plugin_ids', expanding=True))
+_VISIBLE_MANY = text("SELECT id FROM plugin WHERE status = :status AND id IN :plugin_ids").bindparams(
+    bindparam('plugin_ids', expanding=True))
+
+# IN 查询每次最多的参数数
+IN_BATCH_SIZE = 500
+
+
+def parse_token(value):
+    """解析变更令牌，未指定时为0，格式错误时抛出 ValueError"""
+    if value is None or value == '':
+        return 0
+    if not value.isdigit():
+        raise ValueError(f"Invalid token: {value}")
+    return int(value)
+
+
+def latest_seq():
+    return db.session.query(db.func.max(CatalogChange.seq)).scalar() or 0
+
+
+def changes_since(since, limit):
+    """返回 seq 大于 since 的变更记录，按 seq 排序，最多 limit 条"""
+    return CatalogChange.query.filter(CatalogChange.seq > since).order_by(CatalogChange.seq).limit(limit).all()
+
+
+def _record(connection, plugin_id, removed, added=False):
+    """记录插件的一次变更，并删除该插件之前的变更记录"""
+    visible_since = None
+    if not added:
+        visible_since = connection.execute(_PREVIOUS, {'plugin_id': plugin_id}).scalar()
+    connection.execute(_DELETE, {'plugin_id': plugin_id})
+    connection.execute(_INSERT, {'plugin_id': plugin_id, 'removed': removed,
+                                 'visible_since': visible_since, 'changed_at': datetime.utcnow()})
+    connection.execute(_MARK_VISIBLE, {'plugin_id': plugin_id})
+
+
+def _record_many(connection, plugin_ids, removed, added=False):
+    """批量记录变更，结果与逐个调用 _record 相同"""
+    if not plugin_ids:
+        return
+    previous = {}
+    if not added:
+        for start in range(0, len(plugin_ids), IN_BATCH_SIZE):
+            previous.update(connection.execute(
+                _PREVIOUS_MANY, {'plugin_ids': plugin_ids[start:start + IN_BATCH_SIZE]}).all())
+    now = datetime.utcnow()
+    connection.execute(_DELETE, [{'plugin_id': plugin_id} for plugin_id in plugin_ids])
+    connection.execute(_INSERT, [{'plugin_id': plugin_id, 'removed': removed,
+                                  'visible_since': previous.get(plugin_id), 'changed_at': now}
+                                 for plugin_id in plugin_ids])
+    connection.execute(_MARK_ALL_VISIBLE)
+
+
+def reconcile_change_log():
+    """补齐绕过ORM写入的插件的变更记录(启动时和批量导入数据后调用)
+
+    已批准但没有有效记录的插件记为新增，有有效记录但已不在目录中的插件记为移除。
+    """
+    with db.engine.begin() as conn:
+        added = conn.execute(text(
+            "SELECT p.id FROM plugin p LEFT JOIN catalog_change c ON c.plugin_id = p.id "
+            "WHERE p.status = :status AND (c.seq IS NULL OR c.removed)"), {'status': VISIBLE_STATUS}).scalars().all()
+        removed = conn.execute(text(
+            "SELECT c.plugin_id FROM catalog_change c LEFT JOIN plugin p ON p.id = c.plugin_id "
+            "WHERE NOT c.removed AND (p.id IS NULL OR p.status != :status)"), {'status': VISIBLE_STATUS}).scalars().all()
+        _record_many(conn, added, removed=False, added=True)
+        _record_many(conn, removed, removed=True)
+    return len(added) + len(removed)
+
+
+def record_updates(plugin_ids):
+    """将绕过ORM整体替换的插件记为修改(在 reconcile_change_log 之后调用)"""
+    plugin_ids = list(plugin_ids)
+    with db.engine.begin() as conn:
+        visible = []
+        for start in range(0, len(plugin_ids), IN_BATCH_SIZE):
+            visible.extend(conn.execute(_VISIBLE_MANY, {
+                'status': VISIBLE_STATUS, 'plugin_ids': plugin_ids[start:start + IN_BATCH_SIZE]}).scalars())
+        _record_many(conn, visible, removed=False)
+
+
+def _stored_status(connection, plugin_id):
+    # 与分类统计相同，修改前的状态从数据库读取
+    return connection.execute(text("SELECT status FROM plugin WHERE id = :id"), {'id': plugin_id}).scalar()
+
+
+# 插件创建、审核、修改和删除时在同一事务中写入变更日志
+
+@event.listens_for(Plugin, 'after_insert')
+def _log_new_plugin(mapper, connection, target):
+    if target.status == VISIBLE_STATUS:
+        _record(connection, target.id, removed=False, added=True)
+
+
+@event.listens_for(Plugin, 'before_update')
+def _log_updated_plugin(mapper, connection, target):
+    state = db.inspect(target)
+    if not any(attr.history.has_changes() for attr in state.attrs
+               if attr.key in mapper.column_attrs and attr.key not in IGNORED_COLUMNS):
+        return
+    was_visible = _stored_status(connection, target.id) == VISIBLE_STATUS
+    is_visible = target.status == VISIBLE_STATUS
+    if is_visible:
+        _record(connection, target.id, removed=False, added=not was_visible)
+    elif was_visible:
+        _record(connection, target.id, removed=True)
+
+
+@event.listens_for(Plugin, 'before_delete')
+def _log_deleted_plugin(mapper, connection, target):
+    if _stored_status(connection, target.id) == VISIBLE_STATUS:
+        _record(connection, target.id, removed=True)
@@ -0,0 +1,90 @@
+import atexit
+import threading
+from collections import Counter
+
+from sqlalchemy import bindparam
+
+from models import db, Plugin
+from utils.facets import ADD_DOWNLOADS
+
+
+class DownloadCounter:
+    """批量异步的插件下载计数器
+
+    请求中只在内存里累加计数，后台线程每隔 DOWNLOAD_FLUSH_INTERVAL 秒用一条
+    批量 UPDATE ... SET downloads = downloads + :n 写入数据库(同时累加分类下载总数)，进程退出时也会
+    写入剩余的计数，避免每次下载都开启一个写事务。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 5.0
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = float(app.config.get('DOWNLOAD_FLUSH_INTERVAL', self.interval))
+        app.extensions['download_counter'] = self
+        atexit.register(self.shutdown)
+
+    def increment(self, plugin_id, n=1):
+        with self._lock:
+            self._pending[plugin_id] += n
+        self._ensure_thread()
+
+    def pending(self, plugin_id):
+        """尚未写入数据库的下载次数"""
+        with self._lock:
+            return self._pending.get(plugin_id, 0)
+
+    def flush(self):
+        """将累计的计数写入数据库，返回写入的插件数量"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+            if not pending:
+                return 0
+            table = Plugin.__table__
+            stmt = table.update().where(table.c.id == bindparam('plugin_id')).values(
+                downloads=table.c.downloads + bindparam('n'))
+            try:
+                # 不推入应用上下文: 上下文退出时会移除当前线程的数据库会话
+                params = [{'plugin_id': pid, 'n': n} for pid, n in pending.items()]
+                with db.get_engine(self.app).begin() as conn:
+                    conn.execute(stmt, params)
+                    conn.execute(ADD_DOWNLOADS, params)
+            except Exception as e:
+                # 写入失败时将计数放回，下次再试
+                with self._lock:
+                    self._pending.update(pending)
+                self.app.logger.error(f"写入下载计数失败: {str(e)}")
+                return 0
+            return len(pending)
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='download-counter', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+download_counter = DownloadCounter()
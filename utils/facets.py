@@ -0,0 +1,87 @@
+from sqlalchemy import event, text
+
+from models import db, Plugin
+
+# 分类统计只计入已批准的插件
+COUNTED_STATUS = 'approved'
+
+_APPLY_DELTA = text(
+    "INSERT INTO category_facet (category, plugin_count, downloads) VALUES (:category, :count, :downloads) "
+    "ON CONFLICT(category) DO UPDATE SET plugin_count = plugin_count + excluded.plugin_count, "
+    "downloads = downloads + excluded.downloads")
+
+_DROP_EMPTY = text("DELETE FROM category_facet WHERE category = :category AND plugin_count <= 0")
+
+# 下载计数器批量写入时同步累加分类下载总数
+ADD_DOWNLOADS = text(
+    "UPDATE category_facet SET downloads = downloads + :n WHERE category = "
+    f"(SELECT category FROM plugin WHERE id = :plugin_id AND status = '{COUNTED_STATUS}')")
+
+
+def rebuild_category_facets():
+    """根据 plugin 表重新计算分类统计(启动时和批量导入数据后调用)"""
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM category_facet"))
+        conn.execute(text(
+            "INSERT INTO category_facet (category, plugin_count, downloads) "
+            "SELECT category, COUNT(*), COALESCE(SUM(downloads), 0) FROM plugin "
+            "WHERE status = :status GROUP BY category"), {'status': COUNTED_STATUS})
+
+
+def _apply(connection, category, count, downloads):
+    if not count and not downloads:
+        return
+    connection.execute(_APPLY_DELTA, {'category': category, 'count': count, 'downloads': downloads})
+    if count < 0:
+        connection.execute(_DROP_EMPTY, {'category': category})
+
+
+def _contribution(status, category, downloads):
+    """插件对分类统计的贡献: (分类, 插件数, 下载数)，不计入时返回None"""
+    if status != COUNTED_STATUS:
+        return None
+    return category, 1, downloads or 0
+
+
+def _stored_row(connection, plugin_id):
+    # 修改前的值从数据库读取: 会话中的对象提交后会过期，重新赋值时没有旧值；
+    # 下载计数器也绕过ORM直接累加数据库中的下载数
+    return connection.execute(text("SELECT status, category, downloads FROM plugin WHERE id = :id"),
+                              {'id': plugin_id}).first()
+
+
+# 插件创建、审核、修改和删除时在同一事务中更新分类统计
+
+@event.listens_for(Plugin, 'after_insert')
+def _count_new_plugin(mapper, connection, target):
+    new = _contribution(target.status, target.category, target.downloads)
+    if new:
+        _apply(connection, *new)
+
+
+@event.listens_for(Plugin, 'before_update')
+def _count_updated_plugin(mapper, connection, target):
+    state = db.inspect(target)
+    if not any(state.attrs[f].history.has_changes() for f in ('status', 'category', 'downloads')):
+        return
+    status, category, downloads = _stored_row(connection, target.id)
+    old = _contribution(status, category, downloads)
+    if state.attrs.downloads.history.has_changes():
+        downloads = target.downloads
+    new = _contribution(target.status, target.category, downloads)
+    # 先按分类合并增量，同一分类内的修改只执行一次更新
+    deltas = {}
+    for contribution, sign in ((old, -1), (new, 1)):
+        if contribution:
+            category, count, downloads = contribution
+            total = deltas.get(category, (0, 0))
+            deltas[category] = (total[0] + sign * count, total[1] + sign * downloads)
+    for category, (count, downloads) in deltas.items():
+        _apply(connection, category, count, downloads)
+
+
+@event.listens_for(Plugin, 'before_delete')
+def _count_deleted_plugin(mapper, connection, target):
+    old = _contribution(*_stored_row(connection, target.id))
+    if old:
+        _apply(connection, old[0], -old[1], -old[2])
@@ -0,0 +1,206 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from flask import current_app, request, send_file
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from models import Plugin
+from utils.blob_store import blob_lock
+from utils.jobs import job_queue
+from utils.uploads import UploadError
+
+# 图标统一处理为正方形，按以下尺寸生成 WebP 和 PNG 两种格式
+ICON_SIZES = (32, 64, 128, 256)
+ICON_FORMATS = {'webp': 'image/webp', 'png': 'image/png'}
+DEFAULT_ICON_SIZE = 256
+
+# 内容寻址的图标永不改变，客户端可以长期缓存
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def icons_dir():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'icons')
+
+
+def rendition_path(icon_hash, size, fmt):
+    """图标变体相对于 UPLOAD_FOLDER 的路径"""
+    return os.path.join('icons', icon_hash, f'{size}.{fmt}')
+
+
+def save_icon(source):
+    """将上传的图标处理为各尺寸的 WebP/PNG 变体并按内容寻址保存
+
+    source 为上传的文件或本地文件路径，返回原始文件内容的SHA-256，相同的图标
+    只处理和保存一次。图片无效时抛出 UploadError。
+    """
+    data = _read_icon(source)
+    icon_hash = hashlib.sha256(data).hexdigest()
+    if not os.path.isdir(os.path.join(icons_dir(), icon_hash)):
+        _write_renditions(icon_hash, data)
+    return icon_hash
+
+
+def store_icon(source):
+    """校验上传的图标并保存原始文件，返回其SHA-256
+
+    只读取图片头部进行校验，各尺寸变体由 render_icon 任务在后台生成，生成之前
+    send_icon 返回原始文件。调用方从调用本函数到提交引用该图标的记录都需持有
+    blob_lock()。图片无效时抛出 UploadError。
+    """
+    data = _read_icon(source)
+    icon_hash = hashlib.sha256(data).hexdigest()
+    if os.path.isdir(os.path.join(icons_dir(), icon_hash)):
+        return icon_hash
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+        raise UploadError("Invalid icon image")
+    os.makedirs(icons_dir(), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=icons_dir(), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, source_path(icon_hash))
+    return icon_hash
+
+
+def source_path(icon_hash):
+    """等待生成变体的图标原始文件路径"""
+    return os.path.join(icons_dir(), f'{icon_hash}.source')
+
+
+@job_queue.handler('render_icon')
+def render_icon(icon_hash):
+    """由 store_icon 保存的原始文件生成各尺寸变体，完成后删除原始文件"""
+    target = os.path.join(icons_dir(), icon_hash)
+    source = source_path(icon_hash)
+    # 图标在生成前已随插件删除
+    if not os.path.isdir(target) and not os.path.exists(source):
+        return
+    if not os.path.isdir(target):
+        with open(source, 'rb') as f:
+            _write_renditions(icon_hash, f.read())
+    if os.path.exists(source):
+        os.remove(source)
+
+
+def _read_icon(source):
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    source.stream.seek(0)
+    return source.stream.read()
+
+
+def _write_renditions(icon_hash, data):
+    target = os.path.join(icons_dir(), icon_hash)
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image).convert('RGBA')
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise UploadError("Invalid icon image")
+
+    # 非正方形的图标居中放在透明背景上
+    side = max(image.size)
+    square = Image.new('RGBA', (side, side), (0, 0, 0, 0))
+    square.paste(image, ((side - image.width) // 2, (side - image.height) // 2))
+
+    # 先写入临时目录，全部变体生成后再原子地重命名
+    os.makedirs(icons_dir(), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=icons_dir(), prefix='.tmp-')
+    try:
+        for size in ICON_SIZES:
+            resized = square.resize((size, size), Image.LANCZOS)
+            resized.save(os.path.join(tmp_dir, f'{size}.png'), 'PNG', optimize=True)
+            resized.save(os.path.join(tmp_dir, f'{size}.webp'), 'WEBP', quality=85, method=4)
+        os.rename(tmp_dir, target)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        # 并发处理相同的图标时目录已由另一个请求创建
+        if not os.path.isdir(target):
+            raise
+
+
+def release_icon(icon_hash):
+    """插件记录删除后调用，没有其他插件引用该图标时删除其所有变体"""
+    if not icon_hash:
+        return False
+    with blob_lock():
+        if Plugin.query.filter_by(icon_hash=icon_hash).count() > 0:
+            return False
+        shutil.rmtree(os.path.join(icons_dir(), icon_hash), ignore_errors=True)
+        if os.path.exists(source_path(icon_hash)):
+            os.remove(source_path(icon_hash))
+    current_app.logger.info(f"已删除不再被引用的图标: {icon_hash}")
+    return True
+
+
+def parse_icon_size(value):
+    """返回不小于请求尺寸的最小变体尺寸，请求尺寸超过最大尺寸时返回最大尺寸"""
+    if value is None or value == '':
+        return DEFAULT_ICON_SIZE
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid size: {value}")
+    if size <= 0:
+        raise ValueError(f"Invalid size: {value}")
+    for candidate in ICON_SIZES:
+        if candidate >= size:
+            return candidate
+    return ICON_SIZES[-1]
+
+
+def negotiate_format():
+    """format 参数优先，否则客户端明确声明支持 image/webp 时返回WebP，其余返回PNG"""
+    fmt = request.args.get('format')
+    if fmt:
+        if fmt not in ICON_FORMATS:
+            raise ValueError(f"Invalid format: {fmt}")
+        return fmt
+    if any(mimetype == 'image/webp' and quality > 0 for mimetype, quality in request.accept_mimetypes):
+        return 'webp'
+    return 'png'
+
+
+def send_icon(icon_hash, immutable=False):
+    """按请求的 size/format 发送图标变体，变体尚未生成时发送原始文件，都不存在时返回None"""
+    size = parse_icon_size(request.args.get('size'))
+    fmt = negotiate_format()
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], rendition_path(icon_hash, size, fmt))
+    if not os.path.exists(path):
+        return _send_source(icon_hash)
+    response = send_file(path, mimetype=ICON_FORMATS[fmt], conditional=True,
+                         etag=f'{icon_hash}-{size}.{fmt}')
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache'
+    response.vary.add('Accept')
+    return response
+
+
+def _send_source(icon_hash):
+    """发送等待生成变体(或生成失败)的图标原始文件，变体生成后内容会改变，不允许长期缓存"""
+    path = source_path(icon_hash)
+    try:
+        with Image.open(path) as image:
+            mimetype = Image.MIME.get(image.format)
+    except (FileNotFoundError, UnidentifiedImageError):
+        return None
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=f'{icon_hash}-source')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def is_icon_hash(value):
+    return len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+def backfill_icon(plugin, legacy_path):
+    """为只有原始图标文件的旧插件生成图标变体，调用方负责提交"""
+    plugin.icon_hash = save_icon(legacy_path)
+    if not plugin.icon_path:
+        plugin.icon_path = rendition_path(plugin.icon_hash, DEFAULT_ICON_SIZE, 'png')
+    current_app.logger.info(f"已为插件 {plugin.id} 生成图标变体: {plugin.icon_hash}")
+    return plugin.icon_hash
@@ -0,0 +1,200 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path, exclusive=True):
+    """跨进程文件锁，exclusive=False 时为共享锁(Windows下总是独占)"""
+    with open(path, 'a+') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write_json(path, data):
+    """写入临时文件并fsync后原子替换目标文件，崩溃时不会留下截断的文件"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path), suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class InstalledPluginsStore:
+    """已安装插件记录的事务性存储
+
+    installed_plugins.json 为快照文件，每次写入以一行JSON追加到
+    installed_plugins.json.log 变更日志并fsync，写入为O(1)。读取时在快照上
+    重放变更日志；日志超过 compact_threshold 条时写入新快照(临时文件+原子替换)
+    并清空日志。所有读写都持有跨进程文件锁，多个worker并发写入不会丢失更新。
+    重放操作是幂等的，压缩过程中崩溃不会导致数据错误。
+    """
+
+    def __init__(self, path=None, compact_threshold=1000):
+        self.path = path
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._records = {}
+        self._snapshot_signature = None
+        self._log_offset = 0
+        self._log_entries = 0
+
+    def init_app(self, app):
+        self.path = os.path.join(app.config['DATA_DIR'], 'installed_plugins.json')
+        self.compact_threshold = app.config.get('INSTALLED_LOG_COMPACT_THRESHOLD', self.compact_threshold)
+        app.extensions['installed_plugins'] = self
+
+    @property
+    def log_path(self):
+        return self.path + '.log'
+
+    @property
+    def lock_path(self):
+        return self.path + '.lock'
+
+    def all(self):
+        """返回已安装插件记录列表"""
+        with self._locked(exclusive=False):
+            return list(self._records.values())
+
+    def get(self, plugin_id):
+        with self._locked(exclusive=False):
+            return self._records.get(plugin_id)
+
+    def upsert(self, plugin_id, data):
+        """添加已安装插件，已存在时更新其字段"""
+        entry = {'op': 'upsert', 'id': plugin_id, 'data': data,
+                 'install_date': datetime.now().isoformat()}
+        with self._locked(exclusive=True):
+            self._append(entry)
+
+    def remove(self, plugin_id):
+        """移除已安装插件，插件不存在时返回False"""
+        with self._locked(exclusive=True):
+            if plugin_id not in self._records:
+                return False
+            self._append({'op': 'remove', 'id': plugin_id})
+            return True
+
+    def compact(self):
+        """将当前状态写入快照并清空变更日志"""
+        with self._locked(exclusive=True):
+            self._compact()
+
+    @contextmanager
+    def _locked(self, exclusive):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._lock, file_lock(self.lock_path, exclusive):
+            self._refresh()
+            yield
+
+    def _refresh(self):
+        # 快照变化(其他进程压缩过)时全量重新加载，否则只读取日志新增的部分
+        signature = self._stat(self.path)
+        if signature != self._snapshot_signature:
+            self._records = {}
+            if signature is not None:
+                with open(self.path, 'r') as f:
+                    for record in json.load(f):
+                        self._records[record.get('id')] = record
+            self._snapshot_signature = signature
+            self._log_offset = 0
+            self._log_entries = 0
+        try:
+            log_size = os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            log_size = 0
+        if log_size < self._log_offset:
+            # 日志被截断但快照未变化，重新读取整个日志
+            self._log_offset = 0
+            self._log_entries = 0
+        if log_size > self._log_offset:
+            with open(self.log_path, 'rb') as f:
+                f.seek(self._log_offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # 崩溃时未写完的最后一行，忽略
+                        break
+                    self._log_offset += len(line)
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        continue
+                    self._log_entries += 1
+
+    def _apply(self, entry):
+        plugin_id = entry['id']
+        if entry['op'] == 'upsert':
+            existing = self._records.get(plugin_id)
+            if existing is not None:
+                existing.update(entry['data'])
+            else:
+                record = dict(entry['data'])
+                record.setdefault('id', plugin_id)
+                record['install_date'] = entry['install_date']
+                self._records[plugin_id] = record
+        elif entry['op'] == 'remove':
+            self._records.pop(plugin_id, None)
+
+    def _append(self, entry):
+        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(self.log_path, 'ab') as f:
+            # 崩溃留下的未写完的最后一行(_refresh 停在其之前)先截掉，否则新记录会接在其后无法解析
+            if f.tell() > self._log_offset:
+                f.truncate(self._log_offset)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply(entry)
+        self._log_offset += len(line)
+        self._log_entries += 1
+        if self._log_entries >= self.compact_threshold:
+            self._compact()
+
+    def _compact(self):
+        atomic_write_json(self.path, list(self._records.values()))
+        # 快照已包含全部变更，此时崩溃只会导致日志被重放一次
+        with open(self.log_path, 'wb') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._snapshot_signature = self._stat(self.path)
+        self._log_offset = 0
+        self._log_entries = 0
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+
+installed_plugins = InstalledPluginsStore()
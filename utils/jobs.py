@@ -0,0 +1,220 @@
+import atexit
+import json
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import update
+
+from models import db, Job
+
+QUEUED, RUNNING, FAILED = 'queued', 'running', 'failed'
+
+
+class JobQueue:
+    """持久化在数据库中的后台任务队列
+
+    enqueue() 将任务写入 job 表并唤醒后台工作线程(JOBS_WORKERS 个，首次入队时启动)，
+    工作线程逐个认领到期的任务并调用 handler() 注册的处理函数。执行成功的任务被删除；
+    失败的任务按 JOBS_RETRY_DELAY 指数退避重试，达到 JOBS_MAX_ATTEMPTS 次后标记为
+    failed 并保留错误信息。任务保存在数据库中，进程重启后由 recover() 继续执行。
+
+    JOBS_EAGER 为True时(测试中)在 enqueue() 中同步执行；JOBS_WORKERS 为0时不启动
+    工作线程，由单独的进程执行 flask jobs run。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.handlers = {}
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('JOBS_EAGER', False)
+        app.config.setdefault('JOBS_WORKERS', 2)
+        app.config.setdefault('JOBS_POLL_INTERVAL', 5.0)
+        app.config.setdefault('JOBS_MAX_ATTEMPTS', 3)
+        app.config.setdefault('JOBS_RETRY_DELAY', 30.0)
+        app.config.setdefault('JOBS_TIMEOUT', 600.0)
+        app.extensions['job_queue'] = self
+        atexit.register(self.shutdown)
+
+    def handler(self, kind):
+        """注册任务处理函数，函数以入队时的关键字参数调用"""
+        def decorator(f):
+            self.handlers[kind] = f
+            return f
+        return decorator
+
+    def enqueue(self, kind, **kwargs):
+        """添加任务，已有相同参数的任务在排队时不重复添加，返回任务ID
+
+        在调用方提交自己的事务之后调用，任务在单独的事务中写入。
+        """
+        if kind not in self.handlers:
+            raise LookupError(f"Unknown job kind: {kind}")
+        payload = json.dumps(kwargs, sort_keys=True)
+        job = Job.query.filter_by(kind=kind, payload=payload, status=QUEUED).first()
+        if job is None:
+            job = Job(kind=kind, payload=payload)
+            db.session.add(job)
+            db.session.commit()
+        job_id = job.id
+        self._dispatch(job_id)
+        return job_id
+
+    def run_pending(self, job_id=None, stop=None):
+        """在当前线程中执行到期的任务直到队列为空(或 stop 事件被设置)，指定 job_id 时只执行该任务，返回执行的任务数"""
+        count = 0
+        while stop is None or not stop.is_set():
+            claimed = self._claim(job_id)
+            if claimed is None:
+                return count
+            self._execute(claimed)
+            count += 1
+            if job_id is not None:
+                return count
+        return count
+
+    def recover(self):
+        """启动时调用: 将超过 JOBS_TIMEOUT 仍未完成的任务(进程退出时正在执行)放回队列，有排队的任务时启动工作线程"""
+        timeout = timedelta(seconds=current_app.config['JOBS_TIMEOUT'])
+        stale = Job.query.filter(Job.status == RUNNING, Job.started_at < datetime.utcnow() - timeout).update(
+            {'status': QUEUED}, synchronize_session=False)
+        db.session.commit()
+        if stale:
+            current_app.logger.warning(f"已将 {stale} 个未完成的后台任务放回队列")
+        if not current_app.config['JOBS_EAGER'] and Job.query.filter_by(status=QUEUED).first() is not None:
+            self._ensure_workers()
+        return stale
+
+    def retry_failed(self):
+        """将失败的任务重新放回队列，返回任务数"""
+        count = Job.query.filter_by(status=FAILED).update(
+            {'status': QUEUED, 'attempts': 0, 'error': None, 'run_after': datetime.utcnow()},
+            synchronize_session=False)
+        db.session.commit()
+        if count:
+            self._dispatch()
+        return count
+
+    def shutdown(self):
+        """进程退出时调用，等待正在执行的任务完成"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=self.app.config['JOBS_TIMEOUT'] if self.app else None)
+
+    def _dispatch(self, job_id=None):
+        """同步执行(JOBS_EAGER)或唤醒工作线程"""
+        if current_app.config['JOBS_EAGER']:
+            self.run_pending(job_id)
+        else:
+            self._ensure_workers()
+            self._wakeup.set()
+
+    def _claim(self, job_id=None):
+        """认领一个到期的任务并将其标记为执行中，多个线程或进程同时认领时只有一个成功"""
+        while True:
+            now = datetime.utcnow()
+            query = db.session.query(Job.id).filter(Job.status == QUEUED)
+            if job_id is not None:
+                query = query.filter(Job.id == job_id)
+            else:
+                query = query.filter(Job.run_after <= now).order_by(Job.id)
+            candidate = query.limit(1).scalar()
+            if candidate is None:
+                db.session.commit()
+                return None
+            claimed = db.session.execute(
+                update(Job).where(Job.id == candidate, Job.status == QUEUED)
+                .values(status=RUNNING, started_at=now, attempts=Job.attempts + 1)).rowcount
+            db.session.commit()
+            if claimed:
+                return candidate
+
+    def _execute(self, job_id):
+        job = Job.query.get(job_id)
+        kind, kwargs = job.kind, job.args
+        try:
+            self.handlers[kind](**kwargs)
+        except Exception as e:
+            db.session.rollback()
+            self._failed(job_id, kind, e)
+        else:
+            # 同时从会话中移除已加载的任务对象: SQLite会重用删除的ID，留在会话中的旧对象与新任务冲突
+            Job.query.filter_by(id=job_id).delete(synchronize_session='evaluate')
+            db.session.commit()
+
+    def _failed(self, job_id, kind, error):
+        config = current_app.config
+        job = Job.query.get(job_id)
+        job.error = f"{type(error).__name__}: {error}"
+        if job.attempts >= config['JOBS_MAX_ATTEMPTS']:
+            job.status = FAILED
+            current_app.logger.error(f"后台任务 {kind} (ID: {job_id}) 失败: {job.error}")
+        else:
+            job.status = QUEUED
+            job.run_after = datetime.utcnow() + timedelta(
+                seconds=config['JOBS_RETRY_DELAY'] * 2 ** (job.attempts - 1))
+            current_app.logger.warning(f"后台任务 {kind} (ID: {job_id}) 出错，稍后重试: {job.error}")
+        db.session.commit()
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            self._stop.clear()
+            for i in range(len(self._threads), self.app.config['JOBS_WORKERS']):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        interval = self.app.config['JOBS_POLL_INTERVAL']
+        while not self._stop.is_set():
+            # 每批任务使用新的应用上下文，退出时释放本线程的数据库会话
+            try:
+                with self.app.app_context():
+                    ran = self.run_pending(stop=self._stop)
+            except Exception as e:
+                self.app.logger.error(f"后台任务线程出错: {str(e)}")
+                ran = 0
+            if not ran:
+                self._wakeup.wait(interval)
+                self._wakeup.clear()
+
+
+job_queue = JobQueue()
+
+
+jobs_cli = AppGroup('jobs', help='后台任务队列')
+
+
+@jobs_cli.command('run')
+def run_command():
+    """在前台执行所有到期的任务后退出"""
+    count = job_queue.run_pending()
+    click.echo(f"已执行 {count} 个任务", err=True)
+
+
+@jobs_cli.command('retry')
+def retry_command():
+    """将失败的任务重新放回队列"""
+    click.echo(f"已重新排队 {job_queue.retry_failed()} 个任务", err=True)
+
+
+@jobs_cli.command('status')
+def status_command():
+    """按类型和状态统计队列中的任务"""
+    rows = db.session.query(Job.kind, Job.status, db.func.count()).group_by(Job.kind, Job.status).all()
+    if not rows:
+        click.echo("队列中没有任务", err=True)
+    for kind, status, count in rows:
+        click.echo(f"{kind}\t{status}\t{count}")
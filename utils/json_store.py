@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+
+from flask import current_app
+
+# 记录没有分类时使用的默认分类
+DEFAULT_CATEGORY = '未分类'
+
+
+class JsonRecordStore:
+    """DATA_DIR 下JSON记录文件的只读存储
+
+    文件只加载一次，在内存中维护 id -> 记录 和 分类 -> 记录列表 的索引。
+    每次访问只stat一次文件，文件的mtime或大小变化时才重新加载。
+    返回的记录为共享对象，调用方不应修改。
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._signature = None
+        self._records = []
+        self._by_id = {}
+        self._by_category = {}
+
+    @property
+    def path(self):
+        return os.path.join(current_app.config['DATA_DIR'], self.filename)
+
+    def all(self):
+        self._ensure_loaded()
+        return self._records
+
+    def get(self, record_id):
+        self._ensure_loaded()
+        return self._by_id.get(record_id)
+
+    def by_category(self, category):
+        self._ensure_loaded()
+        return self._by_category.get(category, [])
+
+    def categories(self):
+        self._ensure_loaded()
+        return list(dict.fromkeys(DEFAULT_CATEGORY if c is None else c for c in self._by_category))
+
+    def category_counts(self):
+        """分类 -> 记录数"""
+        self._ensure_loaded()
+        counts = {}
+        for category, records in self._by_category.items():
+            category = DEFAULT_CATEGORY if category is None else category
+            counts[category] = counts.get(category, 0) + len(records)
+        return counts
+
+    def _ensure_loaded(self):
+        path = self.path
+        try:
+            st = os.stat(path)
+            signature = (path, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature != self._signature:
+                self._load(path, signature)
+
+    def _load(self, path, signature):
+        records = []
+        if signature is not None:
+            with open(path, 'r') as f:
+                records = json.load(f)
+        by_id = {}
+        by_category = {}
+        for record in records:
+            if record.get('id') is not None:
+                by_id.setdefault(record['id'], record)
+            by_category.setdefault(record.get('category'), []).append(record)
+        self._records, self._by_id, self._by_category = records, by_id, by_category
+        self._signature = signature
+        current_app.logger.info(f"已加载 {path}: {len(records)} 条记录")
+
+
+plugins_store = JsonRecordStore('plugins.json')
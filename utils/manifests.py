@@ -0,0 +1,247 @@
+import posixpath
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.specifiers import InvalidSpecifier, SpecifierSet
+from packaging.utils import canonicalize_name
+from packaging.version import InvalidVersion, Version
+from sqlalchemy import event, exists, or_, text
+
+from models import db, Plugin, PluginDependency, PluginPlatform, PluginCapability, PluginFile
+
+# 声明了该平台或没有声明平台的插件支持所有平台
+ANY_PLATFORM = 'any'
+
+# 插件记录上由清单提取的列，清单缺失时清空
+MANIFEST_COLUMNS = ('entry_point', 'python_requires', 'python_min', 'python_max', 'min_memory_mb')
+
+SIDE_TABLES = (PluginDependency, PluginPlatform, PluginCapability, PluginFile)
+
+
+def encode_version(value):
+    """将 3 / 3.9 / 3.9.7 形式的版本换算为可比较的整数 major*10000 + minor*100 + micro"""
+    if isinstance(value, str):
+        parts = value.strip().split('.')
+        if not 1 <= len(parts) <= 3 or not all(p.isdigit() for p in parts):
+            raise ValueError(f"Invalid version: {value}")
+        value = tuple(int(p) for p in parts)
+    major, minor, micro = (tuple(value) + (0, 0))[:3]
+    if minor >= 100 or micro >= 100:
+        raise ValueError(f"Invalid version: {'.'.join(map(str, value))}")
+    return major * 10000 + minor * 100 + micro
+
+
+def _bump(release):
+    """最后一位加一: (3, 9) -> 3.10.0，用作前缀匹配的上界"""
+    return encode_version(release[:-1] + (release[-1] + 1,))
+
+
+def python_range(python_requires):
+    """将 python_requires (如 >=3.7,<3.12) 换算为版本范围 [min, max)，没有下界或上界时为None
+
+    != 无法用范围表示，忽略。范围为空或格式错误时抛出 ValueError。
+    """
+    try:
+        specifiers = SpecifierSet(python_requires)
+    except InvalidSpecifier:
+        raise ValueError(f"Invalid python_requires: {python_requires}")
+    low, high = None, None
+    for spec in specifiers:
+        operator, version = spec.operator, spec.version
+        if operator == '!=':
+            continue
+        try:
+            if version.endswith('.*'):
+                release = tuple(int(p) for p in version[:-2].split('.'))
+                lower, upper = encode_version(release), _bump(release)
+            else:
+                release = Version(version).release[:3]
+                v = encode_version(release)
+                if operator == '~=':
+                    lower, upper = v, _bump(release[:-1])
+                else:
+                    lower, upper = {
+                        '>=': (v, None), '>': (v + 1, None), '<': (None, v), '<=': (None, v + 1),
+                    }.get(operator, (v, v + 1))  # == 和 ===
+        except (InvalidVersion, ValueError):
+            raise ValueError(f"Invalid python_requires: {python_requires}")
+        if lower is not None:
+            low = lower if low is None else max(low, lower)
+        if upper is not None:
+            high = upper if high is None else min(high, upper)
+    if low is not None and high is not None and low >= high:
+        raise ValueError(f"Unsatisfiable python_requires: {python_requires}")
+    return low, high
+
+
+def _string_list(value, key, problems):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        problems.append(f"Invalid {key} in manifest: expected a list of strings")
+        return []
+    return [v.strip() for v in value if v.strip()]
+
+
+def _dependencies(requirements, kind, problems):
+    rows = []
+    for line in requirements:
+        try:
+            requirement = Requirement(line)
+        except InvalidRequirement:
+            problems.append(f"Invalid {kind} dependency in manifest: {line}")
+            continue
+        rows.append({
+            'kind': kind,
+            'name': canonicalize_name(requirement.name),
+            'specifier': str(requirement.specifier),
+            'marker': str(requirement.marker) if requirement.marker else None,
+            'requirement': line
+        })
+    return rows
+
+
+def parse_manifest(manifest, manifest_path, names):
+    """从 manifest.json 的内容提取可查询的元数据，返回 (元数据字典, 问题列表)
+
+    运行要求可以写在 runtime 对象中，也可以写在顶层:
+    python_requires (或 runtime.python)、platforms、min_memory_mb。
+    entry_point 和 main 中取插件包中实际存在的一个，都不存在时取声明的 entry_point。
+    """
+    problems = []
+    runtime = manifest.get('runtime')
+    if not isinstance(runtime, dict):
+        runtime = {}
+
+    base = posixpath.dirname(manifest_path or '')
+    declared = [v for v in (manifest.get('entry_point'), manifest.get('main')) if isinstance(v, str) and v]
+    entry_point = next((v for v in declared if posixpath.join(base, v) in names), declared[0] if declared else None)
+
+    python_requires = runtime.get('python', manifest.get('python_requires'))
+    python_min = python_max = None
+    if python_requires is not None:
+        try:
+            python_min, python_max = python_range(str(python_requires))
+        except ValueError as e:
+            problems.append(str(e))
+            python_requires = None
+
+    memory = runtime.get('min_memory_mb', manifest.get('min_memory_mb'))
+    if memory is not None and (not isinstance(memory, int) or isinstance(memory, bool) or memory < 0):
+        problems.append("Invalid min_memory_mb in manifest")
+        memory = None
+
+    platforms = [p.lower() for p in _string_list(runtime.get('platforms', manifest.get('platforms')), 'platforms', problems)]
+    if ANY_PLATFORM in platforms:
+        platforms = []
+
+    info = {
+        'entry_point': entry_point,
+        'python_requires': python_requires,
+        'python_min': python_min,
+        'python_max': python_max,
+        'min_memory_mb': memory,
+        'platforms': list(dict.fromkeys(platforms)),
+        'capabilities': list(dict.fromkeys(_string_list(manifest.get('capabilities'), 'capabilities', problems))),
+        'dependencies': (
+            _dependencies(_string_list(manifest.get('dependencies'), 'dependencies', problems), 'python', problems) +
+            _dependencies(_string_list(manifest.get('plugin_dependencies'), 'plugin_dependencies', problems),
+                          'plugin', problems))
+    }
+    return info, problems
+
+
+def index_manifest(plugin_id, info, files):
+    """用提取的元数据替换插件的兼容性列和附属表记录，调用方负责提交
+
+    info 为 parse_manifest 的结果，插件包没有有效的清单时为None；files 为
+    (路径, 大小, 压缩后大小) 列表，插件包无法读取时为None。
+    """
+    values = {column: (info or {}).get(column) for column in MANIFEST_COLUMNS}
+    values.update(file_count=None, installed_size=None, updated_at=Plugin.updated_at)
+    if files is not None:
+        values.update(file_count=len(files), installed_size=sum(f[1] for f in files))
+    Plugin.query.filter_by(id=plugin_id).update(values, synchronize_session=False)
+
+    for model in SIDE_TABLES:
+        model.query.filter_by(plugin_id=plugin_id).delete(synchronize_session=False)
+    rows = {
+        PluginDependency: [dict(d, plugin_id=plugin_id) for d in (info or {}).get('dependencies', ())],
+        PluginPlatform: [{'plugin_id': plugin_id, 'platform': p} for p in (info or {}).get('platforms', ())],
+        PluginCapability: [{'plugin_id': plugin_id, 'name': c} for c in (info or {}).get('capabilities', ())],
+        # 同名条目只保留最后一个，与解压的结果一致
+        PluginFile: [{'plugin_id': plugin_id, 'path': path, 'size': size, 'compressed_size': compressed}
+                     for path, (size, compressed) in {f[0]: f[1:] for f in files or ()}.items()]
+    }
+    for model, model_rows in rows.items():
+        if model_rows:
+            db.session.execute(model.__table__.insert(), model_rows)
+
+
+def manifest_to_dict(plugin):
+    """插件详情中的清单元数据，尚未检查插件包时为None"""
+    if plugin.file_count is None and plugin.entry_point is None:
+        return None
+    dependencies = PluginDependency.query.filter_by(plugin_id=plugin.id).order_by(PluginDependency.id).all()
+    return {
+        'entry_point': plugin.entry_point,
+        'python_requires': plugin.python_requires,
+        'min_memory_mb': plugin.min_memory_mb,
+        'platforms': [row.platform for row in
+                      db.session.query(PluginPlatform.platform).filter_by(plugin_id=plugin.id)],
+        'capabilities': [row.name for row in
+                         db.session.query(PluginCapability.name).filter_by(plugin_id=plugin.id)],
+        'dependencies': [d.requirement for d in dependencies if d.kind == 'python'],
+        'plugin_dependencies': [d.requirement for d in dependencies if d.kind == 'plugin'],
+        'file_count': plugin.file_count,
+        'installed_size': plugin.installed_size
+    }
+
+
+def _parse_megabytes(value, name):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}")
+    if number < 0:
+        raise ValueError(f"Invalid {name}: {value}")
+    return number
+
+
+def filter_compatible(query, platform=None, python=None, memory=None, storage=None, capabilities=()):
+    """筛选能在设备上运行的插件，未指定的条件不筛选，格式错误时抛出 ValueError
+
+    platform 为设备平台(如 linux-aarch64)，python 为设备的Python版本，memory 和
+    storage 为可用内存和存储空间(MB)，capabilities 为需要插件全部提供的能力。
+    插件包检查未通过的插件不返回，没有声明某项要求的插件视为满足该项。
+    """
+    query = query.filter(or_(Plugin.scan_status.is_(None), Plugin.scan_status != 'failed'))
+    if platform:
+        platform = platform.lower()
+        if platform != ANY_PLATFORM:
+            query = query.filter(or_(
+                ~exists().where(PluginPlatform.plugin_id == Plugin.id),
+                exists().where(PluginPlatform.plugin_id == Plugin.id, PluginPlatform.platform == platform)))
+    if python:
+        version = encode_version(python)
+        query = query.filter(or_(Plugin.python_min.is_(None), Plugin.python_min <= version),
+                             or_(Plugin.python_max.is_(None), Plugin.python_max > version))
+    if memory:
+        memory = _parse_megabytes(memory, 'memory')
+        query = query.filter(or_(Plugin.min_memory_mb.is_(None), Plugin.min_memory_mb <= memory))
+    if storage:
+        storage = _parse_megabytes(storage, 'storage')
+        query = query.filter(or_(Plugin.installed_size.is_(None), Plugin.installed_size <= storage * 1024 * 1024))
+    for capability in capabilities:
+        query = query.filter(exists().where(PluginCapability.plugin_id == Plugin.id, PluginCapability.name == capability))
+    return query
+
+
+# 删除插件时同时删除附属表中的记录
+
+@event.listens_for(Plugin, 'before_delete')
+def _delete_manifest_rows(mapper, connection, target):
+    for model in SIDE_TABLES:
+        connection.execute(text(f"DELETE FROM {model.__tablename__} WHERE plugin_id = :plugin_id"),
+                           {'plugin_id': target.id})
@@ -0,0 +1,295 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import request, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 直方图桶的上界
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+BYTES_BUCKETS = (256, 1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024)
+
+# 计为文件系统调用的审计事件(os.stat 等没有审计事件，不计入)
+FS_AUDIT_EVENTS = frozenset((
+    'open', 'os.listdir', 'os.scandir', 'os.remove', 'os.rename', 'os.mkdir', 'os.rmdir',
+    'os.truncate', 'os.utime', 'os.chmod', 'os.link', 'os.symlink', 'shutil.copyfile',
+    'shutil.copytree', 'shutil.move', 'shutil.rmtree',
+))
+
+# 当前线程正在处理的请求统计，SQLAlchemy 事件和审计钩子在处理请求的线程中执行
+_current = threading.local()
+
+
+class Histogram:
+    """按标签分组的Prometheus直方图"""
+
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, *label_values):
+        """返回 (总和, 次数)，没有记录时返回 (0, 0)"""
+        with self._lock:
+            series = self._series.get(label_values)
+            return (series[1], series[2]) if series else (0, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total, count)
+                      for labels, (counts, total, count) in sorted(self._series.items())]
+        for label_values, counts, total, count in series:
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestStats:
+    __slots__ = ('start', 'endpoint', 'method', 'status', 'queries', 'query_time', 'fs_calls',
+                 'bytes_sent', 'samples', 'thread_id', 'pending')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.endpoint = request.endpoint or '<unmatched>'
+        self.method = request.method
+        self.status = 500
+        self.queries = 0
+        self.query_time = 0.0
+        self.fs_calls = 0
+        self.bytes_sent = 0
+        self.samples = None
+        self.thread_id = threading.get_ident()
+        # 请求结束(teardown)和流式响应发送完毕两者都完成后才记录
+        self.pending = 1
+
+
+class RequestMetrics:
+    """请求级别的耗时统计
+
+    记录每个接口的处理时间、SQL语句数和耗时、响应字节数以及文件系统调用次数，
+    以Prometheus文本格式在 /api/server/metrics 输出。设置 PROFILE_SLOW_REQUEST_SECONDS
+    后启用采样分析器，处理时间超过该值的请求的调用栈以折叠格式(flamegraph.pl /
+    speedscope 可直接读取)写入 PROFILE_DIR。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.profile_threshold = 0
+        self.profile_interval = 0.005
+        self.profile_dir = None
+        self.duration = Histogram('edgeplughub_request_duration_seconds', '请求处理时间',
+                                  DURATION_BUCKETS, ('endpoint', 'method'))
+        self.sql_queries = Histogram('edgeplughub_request_sql_queries', '每个请求执行的SQL语句数',
+                                     COUNT_BUCKETS, ('endpoint',))
+        self.sql_duration = Histogram('edgeplughub_request_sql_seconds', '每个请求执行SQL的总时间',
+                                      DURATION_BUCKETS, ('endpoint',))
+        self.response_bytes = Histogram('edgeplughub_response_bytes', '响应体字节数',
+                                        BYTES_BUCKETS, ('endpoint',))
+        self.fs_calls = Histogram('edgeplughub_request_fs_calls', '每个请求的文件系统调用次数',
+                                  COUNT_BUCKETS, ('endpoint',))
+        self.responses = Counter()
+        self._responses_lock = threading.Lock()
+        self._sampled = {}
+        self._sampler = None
+        self._sampler_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['request_metrics'] = self
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        self.profile_threshold = float(app.config.get('PROFILE_SLOW_REQUEST_SECONDS', 0))
+        self.profile_interval = float(app.config.get('PROFILE_SAMPLE_INTERVAL', self.profile_interval))
+        self.profile_dir = app.config.get('PROFILE_DIR') or \
+            os.path.join(app.config.get('DATA_DIR', 'data'), 'profiles')
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        _install_hooks()
+
+    # 请求处理
+
+    def _before_request(self):
+        stats = RequestStats()
+        _current.stats = stats
+        if self.profile_threshold > 0:
+            stats.samples = Counter()
+            with self._sampler_lock:
+                self._sampled[stats.thread_id] = stats.samples
+            self._ensure_sampler()
+
+    def _after_request(self, response):
+        stats = getattr(_current, 'stats', None)
+        if stats is None:
+            return response
+        stats.status = response.status_code
+        if response.is_streamed and response.content_length is None:
+            # 流式响应在发送过程中累计字节数，发送完毕后才记录
+            stats.pending += 1
+            response.response = self._count_bytes(response.response, stats)
+        else:
+            # send_file 等直接透传的响应不会调用 call_on_close，按 Content-Length 计算
+            stats.bytes_sent = response.content_length or 0
+        return response
+
+    def _teardown_request(self, exc=None):
+        stats = getattr(_current, 'stats', None)
+        if stats is not None:
+            _current.stats = None
+            self._complete(stats)
+
+    def _count_bytes(self, iterable, stats):
+        try:
+            for chunk in iterable:
+                stats.bytes_sent += len(chunk)
+                yield chunk
+        finally:
+            self._complete(stats)
+
+    def _complete(self, stats):
+        stats.pending -= 1
+        if stats.pending == 0:
+            self._finish(stats)
+
+    def _finish(self, stats):
+        elapsed = time.perf_counter() - stats.start
+        endpoint = stats.endpoint
+        self.duration.observe(elapsed, endpoint, stats.method)
+        self.sql_queries.observe(stats.queries, endpoint)
+        self.sql_duration.observe(stats.query_time, endpoint)
+        self.response_bytes.observe(stats.bytes_sent, endpoint)
+        self.fs_calls.observe(stats.fs_calls, endpoint)
+        with self._responses_lock:
+            self.responses[(endpoint, stats.method, str(stats.status))] += 1
+        if stats.samples is not None:
+            with self._sampler_lock:
+                if self._sampled.get(stats.thread_id) is stats.samples:
+                    del self._sampled[stats.thread_id]
+            if elapsed >= self.profile_threshold and stats.samples:
+                self._dump_profile(endpoint, elapsed, stats.samples)
+
+    def render(self):
+        """Prometheus文本格式的统计数据"""
+        lines = ['# HELP edgeplughub_responses_total 按接口和状态码统计的响应数',
+                 '# TYPE edgeplughub_responses_total counter']
+        with self._responses_lock:
+            responses = sorted(self.responses.items())
+        for (endpoint, method, status), count in responses:
+            lines.append(f'edgeplughub_responses_total{{endpoint="{_escape(endpoint)}",'
+                         f'method="{method}",status="{status}"}} {count}')
+        parts = ['\n'.join(lines)]
+        for histogram in (self.duration, self.sql_queries, self.sql_duration, self.response_bytes, self.fs_calls):
+            parts.append(histogram.render())
+        return '\n'.join(parts) + '\n'
+
+    # 采样分析
+
+    def _ensure_sampler(self):
+        if self._sampler is not None and self._sampler.is_alive():
+            return
+        with self._sampler_lock:
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample_loop, name='request-profiler', daemon=True)
+                self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.profile_interval)
+            with self._sampler_lock:
+                sampled = dict(self._sampled)
+            if not sampled:
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in sampled.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_fold(frame)] += 1
+
+    def _dump_profile(self, endpoint, elapsed, samples):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint.replace('.', '_')}-{int(elapsed * 1000)}ms.folded"
+            path = os.path.join(self.profile_dir, filename)
+            with open(path, 'w') as f:
+                for stack, count in samples.most_common():
+                    f.write(f'{stack} {count}\n')
+            current_app.logger.info(f"慢请求 {endpoint} 耗时 {elapsed:.3f}s，调用栈已写入: {path}")
+        except OSError as e:
+            current_app.logger.error(f"写入慢请求调用栈失败: {str(e)}")
+
+
+def _fold(frame):
+    """调用栈的折叠格式: 从外到内以分号分隔的 函数名 (文件:行号)"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+# SQLAlchemy 事件和审计钩子在进程内只安装一次(审计钩子无法移除)
+
+_hooks_installed = []
+
+
+def _install_hooks():
+    if _hooks_installed:
+        return
+    _hooks_installed.append(True)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    sys.addaudithook(_audit)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_current, 'stats', None) is not None:
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_current, 'stats', None)
+    starts = conn.info.get('metrics_query_start')
+    if stats is None or not starts:
+        return
+    stats.queries += 1
+    stats.query_time += time.perf_counter() - starts.pop()
+
+
+def _audit(event_name, args):
+    if event_name in FS_AUDIT_EVENTS:
+        stats = getattr(_current, 'stats', None)
+        if stats is not None:
+            stats.fs_calls += 1
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,78 @@
+import base64
+import hashlib
+import os
+import threading
+
+from flask import request, send_file, current_app
+from werkzeug.utils import secure_filename
+
+# 计算校验和时每次读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+_checksum_cache = {}
+_checksum_lock = threading.Lock()
+
+
+def file_digest(path):
+    """计算文件的SHA-256和大小，返回 (十六进制摘要, 字节数)"""
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+def package_checksum(path):
+    """没有预先计算校验和的插件包(旧数据或按文件名匹配的预置包)，按文件状态缓存计算结果"""
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _checksum_lock:
+        cached = _checksum_cache.get(key)
+    if cached is None:
+        cached = file_digest(path)
+        with _checksum_lock:
+            _checksum_cache[key] = cached
+    return cached
+
+
+def is_initial_request():
+    """是否为从头开始的下载请求(断点续传的后续请求不计入下载次数)"""
+    if request.range is None:
+        return True
+    return any(start == 0 for start, _ in request.range.ranges)
+
+
+def send_package(path, download_name=None, sha256=None, size=None):
+    """发送插件包文件
+
+    支持 Range 请求和断点续传(If-Range)，使用插件包的SHA-256作为强ETag，
+    并通过 X-Checksum-SHA256 和 Digest 响应头返回上传时计算的校验和，
+    无需每次下载都重新校验zip文件。文件内容通过WSGI服务器的 file_wrapper
+    发送，服务器支持时使用零拷贝的 sendfile。
+    """
+    if not sha256:
+        sha256, size = package_checksum(path)
+    response = send_file(path, as_attachment=True,
+                         download_name=download_name or os.path.basename(path),
+                         conditional=True, etag=sha256)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['X-Checksum-SHA256'] = sha256
+    response.headers['Digest'] = 'SHA-256=' + base64.b64encode(bytes.fromhex(sha256)).decode('ascii')
+    if size is not None:
+        response.headers['X-Package-Size'] = str(size)
+    return response
+
+
+def send_plugin_package(plugin, path, download_name=None):
+    """发送插件的插件包，path 为插件包索引解析出的绝对路径"""
+    if download_name is None:
+        # 内容寻址的文件名对用户没有意义，使用插件名称和版本命名
+        download_name = f"{secure_filename(plugin.name) or plugin.id}-{plugin.version}.zip"
+    sha256, size = None, None
+    # 只有解析到的文件就是数据库记录的插件包时，上传时计算的校验和才有效
+    if plugin.package_sha256 and plugin.package_path and \
+            os.path.join(current_app.config['UPLOAD_FOLDER'], plugin.package_path) == path:
+        sha256, size = plugin.package_sha256, plugin.package_size
+    return send_package(path, download_name, sha256, size)
@@ -0,0 +1,179 @@
+import os
+import threading
+import zipfile
+
+from flask import current_app
+
+# 特殊插件文件匹配规则：插件名称包含关键字时使用对应的预置包
+SPECIAL_FILES = {
+    'face': 'face_detector.zip',
+    'detector': 'face_detector.zip',
+    'skin': 'skin_analyzer.zip',
+    'analyzer': 'skin_analyzer.zip'
+}
+
+
+class PackageIndex:
+    """插件包位置索引
+
+    插件记录中的包路径指向存在的文件时直接使用该路径；否则(旧插件没有上传插件包)
+    按名称匹配预置包，匹配结果保存在内存中的 插件ID -> 插件包绝对路径 映射里。
+    索引在启动时构建，在上传、删除插件时增量更新；插件包目录发生外部变化(通过
+    目录mtime判断)时重新解析，因此下载请求无需每次列出目录。索引只存在于本进程，
+    其他进程上传、导入或更新的插件在 resolve() 时按记录重新解析。
+    """
+
+    def __init__(self, app=None):
+        self.packages_dir = None
+        self._lock = threading.RLock()
+        self._plugins = {}  # 插件ID -> (名称, 数据库记录的包路径)
+        self._paths = {}    # 插件ID -> 插件包绝对路径
+        self._files = set()
+        self._dir_mtime = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self.packages_dir = os.path.join(self.upload_folder, 'packages')
+        os.makedirs(self.packages_dir, exist_ok=True)
+        app.extensions['package_index'] = self
+
+    def build(self, plugins):
+        """根据插件记录全量构建索引，plugins 为 (id, name, package_path) 序列"""
+        with self._lock:
+            self._plugins = {pid: (name, package_path) for pid, name, package_path in plugins}
+            self._rescan()
+
+    def resolve(self, plugin):
+        """返回插件记录 plugin 的插件包绝对路径，未找到时返回None"""
+        self._check_directory()
+        if plugin.package_path:
+            full_path = os.path.join(self.upload_folder, plugin.package_path)
+            if os.path.isfile(full_path):
+                return full_path
+        # 本进程没有登记过该插件，或登记的名称、包路径已被其他进程修改
+        if self._plugins.get(plugin.id) != (plugin.name, plugin.package_path):
+            self.register(plugin.id, plugin.name, plugin.package_path)
+        return self._paths.get(plugin.id)
+
+    def register(self, plugin_id, name, package_path):
+        """新增或更新插件记录(上传、编辑插件时调用)"""
+        with self._lock:
+            self._check_directory()
+            if package_path:
+                filename = self._packages_filename(package_path)
+                if filename:
+                    self._files.add(filename)
+            self._plugins[plugin_id] = (name, package_path)
+            self._resolve_one(plugin_id)
+            self._sync_mtime()
+
+    def add_file(self, filename):
+        """插件包目录新增文件后调用，重新解析尚未找到包的插件"""
+        with self._lock:
+            self._check_directory()
+            self._files.add(filename)
+            for plugin_id in self._plugins:
+                if plugin_id not in self._paths:
+                    self._resolve_one(plugin_id)
+            self._sync_mtime()
+
+    def discard(self, plugin_id, remove_file=None):
+        """删除插件记录；remove_file 为被删除的包文件名时同步更新文件集合"""
+        with self._lock:
+            self._plugins.pop(plugin_id, None)
+            self._paths.pop(plugin_id, None)
+            if remove_file:
+                self._files.discard(remove_file)
+                removed_path = os.path.join(self.packages_dir, remove_file)
+                for pid in [pid for pid, path in self._paths.items() if path == removed_path]:
+                    self._paths.pop(pid)
+                    self._resolve_one(pid)
+            self._sync_mtime()
+
+    def filenames(self):
+        """返回插件包目录中已知的文件名列表"""
+        self._check_directory()
+        return sorted(self._files)
+
+    def _check_directory(self):
+        # 仅stat一次插件包目录，目录内容发生变化时才重新扫描
+        try:
+            mtime = os.stat(self.packages_dir).st_mtime_ns
+        except FileNotFoundError:
+            os.makedirs(self.packages_dir, exist_ok=True)
+            mtime = None
+        if mtime != self._dir_mtime:
+            with self._lock:
+                if mtime != self._dir_mtime:
+                    self._rescan()
+
+    def _sync_mtime(self):
+        try:
+            self._dir_mtime = os.stat(self.packages_dir).st_mtime_ns
+        except FileNotFoundError:
+            self._dir_mtime = None
+
+    def _rescan(self):
+        try:
+            self._sync_mtime()
+            self._files = set(os.listdir(self.packages_dir))
+        except FileNotFoundError:
+            os.makedirs(self.packages_dir, exist_ok=True)
+            self._files = set()
+        # 先在新字典中解析完成再替换，避免并发读取到不完整的索引
+        paths = {}
+        for plugin_id in self._plugins:
+            self._resolve_one(plugin_id, paths)
+        self._paths = paths
+        current_app.logger.info(f"插件包索引已重建: {len(self._paths)}/{len(self._plugins)} 个插件找到了插件包")
+
+    def _packages_filename(self, package_path):
+        # 数据库中的包路径形如 packages/xxx.zip，仅当其位于插件包目录下时返回文件名
+        full_path = os.path.join(self.upload_folder, package_path)
+        if os.path.dirname(os.path.abspath(full_path)) == os.path.abspath(self.packages_dir):
+            return os.path.basename(full_path)
+        return None
+
+    def _resolve_one(self, plugin_id, paths=None):
+        if paths is None:
+            paths = self._paths
+        name, package_path = self._plugins[plugin_id]
+
+        # 方案1: 检查数据库中记录的路径
+        if package_path:
+            full_path = os.path.join(self.upload_folder, package_path)
+            filename = self._packages_filename(package_path)
+            if (filename in self._files) if filename else os.path.isfile(full_path):
+                paths[plugin_id] = full_path
+                return
+
+        # 方案2-5: 特殊文件、插件ID、插件名称、名称部分匹配
+        for filename in self._candidates(plugin_id, name or ''):
+            full_path = os.path.join(self.packages_dir, filename)
+            # 仅在建立索引时校验一次zip文件，而不是每次下载都校验
+            if zipfile.is_zipfile(full_path):
+                paths[plugin_id] = full_path
+                return
+            current_app.logger.warning(f"找到的文件不是有效的zip文件: {full_path}")
+
+        paths.pop(plugin_id, None)
+
+    def _candidates(self, plugin_id, name):
+        name_lower = name.lower()
+        plugin_name = name_lower.replace(' ', '_')
+        candidates = []
+        for keyword, special_file in SPECIAL_FILES.items():
+            if keyword in name_lower and special_file in self._files:
+                candidates.append(special_file)
+        for filename in (f"{plugin_id}.zip", f"{plugin_name}.zip"):
+            if filename in self._files:
+                candidates.append(filename)
+        if plugin_name:
+            candidates.extend(sorted(f for f in self._files if plugin_name in f.lower()))
+        seen = set()
+        return [f for f in candidates if not (f in seen or seen.add(f))]
+
+
+package_index = PackageIndex()
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import posixpath
+import zipfile
+from datetime import datetime
+
+import click
+from flask import current_app
+
+from models import db, Plugin
+from utils.cache import response_cache
+from utils.jobs import job_queue, jobs_cli
+from utils.manifests import parse_manifest, index_manifest
+from utils.package_index import package_index
+from utils.uploads import CHUNK_SIZE, is_unsafe_path
+
+SCAN_PENDING, SCAN_PASSED, SCAN_FAILED = 'pending', 'passed', 'failed'
+
+MANIFEST_NAME = 'manifest.json'
+# 清单文件超过该大小时不解析
+MAX_MANIFEST_SIZE = 256 * 1024
+
+
+def scan_package(path, max_uncompressed_size, max_ratio):
+    """检查插件包，返回 (结果字典, 文件列表)，结果中 problems 为空时表示通过
+
+    计算SHA-256和大小，校验每个条目的CRC(需要解压全部内容，因此在后台任务中执行)，
+    检查条目路径和压缩比，并提取最靠近根目录的 manifest.json。解压后总大小或压缩比
+    超过限制时不再校验内容，避免解压炸弹。文件列表为 (路径, 大小, 压缩后大小)，
+    插件包无法读取时为None。
+    """
+    result = {'problems': []}
+    files = None
+    problems = result['problems']
+
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    result['sha256'] = sha256.hexdigest()
+    result['size'] = os.path.getsize(path)
+
+    try:
+        with zipfile.ZipFile(path) as zf:
+            infos = zf.infolist()
+            entries = [info for info in infos if not info.is_dir()]
+            files = [(info.filename, info.file_size, info.compress_size) for info in entries]
+            uncompressed = sum(info.file_size for info in entries)
+            compressed = sum(info.compress_size for info in entries)
+            result['entries'] = len(entries)
+            result['uncompressed_size'] = uncompressed
+
+            unsafe = [info.filename for info in infos if is_unsafe_path(info.filename)]
+            if unsafe:
+                problems.append(f"Invalid path in zip package: {unsafe[0]}")
+            if len({info.filename for info in infos}) != len(infos):
+                problems.append("Duplicate entries in zip package")
+            if uncompressed > max_uncompressed_size:
+                problems.append(f"Uncompressed size {uncompressed} exceeds limit {max_uncompressed_size}")
+                return result, files
+            if compressed and uncompressed / compressed > max_ratio:
+                problems.append(f"Compression ratio {uncompressed / compressed:.0f} exceeds limit {max_ratio:g}")
+                return result, files
+
+            corrupt = zf.testzip()
+            if corrupt is not None:
+                problems.append(f"Corrupt entry in zip package: {corrupt}")
+                return result, files
+            _read_manifest(zf, entries, result)
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, OSError) as e:
+        problems.append(f"Invalid zip package: {e}")
+    return result, files
+
+
+def _read_manifest(zf, files, result):
+    """解析最靠近根目录的 manifest.json(插件包通常带有一层或多层目录)"""
+    manifests = [info for info in files if posixpath.basename(info.filename) == MANIFEST_NAME]
+    if not manifests:
+        result['manifest'] = None
+        return
+    info = min(manifests, key=lambda i: (i.filename.count('/'), i.filename))
+    result['manifest_path'] = info.filename
+    if info.file_size > MAX_MANIFEST_SIZE:
+        result['problems'].append(f"{MANIFEST_NAME} is too large")
+        return
+    try:
+        manifest = json.loads(zf.read(info).decode('utf-8-sig'))
+    except (UnicodeDecodeError, ValueError) as e:
+        result['problems'].append(f"Invalid {MANIFEST_NAME}: {e}")
+        return
+    if not isinstance(manifest, dict):
+        result['problems'].append(f"Invalid {MANIFEST_NAME}: not an object")
+        return
+    result['manifest'] = manifest
+
+
+def enqueue_scan(plugin_id):
+    """将插件标记为待检查并添加检查任务(上传插件包后调用，调用方已提交插件记录)"""
+    Plugin.query.filter_by(id=plugin_id).update(
+        {'scan_status': SCAN_PENDING, 'updated_at': Plugin.updated_at}, synchronize_session=False)
+    db.session.commit()
+    return job_queue.enqueue('scan_package', plugin_id=plugin_id)
+
+
+@job_queue.handler('scan_package')
+def run_package_scan(plugin_id):
+    """检查插件包并将结果和清单元数据写回插件记录，插件没有校验和时(旧插件)同时补齐校验和与大小"""
+    plugin = Plugin.query.get(plugin_id)
+    if plugin is None:
+        return None
+    config = current_app.config
+    full_path = package_index.resolve(plugin)
+    if full_path is None:
+        result, files = {'problems': ["Package file not found"]}, None
+    else:
+        result, files = scan_package(full_path, config['SCAN_MAX_UNCOMPRESSED_SIZE'],
+                                     config['SCAN_MAX_COMPRESSION_RATIO'])
+
+    # 提取清单中的入口、依赖和运行要求，写入可查询的列和附属表
+    info = None
+    if result.get('manifest'):
+        info, problems = parse_manifest(result['manifest'], result['manifest_path'], {f[0] for f in files})
+        result['problems'].extend(problems)
+
+    # 不经过ORM事件写入: 检查结果不属于插件目录的变更，也不更新 updated_at
+    values = {
+        'scan_status': SCAN_FAILED if result['problems'] else SCAN_PASSED,
+        'scan_result': json.dumps(result, ensure_ascii=False),
+        'scanned_at': datetime.utcnow(),
+        'updated_at': Plugin.updated_at
+    }
+    own_package = full_path == os.path.join(config['UPLOAD_FOLDER'], plugin.package_path)
+    if own_package and 'sha256' in result:
+        if not plugin.package_sha256:
+            values.update(package_sha256=result['sha256'], package_size=result['size'])
+        elif plugin.package_sha256 != result['sha256']:
+            result['problems'].append("Checksum mismatch")
+            values.update(scan_status=SCAN_FAILED, scan_result=json.dumps(result, ensure_ascii=False))
+    Plugin.query.filter_by(id=plugin_id).update(values, synchronize_session=False)
+    index_manifest(plugin_id, info, files)
+    db.session.commit()
+    response_cache.invalidate()
+    if result['problems']:
+        current_app.logger.warning(f"插件包检查未通过: {plugin.name} (ID: {plugin_id}): {'; '.join(result['problems'])}")
+    return values['scan_status']
+
+
+@jobs_cli.command('scan')
+@click.option('--all', 'rescan', is_flag=True, help='重新检查所有插件，默认只检查尚未检查的插件')
+def scan_command(rescan):
+    """为插件添加插件包检查任务"""
+    query = db.session.query(Plugin.id)
+    if not rescan:
+        query = query.filter(Plugin.scan_status.is_(None))
+    plugin_ids = [row.id for row in query]
+    for plugin_id in plugin_ids:
+        enqueue_scan(plugin_id)
+    click.echo(f"已添加 {len(plugin_ids)} 个检查任务", err=True)
@@ -0,0 +1,40 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(created_at, item_id):
+    """将 (created_at, id) 编码为不透明的分页游标"""
+    raw = json.dumps([created_at.isoformat(), item_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解码分页游标，格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), str(item_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def parse_limit(value, default, maximum):
+    """解析 limit 参数，限制在 1..maximum 之间，格式错误时抛出 ValueError"""
+    if value is None or value == '':
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(f"Invalid limit: {value}")
+    return min(limit, maximum)
+
+
+def parse_fields(value, allowed):
+    """解析逗号分隔的 fields 参数，返回字段列表；未指定时返回None"""
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
@@ -0,0 +1,248 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import request, jsonify, current_app
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+# 限速规则的时间单位
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate):
+    """解析 '10/minute' 形式的限速规则，返回 (容量, 每秒补充的令牌数)"""
+    try:
+        count, period = rate.split('/')
+        count = int(count)
+        seconds = PERIODS[period.strip().rstrip('s')]
+    except (ValueError, KeyError, AttributeError):
+        raise ValueError(f"Invalid rate limit: {rate}")
+    if count <= 0:
+        raise ValueError(f"Invalid rate limit: {rate}")
+    return count, count / seconds
+
+
+class MemoryBackend:
+    """进程内的令牌桶存储"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        """取一个令牌，返回 (是否允许, 需要等待的秒数)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            allowed, tokens, retry_after = _take(tokens, updated, now, capacity, refill_rate)
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / refill_rate)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return allowed, retry_after
+
+    def _prune(self, now):
+        # 已经补满的令牌桶与不存在等价，可以删除
+        for key in [k for k, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SqliteBackend:
+    """保存在SQLite文件中的令牌桶，同一台机器上的多个工作进程共享限速状态"""
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limit_bucket ("
+                         "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        now = time.time() if now is None else now
+        conn = self._connect()
+        # BEGIN IMMEDIATE 取得写锁，读取和更新令牌数之间不会被其他进程插入
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_limit_bucket WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            allowed, tokens, retry_after = _take(tokens, updated, now, capacity, refill_rate)
+            conn.execute("INSERT OR REPLACE INTO rate_limit_bucket (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                         (key, tokens, now, now + (capacity - tokens) / refill_rate))
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM rate_limit_bucket WHERE full_at <= ?", (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+    def reset(self):
+        self._connect().execute("DELETE FROM rate_limit_bucket")
+
+
+def _take(tokens, updated, now, capacity, refill_rate):
+    """补充令牌后取一个，返回 (是否允许, 剩余令牌数, 需要等待的秒数)"""
+    tokens = min(capacity, tokens + max(0.0, now - updated) * refill_rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / refill_rate
+
+
+def client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def client_user():
+    """已登录用户的ID，没有有效令牌时退化为客户端IP"""
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f'user:{identity}' if identity else f'ip:{client_ip()}'
+
+
+KEY_FUNCS = {
+    'ip': lambda: f'ip:{client_ip()}',
+    'user': client_user,
+    'endpoint': lambda: 'all',
+}
+
+
+class RateLimiter:
+    """令牌桶限速和并发数限制
+
+    limit() 按IP、用户或接口为单位限速，超出时返回429；concurrency() 限制接口
+    同时处理的请求数，超出时立即返回503而不是排队等待。两者都带有 Retry-After
+    响应头。限速规则从配置中读取，RATELIMIT_ENABLED 为 false 时不做任何限制。
+    令牌桶存储在进程内存(memory)或 RATELIMIT_STORAGE_PATH 指定的SQLite文件
+    (sqlite)中；并发数限制只在单个进程内生效。
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.backend = MemoryBackend()
+        self._semaphores = {}
+        self._semaphores_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        if app.config.get('RATELIMIT_BACKEND', 'memory') == 'sqlite':
+            path = app.config.get('RATELIMIT_STORAGE_PATH') or \
+                os.path.join(app.config.get('DATA_DIR', 'data'), 'ratelimit.db')
+            self.backend = SqliteBackend(path)
+        else:
+            self.backend = MemoryBackend()
+        app.extensions['rate_limiter'] = self
+
+    def limit(self, config_key, key='ip', methods=None):
+        """按 config_key 配置的规则(如 '10/minute')限速，key 为 ip、user、endpoint 或返回键的函数"""
+        key_func = KEY_FUNCS[key] if isinstance(key, str) else key
+
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if self.enabled and (methods is None or request.method in methods):
+                    rate = current_app.config.get(config_key)
+                    if rate:
+                        capacity, refill_rate = parse_rate(rate)
+                        bucket = f'{request.endpoint}:{key_func()}'
+                        allowed, retry_after = self.backend.consume(bucket, capacity, refill_rate)
+                        if not allowed:
+                            current_app.logger.warning(f"请求过于频繁: {bucket}")
+                            return _reject("Too many requests", 429, retry_after)
+                return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def concurrency(self, config_key, retry_after=1):
+        """限制接口同时处理的请求数不超过 config_key 配置的值
+
+        流式响应(如 send_file 返回的插件包)在视图函数返回之后才发送文件内容，
+        因此在响应关闭(传输完成或客户端断开)时才释放名额。
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                limit = current_app.config.get(config_key)
+                if not self.enabled or not limit:
+                    return f(*args, **kwargs)
+                semaphore = self._semaphore(request.endpoint, int(limit))
+                if not semaphore.acquire(blocking=False):
+                    current_app.logger.warning(f"并发请求数超过限制: {request.endpoint}")
+                    return _reject("Server busy, please retry later", 503, retry_after)
+                try:
+                    response = current_app.make_response(f(*args, **kwargs))
+                except BaseException:
+                    semaphore.release()
+                    raise
+                if response.is_streamed:
+                    _release_on_close(response, semaphore.release)
+                else:
+                    semaphore.release()
+                return response
+            return wrapper
+        return decorator
+
+    def _semaphore(self, name, limit):
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get((name, limit))
+            if semaphore is None:
+                semaphore = self._semaphores[(name, limit)] = threading.BoundedSemaphore(limit)
+            return semaphore
+
+    def reset(self):
+        self.backend.reset()
+
+
+def _release_on_close(response, release):
+    """响应关闭时调用 release
+
+    直接透传的响应(send_file 的文件包装对象)由WSGI服务器直接迭代和关闭，不经过
+    Response.close 和 call_on_close，因此包装该对象自身的 close；对象类型不变，
+    服务器仍可使用 sendfile。
+    """
+    body = response.response
+    if response.direct_passthrough and hasattr(body, 'close'):
+        close = body.close
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                release()
+        body.close = close_and_release
+    else:
+        response.call_on_close(release)
+
+
+def _reject(message, status, retry_after):
+    response = jsonify({"msg": message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+rate_limiter = RateLimiter()
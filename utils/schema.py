@@ -0,0 +1,70 @@
+import sqlite3
+
+from flask import current_app
+from sqlalchemy import event, inspect, literal, text
+from sqlalchemy.engine import Engine
+
+from models import db
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_wal(dbapi_connection, connection_record):
+    """SQLite数据库使用WAL日志模式
+
+    默认的回滚日志模式下，读游标持有共享锁，流式响应和目录导出在整个传输期间都会阻塞
+    其他连接的写入(上传、审核、下载计数)；WAL模式下读写互不阻塞。
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.close()
+
+
+def upgrade_schema():
+    """为已有数据库补充模型中新增的列和索引
+
+    db.create_all() 只会创建不存在的表，不会修改已有的表，因此在其之后调用本函数，
+    用 ALTER TABLE ADD COLUMN 补齐缺少的列，并创建缺少的索引。非空列使用模型中的
+    默认值填充已有的行，没有固定默认值的非空列无法自动添加，抛出 RuntimeError。
+    """
+    engine = db.engine
+    preparer = engine.dialect.identifier_preparer
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.quote(column.name)} ' \
+                      f'{column.type.compile(dialect=engine.dialect)}'
+                default = _default_literal(column, engine.dialect)
+                if not column.nullable:
+                    if default is None:
+                        raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} "
+                                           f"without a constant default")
+                    ddl += f' NOT NULL DEFAULT {default}'
+                elif column.server_default is not None and default is not None:
+                    ddl += f' DEFAULT {default}'
+                conn.execute(text(ddl))
+                current_app.logger.info(f"已为表 {table.name} 添加列: {column.name}")
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _default_literal(column, dialect):
+    """列默认值的SQL字面量，没有服务端默认值或固定的默认值时返回None"""
+    if column.server_default is not None:
+        arg = getattr(column.server_default, 'arg', None)
+        if isinstance(arg, str):
+            return literal(arg).compile(dialect=dialect, compile_kwargs={'literal_binds': True}).string
+        if arg is not None:
+            return f'({arg.compile(dialect=dialect, compile_kwargs={"literal_binds": True}).string})'
+        return None
+    if column.default is not None and column.default.is_scalar:
+        return literal(column.default.arg, column.type).compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True}).string
+    return None
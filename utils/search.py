@@ -0,0 +1,151 @@
+from flask import current_app
+from sqlalchemy import event, or_, text
+
+from models import db, Plugin
+
+# FTS5 trigram 分词器能匹配中文等不以空格分词的文本，但只能匹配至少3个字符的词
+MIN_TERM_LENGTH = 3
+
+# bm25 各列权重: plugin_id, name, short_description, description
+RANK = 'bm25(plugin_fts, 0.0, 10.0, 5.0, 1.0)'
+
+_state = {'enabled': False}
+
+
+def init_search_index():
+    """创建插件全文索引(SQLite FTS5)，新建索引时从 plugin 表导入已有数据
+
+    plugin_fts 的 plugin_id 列不建索引，plugin_fts_docs 记录 插件ID -> 全文索引rowid，
+    更新和删除时按rowid定位文档。数据库不是SQLite或不支持FTS5时禁用全文索引，
+    搜索退化为LIKE查询。
+    """
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='plugin_fts'")).first()
+        if not exists:
+            try:
+                _create_tables(conn)
+            except Exception as e:
+                current_app.logger.warning(f"SQLite不支持FTS5全文索引，搜索将使用LIKE查询: {e}")
+                return False
+            _populate(conn)
+    _state['enabled'] = True
+    return True
+
+
+def rebuild_search_index():
+    """根据 plugin 表重建全文索引(批量导入数据后调用)"""
+    if not _state['enabled']:
+        return
+    with db.engine.begin() as conn:
+        # 从FTS5表中逐行删除需要重新分词，删除重建表快得多
+        conn.execute(text("DROP TABLE plugin_fts"))
+        conn.execute(text("DROP TABLE plugin_fts_docs"))
+        _create_tables(conn)
+        _populate(conn)
+
+
+def _create_tables(conn):
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE plugin_fts USING fts5("
+        "plugin_id UNINDEXED, name, short_description, description, tokenize='trigram')"))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS plugin_fts_docs ("
+        "plugin_id VARCHAR(36) PRIMARY KEY, docid INTEGER NOT NULL)"))
+
+
+def _populate(conn):
+    conn.execute(text(
+        "INSERT INTO plugin_fts (plugin_id, name, short_description, description) "
+        "SELECT id, name, short_description, description FROM plugin"))
+    conn.execute(text("INSERT INTO plugin_fts_docs (plugin_id, docid) SELECT plugin_id, rowid FROM plugin_fts"))
+
+
+def search_plugin_ids(q, limit, offset=0, status='approved'):
+    """按相关度返回匹配的插件ID列表"""
+    terms = [t for t in q.split() if t]
+    if not terms:
+        return []
+    if not _state['enabled']:
+        return _like_search(terms, limit, offset, status)
+
+    long_terms = [t for t in terms if len(t) >= MIN_TERM_LENGTH]
+    short_terms = [t for t in terms if len(t) < MIN_TERM_LENGTH]
+    params = {'status': status, 'limit': limit, 'offset': offset}
+    conditions = ['p.status = :status']
+    if long_terms:
+        # 每个词作为短语查询，避免用户输入被解析为FTS5查询语法
+        params['match'] = ' AND '.join('"{}"'.format(t.replace('"', '""')) for t in long_terms)
+        conditions.append('plugin_fts MATCH :match')
+    for i, term in enumerate(short_terms):
+        params[f'term{i}'] = f'%{_escape_like(term)}%'
+        conditions.append(f"(plugin_fts.name LIKE :term{i} ESCAPE '\\' "
+                          f"OR plugin_fts.short_description LIKE :term{i} ESCAPE '\\' "
+                          f"OR plugin_fts.description LIKE :term{i} ESCAPE '\\')")
+    order = RANK if long_terms else 'p.downloads DESC'
+    sql = (f"SELECT p.id FROM plugin_fts JOIN plugin p ON p.id = plugin_fts.plugin_id "
+           f"WHERE {' AND '.join(conditions)} ORDER BY {order}, p.id LIMIT :limit OFFSET :offset")
+    return [row[0] for row in db.session.execute(text(sql), params)]
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _like_search(terms, limit, offset, status):
+    query = db.session.query(Plugin.id).filter(Plugin.status == status)
+    for term in terms:
+        pattern = f'%{_escape_like(term)}%'
+        query = query.filter(or_(Plugin.name.like(pattern, escape='\\'),
+                                 Plugin.short_description.like(pattern, escape='\\'),
+                                 Plugin.description.like(pattern, escape='\\')))
+    query = query.order_by(Plugin.downloads.desc(), Plugin.id).limit(limit).offset(offset)
+    return [row[0] for row in query]
+
+
+# 插件创建、修改和删除时在同一事务中同步全文索引
+
+TEXT_FIELDS = ('name', 'short_description', 'description')
+
+
+@event.listens_for(Plugin, 'after_insert')
+def _index_new_plugin(mapper, connection, target):
+    if _state['enabled']:
+        _index(connection, target)
+
+
+@event.listens_for(Plugin, 'after_update')
+def _index_updated_plugin(mapper, connection, target):
+    # 只有文本字段变化时才需要更新索引
+    state = db.inspect(target)
+    if _state['enabled'] and any(state.attrs[f].history.has_changes() for f in TEXT_FIELDS):
+        _index(connection, target)
+
+
+@event.listens_for(Plugin, 'after_delete')
+def _unindex_plugin(mapper, connection, target):
+    if not _state['enabled']:
+        return
+    docid = _docid(connection, target.id)
+    if docid is not None:
+        connection.execute(text("DELETE FROM plugin_fts WHERE rowid = :docid"), {'docid': docid})
+        connection.execute(text("DELETE FROM plugin_fts_docs WHERE plugin_id = :id"), {'id': target.id})
+
+
+def _docid(connection, plugin_id):
+    return connection.execute(text("SELECT docid FROM plugin_fts_docs WHERE plugin_id = :id"),
+                              {'id': plugin_id}).scalar()
+
+
+def _index(connection, target):
+    params = {'id': target.id, 'name': target.name, 'short_description': target.short_description,
+              'description': target.description, 'docid': _docid(connection, target.id)}
+    result = connection.execute(text(
+        "INSERT OR REPLACE INTO plugin_fts (rowid, plugin_id, name, short_description, description) "
+        "VALUES (:docid, :id, :name, :short_description, :description)"), params)
+    if params['docid'] is None:
+        connection.execute(text("INSERT INTO plugin_fts_docs (plugin_id, docid) VALUES (:id, :docid)"),
+                           {'id': target.id, 'docid': result.lastrowid})
@@ -0,0 +1,63 @@
+from flask import current_app, request, stream_with_context, json
+
+STREAM_MIMETYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+# 每次从数据库游标读取的行数
+STREAM_BATCH_SIZE = 500
+
+# 累积到该大小再输出一块，避免每条记录一次写入
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def stream_format():
+    """Accept 首选 application/x-ndjson 时返回 ndjson，否则返回 json"""
+    best = request.accept_mimetypes.best_match(list(STREAM_MIMETYPES.values()))
+    return 'ndjson' if best == STREAM_MIMETYPES['ndjson'] else 'json'
+
+
+def wants_stream():
+    """请求了流式响应: stream=true，或 Accept 首选 application/x-ndjson"""
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes') or stream_format() == 'ndjson'
+
+
+def stream_list(items):
+    """流式输出列表: 按 Accept 为NDJSON或分块的JSON数组
+
+    items 为可迭代对象(如 yield_per 查询生成的字典)，逐条序列化后按块输出，
+    内存占用与列表长度无关。
+    """
+    fmt = stream_format()
+    body = _ndjson(items) if fmt == 'ndjson' else _json_array(items)
+    response = current_app.response_class(stream_with_context(body), mimetype=STREAM_MIMETYPES[fmt])
+    response.vary.add('Accept')
+    return response
+
+
+def _dumps(item):
+    # 与 jsonify 相同的键排序和转义设置
+    return json.dumps(item, separators=(',', ':'))
+
+
+def _ndjson(items):
+    return _chunks(_dumps(item) + '\n' for item in items)
+
+
+def _json_array(items):
+    def parts():
+        yield '['
+        for i, item in enumerate(items):
+            yield _dumps(item) if i == 0 else ',' + _dumps(item)
+        yield ']\n'
+    return _chunks(parts())
+
+
+def _chunks(parts):
+    buffer, size = [], 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
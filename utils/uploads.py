@@ -0,0 +1,138 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from utils.blob_store import blob_path
+
+# 复制上传文件时每次读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# zip文件的起始标识：本地文件头，或空压缩包的中央目录结束记录
+ZIP_SIGNATURES = (b'PK\x03\x04', b'PK\x05\x06')
+
+
+class UploadError(Exception):
+    """上传的插件包无效"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class HashingUploadFile:
+    """边接收边计算SHA-256和大小的上传临时文件
+
+    multipart解析器按块写入请求体时即完成哈希计算和大小检查，超过
+    MAX_PACKAGE_SIZE 时立即中止上传。文件位于 UPLOAD_FOLDER/temp 下，
+    claim() 将其原子地移动到目标位置；未被认领的临时文件在关闭时删除。
+    """
+
+    def __init__(self, directory, max_size=None):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        self._file = os.fdopen(fd, 'w+b')
+        self._sha256 = hashlib.sha256()
+        self.max_size = max_size
+        self.size = 0
+        self.head = b''
+        self.claimed = False
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size and self.size > self.max_size:
+            raise RequestEntityTooLarge(f"文件超过大小限制 {self.max_size} 字节")
+        if len(self.head) < 4:
+            self.head += bytes(data[:4 - len(self.head)])
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def claim(self, dest):
+        """将临时文件fsync后原子地移动到 dest"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path, dest)
+        self.claimed = True
+
+    def close(self):
+        self._file.close()
+        if not self.claimed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """上传文件直接流式写入 HashingUploadFile 的请求类"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        upload = HashingUploadFile(os.path.join(current_app.config['UPLOAD_FOLDER'], 'temp'),
+                                   current_app.config.get('MAX_PACKAGE_SIZE'))
+        self.__dict__.setdefault('_upload_files', []).append(upload)
+        return upload
+
+    def close(self):
+        # 解析中途失败(如超过大小限制)的临时文件不在 request.files 中，也需要删除
+        super().close()
+        for upload in self.__dict__.get('_upload_files', ()):
+            upload.close()
+
+
+def validate_package(upload):
+    """检查zip文件头和中央目录，只读取文件开头和末尾的目录信息，不解压内容"""
+    if upload.head not in ZIP_SIGNATURES:
+        raise UploadError("Invalid zip package")
+    upload.flush()
+    try:
+        with zipfile.ZipFile(upload.path) as zf:
+            names = zf.namelist()
+    except (zipfile.BadZipFile, OSError):
+        raise UploadError("Invalid zip package")
+    for name in names:
+        if is_unsafe_path(name):
+            raise UploadError(f"Invalid path in zip package: {name}")
+
+
+def is_unsafe_path(name):
+    """条目为绝对路径或包含上级目录时返回True，解压这样的条目会写到插件目录之外"""
+    return name.startswith(('/', '\\')) or '..' in name.replace('\\', '/').split('/')
+
+
+def save_package_upload(storage, filename=None):
+    """校验上传的插件包并移动到插件包目录
+
+    未指定 filename 时按内容寻址保存为 packages/<sha256>.zip，相同内容的插件包
+    只保存一份。返回 (相对于 UPLOAD_FOLDER 的路径, SHA-256, 字节数)，插件包无效时
+    抛出 UploadError。
+    """
+    upload = storage.stream
+    if not isinstance(upload, HashingUploadFile):
+        upload = HashingUploadFile(os.path.join(current_app.config['UPLOAD_FOLDER'], 'temp'),
+                                   current_app.config.get('MAX_PACKAGE_SIZE'))
+        try:
+            shutil.copyfileobj(storage.stream, upload, CHUNK_SIZE)
+        except RequestEntityTooLarge:
+            upload.close()
+            raise UploadError("Package too large", 413)
+    try:
+        validate_package(upload)
+        package_path = os.path.join('packages', filename) if filename else blob_path(upload.sha256)
+        # 相同内容的插件包已存在时也重新写入同样的内容，避免与删除插件包的操作竞争
+        upload.claim(os.path.join(current_app.config['UPLOAD_FOLDER'], package_path))
+    finally:
+        if not upload.claimed:
+            upload.close()
+    return package_path, upload.sha256, upload.size
@@ -0,0 +1,198 @@
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from flask import current_app
+from sqlalchemy import event, or_, text
+
+from models import db, Plugin, PluginVersion, PackageDelta
+from utils.blob_store import is_blob_path, release_package
+from utils.jobs import job_queue
+from utils.package_delivery import file_digest, package_checksum
+from utils.package_index import package_index
+from utils.uploads import CHUNK_SIZE
+
+DELTAS_DIR = 'deltas'
+
+# 差异包中记录起止版本和被删除条目的文件，位于根目录
+DELTA_MANIFEST = '.delta.json'
+
+
+def delta_path(from_sha256, to_sha256):
+    """差异包相对于 UPLOAD_FOLDER 的路径，按起止插件包的内容寻址"""
+    return os.path.join(DELTAS_DIR, f'{from_sha256}-{to_sha256}.zip')
+
+
+def record_current_version(plugin):
+    """将插件当前的插件包记入版本历史，已记录时直接返回，插件包不存在时返回None，调用方负责提交
+
+    上传新版本前调用: 旧插件和首次上传的插件还没有历史记录。
+    """
+    row = PluginVersion.query.filter_by(plugin_id=plugin.id, version=plugin.version).first()
+    if row is not None:
+        return row
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    sha256, size = plugin.package_sha256, plugin.package_size
+    full_path = os.path.join(upload_folder, plugin.package_path) if plugin.package_path else None
+    # 直接使用记录中的插件包，旧插件没有包路径(或包路径无效)时才按名称匹配预置包
+    if full_path is None or not (sha256 or os.path.isfile(full_path)):
+        full_path = package_index.resolve(plugin)
+        if full_path is None:
+            return None
+        sha256 = None
+    # 按名称匹配到的预置包和旧插件没有上传时计算的校验和
+    if not sha256:
+        sha256, size = package_checksum(full_path)
+    row = PluginVersion(plugin_id=plugin.id, version=plugin.version,
+                        package_path=os.path.relpath(full_path, upload_folder),
+                        package_sha256=sha256, package_size=size)
+    db.session.add(row)
+    return row
+
+
+def publish_version(plugin, version, package_path, package_sha256, package_size):
+    """发布插件的新版本: 当前插件包记入历史后替换为新的插件包，调用方负责提交
+
+    超出 PLUGIN_VERSION_HISTORY 的旧版本从历史中删除，返回这些版本的插件包路径，
+    提交后传给 release_versions()。
+    """
+    record_current_version(plugin)
+    plugin.version = version
+    plugin.package_path = package_path
+    plugin.package_sha256 = package_sha256
+    plugin.package_size = package_size
+    db.session.add(PluginVersion(plugin_id=plugin.id, version=version, package_path=package_path,
+                                 package_sha256=package_sha256, package_size=package_size))
+    db.session.flush()
+
+    keep = current_app.config['PLUGIN_VERSION_HISTORY']
+    history = PluginVersion.query.filter_by(plugin_id=plugin.id).order_by(PluginVersion.id.desc()).all()
+    stale = history[keep + 1:]
+    for row in stale:
+        db.session.delete(row)
+    return [row.package_path for row in stale]
+
+
+def release_versions(package_paths):
+    """删除不再被引用的旧版本插件包和用不到的差异包(提交后调用)，返回被删除的插件包文件名"""
+    removed = []
+    for package_path in set(package_paths):
+        # 预置包可能按名称被其他插件使用，只删除内容寻址保存的插件包
+        if is_blob_path(package_path):
+            filename = release_package(package_path)
+            if filename:
+                removed.append(filename)
+    prune_deltas()
+    return removed
+
+
+def version_history(plugin):
+    """插件的版本列表，从新到旧，尚未记入历史的当前版本也包含在内"""
+    rows = PluginVersion.query.filter_by(plugin_id=plugin.id).order_by(PluginVersion.id.desc()).all()
+    versions = [row.to_dict() for row in rows]
+    if not any(row.version == plugin.version for row in rows):
+        versions.insert(0, {
+            'version': plugin.version,
+            'sha256': plugin.package_sha256,
+            'size': plugin.package_size,
+            'created_at': plugin.updated_at.isoformat()
+        })
+    return versions
+
+
+def enqueue_deltas(plugin_id):
+    """为历史版本到当前版本生成差异包(发布新版本并提交后调用)"""
+    plugin = Plugin.query.get(plugin_id)
+    if plugin is None or not plugin.package_sha256:
+        return
+    sources = {row.package_sha256 for row in PluginVersion.query.filter_by(plugin_id=plugin_id)}
+    for from_sha256 in sorted(sources - {plugin.package_sha256}):
+        job_queue.enqueue('build_delta', from_sha256=from_sha256, to_sha256=plugin.package_sha256)
+
+
+def diff_packages(old_path, new_path):
+    """比较两个插件包的条目，返回 (新增或修改的条目名列表, 删除的条目名列表)
+
+    按中央目录中记录的CRC-32和大小比较，不解压内容。
+    """
+    with zipfile.ZipFile(old_path) as old, zipfile.ZipFile(new_path) as new:
+        before = {info.filename: (info.CRC, info.file_size) for info in old.infolist() if not info.is_dir()}
+        after = {info.filename: (info.CRC, info.file_size) for info in new.infolist() if not info.is_dir()}
+    changed = [name for name, key in after.items() if before.get(name) != key]
+    removed = [name for name in before if name not in after]
+    return changed, removed
+
+
+def write_delta(new_path, changed, removed, dest, **meta):
+    """将新插件包中 changed 的条目按原压缩方式写入差异包 dest，删除的条目记录在 .delta.json 中"""
+    with zipfile.ZipFile(new_path) as src, zipfile.ZipFile(dest, 'w') as out:
+        for name in changed:
+            info = src.getinfo(name)
+            target = zipfile.ZipInfo(info.filename, info.date_time)
+            target.compress_type = info.compress_type
+            target.external_attr = info.external_attr
+            target.file_size = info.file_size
+            with src.open(info) as reader, out.open(target, 'w') as writer:
+                shutil.copyfileobj(reader, writer, CHUNK_SIZE)
+        out.writestr(DELTA_MANIFEST, json.dumps(dict(meta, changed=changed, removed=removed), ensure_ascii=False))
+
+
+@job_queue.handler('build_delta')
+def build_delta(from_sha256, to_sha256):
+    """生成两个插件包之间的差异包，已存在或插件包已从历史中删除时跳过"""
+    if PackageDelta.query.get((from_sha256, to_sha256)) is not None:
+        return
+    old = PluginVersion.query.filter_by(package_sha256=from_sha256).first()
+    new = PluginVersion.query.filter_by(package_sha256=to_sha256).first()
+    if old is None or new is None:
+        return
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    new_path = os.path.join(upload_folder, new.package_path)
+    changed, removed = diff_packages(os.path.join(upload_folder, old.package_path), new_path)
+
+    relative_path = delta_path(from_sha256, to_sha256)
+    full_path = os.path.join(upload_folder, relative_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    # 先写入临时文件再原子地替换，下载请求不会读到写了一半的差异包
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), suffix='.tmp')
+    os.close(fd)
+    try:
+        write_delta(new_path, changed, removed, temp_path, from_sha256=from_sha256, to_sha256=to_sha256)
+        sha256, size = file_digest(temp_path)
+        os.replace(temp_path, full_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    db.session.add(PackageDelta(from_sha256=from_sha256, to_sha256=to_sha256, path=relative_path,
+                                sha256=sha256, size=size, changed=len(changed), removed=len(removed)))
+    db.session.commit()
+    current_app.logger.info(f"已生成差异包 {relative_path}: {len(changed)} 个条目修改，{len(removed)} 个条目删除，"
+                            f"{size} 字节")
+
+
+def prune_deltas():
+    """删除目标不再是任何插件当前版本、或起始版本已不在历史中的差异包"""
+    current = db.session.query(Plugin.package_sha256).filter(Plugin.package_sha256.isnot(None))
+    stale = PackageDelta.query.filter(or_(
+        PackageDelta.to_sha256.notin_(current),
+        PackageDelta.from_sha256.notin_(db.session.query(PluginVersion.package_sha256)))).all()
+    if not stale:
+        return 0
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for delta in stale:
+        full_path = os.path.join(upload_folder, delta.path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+        db.session.delete(delta)
+    db.session.commit()
+    return len(stale)
+
+
+# 删除插件时同时删除版本历史，插件包由调用方在提交后通过 release_versions() 释放
+
+@event.listens_for(Plugin, 'before_delete')
+def _delete_versions(mapper, connection, target):
+    connection.execute(text("DELETE FROM plugin_version WHERE plugin_id = :plugin_id"), {'plugin_id': target.id})